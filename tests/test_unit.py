@@ -1,10 +1,36 @@
+import asyncio
+import datetime
+import logging
 import os
+import subprocess
 import sys
+import threading
+import time
+from types import SimpleNamespace
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../ur_operator')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../tools')))
 
+import kopf
+import kubernetes.client as k8s_client
+from kubernetes.client.rest import ApiException
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
 import pytest 
 
 import ur_operator.handlers as handlers
+import ur_operator.inventory as inventory
+import ur_operator.ratelimit as ratelimit
+import ur_operator.uptimerobot as uptimerobot
+from fake_uptimerobot import FakeUptimeRobot
+import generate_crd_manifests
+
+# modules as imported by the handlers, registering the metrics twice under another module name fails
+leader = handlers.leader
+metrics = handlers.metrics
+sharding = handlers.sharding
+tracing = handlers.tracing
+workqueue = handlers.workqueue
 
 def test_monitor_type_changed_changed_type():
     assert handlers.type_changed([['change', ['spec', 'type']]])
@@ -41,4 +67,1252 @@ def test_get_identifier_missing():
     status = {}
 
     with pytest.raises(KeyError):
-        handlers.get_identifier(status)
\ No newline at end of file
+        handlers.get_identifier(status)
+
+
+def test_async_get_all_monitors_paginates():
+    monitors = [{'id': i} for i in range(120)]
+    requested_offsets = []
+
+    async def fake_request(route, **params):
+        offset = int(params.get('offset', 0))
+        requested_offsets.append(offset)
+        return {
+            'stat': 'ok',
+            'pagination': {'offset': offset, 'limit': 50, 'total': len(monitors)},
+            'monitors': monitors[offset:offset + 50]
+        }
+
+    api = uptimerobot.AsyncUptimeRobot(api_key='foo')
+    api._request = fake_request
+
+    resp = asyncio.run(api.get_all_monitors())
+
+    assert requested_offsets == [0, 50, 100]
+    assert resp['monitors'] == monitors
+
+
+def test_endpoint_stats_record():
+    stats = uptimerobot.EndpointStats()
+    stats.record(0.2, failed=False)
+    stats.record(0.4, failed=True)
+
+    assert stats.count == 2
+    assert stats.errors == 1
+    assert stats.max_seconds == 0.4
+    assert abs(stats.mean_seconds - 0.3) < 1e-9
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = ratelimit.TokenBucket(60, clock=clock)
+
+    for _ in range(60):
+        assert bucket.try_acquire() == 0.
+    assert bucket.try_acquire() == pytest.approx(1.)
+    assert bucket.fill_ratio == pytest.approx(0.)
+
+    clock.now += 30
+    assert bucket.fill_ratio == pytest.approx(0.5)
+
+
+def test_token_bucket_honours_rate_limit_headers():
+    clock = FakeClock()
+    bucket = ratelimit.TokenBucket(10, clock=clock)
+
+    bucket.update_from_headers({'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '5'})
+    assert bucket.capacity == 120
+    assert bucket.tokens == 5
+
+    bucket.update_from_headers({'Retry-After': '7'})
+    assert bucket.try_acquire() == pytest.approx(7.)
+
+
+def test_token_bucket_splits_limit_between_replicas():
+    bucket = ratelimit.TokenBucket(120, clock=FakeClock())
+
+    bucket.set_shares(3)
+    assert bucket.capacity == 40
+    assert bucket.tokens == 40
+
+    bucket.update_from_headers({'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '30'})
+    assert bucket.capacity == 40
+    assert bucket.tokens == 10
+
+
+def test_requests_per_minute_for_account():
+    assert ratelimit.requests_per_minute_for_account({'monitor_limit': 50, 'monitor_interval': 300}) == 10
+    assert ratelimit.requests_per_minute_for_account({'monitor_limit': 1000, 'monitor_interval': 60}) == 2000
+    assert ratelimit.requests_per_minute_for_account({'monitor_limit': 5000, 'monitor_interval': 60}) == 5000
+
+
+def test_is_temporary_error():
+    assert uptimerobot.is_temporary_error({'type': 'http_error', 'status': 503})
+    assert uptimerobot.is_temporary_error({'type': 'http_error', 'status': 429})
+    assert uptimerobot.is_temporary_error({'type': 'connection_error', 'message': 'reset by peer'})
+    assert not uptimerobot.is_temporary_error({'type': 'http_error', 'status': 401})
+    assert not uptimerobot.is_temporary_error({'type': 'invalid_parameter', 'parameter_name': 'url'})
+
+
+def test_backoff_grows_and_resets():
+    backoff = ratelimit.Backoff(base=1., cap=60., rand=lambda: 1.)
+
+    assert [backoff.failure() for _ in range(7)] == [2., 4., 8., 16., 32., 60., 60.]
+    backoff.success()
+    assert backoff.failure() == 2.
+
+
+def test_raise_for_error():
+    with pytest.raises(kopf.TemporaryError):
+        handlers.raise_for_error('failed', {'type': 'http_error', 'status': 502})
+
+    with pytest.raises(kopf.PermanentError):
+        handlers.raise_for_error('failed', {'type': 'invalid_parameter'})
+
+
+def test_inventory_index_by_id():
+    index = inventory.ResourceIndex()
+    index.replace_all([{'id': 1, 'friendly_name': 'foo'}, {'id': 2, 'friendly_name': 'bar'}])
+    index.upsert({'id': '1', 'friendly_name': 'baz', 'url': 'https://foo.com'})
+
+    assert 1 in index
+    assert index.get(1) == {'id': '1', 'friendly_name': 'baz', 'url': 'https://foo.com'}
+
+    index.remove(2)
+    assert 2 not in index
+
+
+def test_inventory_refresh_reads_all_pages():
+    monitors = [{'id': i, 'friendly_name': f'monitor-{i}'} for i in range(120)]
+    alert_contacts = [{'id': i, 'friendly_name': f'ac-{i}'} for i in range(3)]
+    requests = []
+
+    class FakeApi:
+        async def get_monitors(self, offset, limit, **_):
+            requests.append('getMonitors')
+            return {'stat': 'ok', 'pagination': {'total': len(monitors)}, 'monitors': monitors[offset:offset + limit]}
+
+        async def get_alert_contacts(self, offset, limit, **_):
+            requests.append('getAlertContacts')
+            return {'stat': 'ok', 'total': str(len(alert_contacts)), 'alert_contacts': alert_contacts[offset:offset + limit]}
+
+        async def get_m_windows(self, **_):
+            return {'stat': 'ok', 'pagination': {'total': 0}, 'mwindows': []}
+
+        async def get_psps(self, **_):
+            return {'stat': 'ok', 'pagination': {'total': 0}, 'psps': []}
+
+    inv = inventory.Inventory()
+    asyncio.run(inv.refresh(FakeApi()))
+
+    assert inv.loaded
+    assert len(inv.monitors) == 120
+    assert len(inv.alert_contacts) == 3
+    assert requests.count('getMonitors') == 3
+    assert requests.count('getAlertContacts') == 1
+
+
+def test_inventory_refresh_objects_reads_only_given_ids():
+    requests = []
+
+    class FakeApi:
+        async def get_alert_contacts(self, offset, limit, **params):
+            requests.append(params)
+            return {'stat': 'ok', 'total': '1', 'alert_contacts': [{'id': 1, 'friendly_name': 'ac-1'}]}
+
+        async def get_monitors(self, **_):
+            raise AssertionError('only alert contacts are refreshed')
+
+        get_m_windows = get_psps = get_monitors
+
+    inv = inventory.Inventory()
+    inv.alert_contacts.replace_all([{'id': 1, 'friendly_name': 'old'}, {'id': 2, 'friendly_name': 'deleted'}])
+    asyncio.run(inv.refresh_objects(FakeApi(), inv.alert_contacts, [1, 2]))
+
+    assert requests == [{'alert_contacts': '1-2'}]
+    assert inv.alert_contacts.get(1)['friendly_name'] == 'ac-1'
+    assert 2 not in inv.alert_contacts
+
+
+def test_inventory_matches():
+    item = {'id': 1, 'url': 'https://foo.com', 'type': 1, 'interval': 600, 'ignore_ssl_errors': 1}
+
+    assert inventory.matches(item, {'url': 'https://foo.com', 'type': 1, 'interval': '600', 'ignore_ssl_errors': True, 'http_password': 'secret'})
+    assert not inventory.matches(item, {'url': 'https://bar.com'})
+
+
+def test_inventory_matches_fields_reported_under_another_name():
+    psp = handlers.PspV1Beta1
+    item = {'id': 1, 'friendly_name': 'status', 'custom_url': 'status.foo.com', 'sort': 1, 'status': 1}
+
+    assert inventory.matches(item, {'custom_domain': 'status.foo.com'}, psp.reported_fields, psp.reported_names)
+    assert not inventory.matches(item, {'custom_domain': 'status.bar.com'}, psp.reported_fields, psp.reported_names)
+
+
+class FakeK8s:
+    def __init__(self, *objs):
+        self.objs = {obj['metadata']['name']: obj for obj in objs}
+        self.patches = []
+
+    async def get_k8s_crd_obj(self, crd, namespace, name):
+        if name not in self.objs:
+            raise ApiException(status=404)
+        return self.objs[name]
+
+    async def update_k8s_crd_obj_with_body(self, crd, namespace, name, body):
+        if name not in self.objs:
+            raise ApiException(status=404)
+        self.patches.append((crd, namespace, name, body))
+
+
+class FakeInventoryApi:
+    """UptimeRobot account answering reads by ID"""
+
+    def __init__(self, monitors=()):
+        self.monitors = list(monitors)
+        self.requests = []
+
+    async def get_monitors(self, offset=0, limit=50, **params):
+        self.requests.append(params)
+        wanted = params.get('monitors', '').split('-')
+        monitors = [monitor for monitor in self.monitors if str(monitor['id']) in wanted]
+        return {'stat': 'ok', 'pagination': {'total': len(monitors)}, 'monitors': monitors}
+
+    async def get_alert_contacts(self, **_):
+        return {'stat': 'ok', 'total': '0', 'alert_contacts': []}
+
+    async def get_m_windows(self, **_):
+        return {'stat': 'ok', 'pagination': {'total': 0}, 'mwindows': []}
+
+    async def get_psps(self, **_):
+        return {'stat': 'ok', 'pagination': {'total': 0}, 'psps': []}
+
+
+def test_reconcile_object_recreates_missing_monitor(monkeypatch):
+    MonitorV1Beta1 = handlers.MonitorV1Beta1
+
+    obj = {
+        'metadata': {'namespace': 'default', 'name': 'foo'},
+        'spec': {'type': 'HTTPS', 'url': 'https://foo.com'},
+        'status': {'create_handler': {handlers.MONITOR_ID_KEY: 1}}
+    }
+
+    fake_k8s = FakeK8s(obj)
+    fake_api = FakeInventoryApi()
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+    monkeypatch.setattr(handlers, 'uptime_robot', fake_api)
+    monkeypatch.setattr(handlers, 'inventory', inventory.Inventory())
+    created = []
+
+    async def create_handler(namespace, name, spec, **_):
+        created.append(name)
+        return {handlers.MONITOR_ID_KEY: 2}
+
+    async def update_handler(**_):
+        raise AssertionError('missing monitor must not be updated')
+
+    repaired = asyncio.run(handlers.reconcile_object(
+        logging.getLogger(), MonitorV1Beta1, handlers.inventory.monitors, lambda status: status['create_handler'][handlers.MONITOR_ID_KEY],
+        create_handler, update_handler, obj))
+
+    assert repaired
+    assert fake_api.requests == [{'monitors': '1'}]  # confirmed missing before recreating it
+    assert created == ['foo']
+    assert fake_k8s.patches == [(MonitorV1Beta1, 'default', 'foo', {'status': {'create_handler': {handlers.MONITOR_ID_KEY: 2}}})]
+
+
+def test_reconcile_object_skips_objects_changed_since_listing(monkeypatch):
+    def monitor(identifier, **metadata):
+        return {
+            'metadata': {'namespace': 'default', 'name': 'foo', **metadata},
+            'spec': {'type': 'HTTPS', 'url': 'https://foo.com'},
+            'status': {'on_create': {handlers.MONITOR_ID_KEY: identifier}}
+        }
+
+    monkeypatch.setattr(handlers, 'uptime_robot', FakeInventoryApi())
+    monkeypatch.setattr(handlers, 'inventory', inventory.Inventory())
+
+    async def fail(**_):
+        raise AssertionError('changed object must not be repaired')
+
+    # deleted, being deleted and recreated in UptimeRobot by the update handler
+    for current in [None, monitor(1, deletionTimestamp='2021-01-01T00:00:00Z'), monitor(2)]:
+        fake_k8s = FakeK8s(*[current] if current else [])
+        monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+
+        assert not asyncio.run(handlers.reconcile_object(
+            logging.getLogger(), handlers.MonitorV1Beta1, handlers.inventory.monitors, handlers.get_identifier,
+            fail, fail, monitor(1)))
+        assert not fake_k8s.patches
+
+
+def test_reconcile_object_deletes_monitor_recreated_for_deleted_object(monkeypatch):
+    obj = {
+        'metadata': {'namespace': 'default', 'name': 'foo'},
+        'spec': {'type': 'HTTPS', 'url': 'https://foo.com'},
+        'status': {'on_create': {handlers.MONITOR_ID_KEY: 1}}
+    }
+
+    class DeletingK8s(FakeK8s):
+        async def update_k8s_crd_obj_with_body(self, crd, namespace, name, body):
+            self.objs.clear()  # deleted while the monitor has been recreated
+            await super().update_k8s_crd_obj_with_body(crd, namespace, name, body)
+
+    deleted = []
+
+    async def create_handler(**_):
+        return {handlers.MONITOR_ID_KEY: 2}
+
+    async def on_delete(namespace, name, status, logger):
+        deleted.append(status)
+
+    monkeypatch.setattr(handlers, 'k8s', DeletingK8s(obj))
+    monkeypatch.setattr(handlers, 'uptime_robot', FakeInventoryApi())
+    monkeypatch.setattr(handlers, 'inventory', inventory.Inventory())
+    monkeypatch.setattr(handlers, 'delete_handlers', lambda: {handlers.MonitorV1Beta1: on_delete})
+
+    assert not asyncio.run(handlers.reconcile_object(
+        logging.getLogger(), handlers.MonitorV1Beta1, handlers.inventory.monitors, handlers.get_identifier,
+        create_handler, handlers.on_update, obj))
+    assert deleted == [{'create_handler': {handlers.MONITOR_ID_KEY: 2}}]
+
+
+def test_reconcile_lists_only_watched_namespaces(monkeypatch):
+    class FakeListingK8s:
+        def __init__(self):
+            self.namespaced = []
+
+        async def list_k8s_crd_objs(self, crd):
+            return [{'metadata': {'namespace': namespace}} for namespace in ['team-a', 'team-b', 'kube-system']]
+
+        async def list_namespaced_k8s_crd_objs(self, crd, namespace, label_selector=None):
+            self.namespaced.append(namespace)
+            return [{'metadata': {'namespace': namespace}}]
+
+    fake_k8s = FakeListingK8s()
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+
+    assert handlers.watched_namespaces(['kopf', 'run', '--standalone', '--all-namespaces', 'handlers.py']) == []
+    assert handlers.watched_namespaces(['pytest']) == []
+
+    monkeypatch.setattr(handlers, 'namespaces', handlers.watched_namespaces(
+        ['kopf', 'run', '--standalone', '-n', 'team-a', '--namespace=team-b', 'handlers.py']))
+    objs = asyncio.run(handlers.list_watched_crd_objs(handlers.MonitorV1Beta1))
+    assert fake_k8s.namespaced == ['team-a', 'team-b']
+    assert [obj['metadata']['namespace'] for obj in objs] == ['team-a', 'team-b']
+
+    monkeypatch.setattr(handlers, 'namespaces', ['team-*, !team-b'])
+    objs = asyncio.run(handlers.list_watched_crd_objs(handlers.MonitorV1Beta1))
+    assert [obj['metadata']['namespace'] for obj in objs] == ['team-a']
+
+
+def test_reconcile_object_skips_matching_monitor(monkeypatch):
+    MonitorV1Beta1 = handlers.MonitorV1Beta1
+
+    fake_k8s = FakeK8s()
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+
+
+    async def fail(**_):
+        raise AssertionError('matching monitor must not be written')
+
+    index = inventory.ResourceIndex()
+    index.upsert({'id': 1, 'friendly_name': 'foo', 'url': 'https://foo.com', 'type': 1, 'interval': 300})
+
+    obj = {
+        'metadata': {'namespace': 'default', 'name': 'foo'},
+        'spec': {'type': 'HTTPS', 'url': 'https://foo.com'},
+        'status': {'on_create': {handlers.MONITOR_ID_KEY: 1}}
+    }
+
+    assert not asyncio.run(handlers.reconcile_object(
+        logging.getLogger(), MonitorV1Beta1, index, handlers.get_identifier, fail, fail, obj))
+    assert not fake_k8s.patches
+
+
+def test_reconcile_object_keeps_monitor_missed_by_bulk_read(monkeypatch):
+    fake_k8s = FakeK8s()
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+    monkeypatch.setattr(handlers, 'uptime_robot', FakeInventoryApi(
+        [{'id': 1, 'friendly_name': 'foo', 'url': 'https://foo.com', 'type': 1, 'interval': 300}]))
+    monkeypatch.setattr(handlers, 'inventory', inventory.Inventory())
+
+    async def fail(**_):
+        raise AssertionError('existing monitor must not be written')
+
+    obj = {
+        'metadata': {'namespace': 'default', 'name': 'foo'},
+        'spec': {'type': 'HTTPS', 'url': 'https://foo.com'},
+        'status': {'on_create': {handlers.MONITOR_ID_KEY: 1}}
+    }
+
+    assert not asyncio.run(handlers.reconcile_object(
+        logging.getLogger(), handlers.MonitorV1Beta1, handlers.inventory.monitors, handlers.get_identifier, fail, fail, obj))
+    assert 1 in handlers.inventory.monitors
+    assert not fake_k8s.patches
+
+
+def test_alert_contact_drift_is_repaired_in_place(monkeypatch):
+    class FakeApi:
+        def __init__(self):
+            self.calls = []
+
+        async def edit_alert_contact(self, identifier, **params):
+            self.calls.append(('editAlertContact', params))
+            return {'stat': 'ok', 'alert_contact': {'id': identifier}}
+
+    fake_api = FakeApi()
+    monkeypatch.setattr(handlers, 'uptime_robot', fake_api)
+    monkeypatch.setattr(handlers, 'inventory', inventory.Inventory())
+    handlers.inventory.alert_contacts.upsert({'id': 1, 'friendly_name': 'renamed', 'type': 2, 'value': 'foo@bar.com'})
+
+    spec = {'type': 'EMAIL', 'value': 'foo@bar.com', 'friendlyName': 'foo'}
+    status = {handlers.on_ac_create.__name__: {handlers.AC_ID_KEY: 1}}
+    result = asyncio.run(handlers.on_ac_update(
+        name='foo', spec=spec, status=status, logger=logging.getLogger(), diff=[], force=True))
+
+    assert fake_api.calls == [('editAlertContact', {'friendly_name': 'foo'})]
+    assert result[handlers.AC_ID_KEY] == '1'
+
+
+def test_fingerprint_is_independent_of_key_order():
+    assert handlers.fingerprint({'url': 'https://foo.com', 'type': 1}) == handlers.fingerprint({'type': 1, 'url': 'https://foo.com'})
+    assert handlers.fingerprint({'url': 'https://foo.com', 'type': 1}) != handlers.fingerprint({'url': 'https://bar.com', 'type': 1})
+
+
+def test_fingerprint_is_keyed_with_api_key(monkeypatch):
+    payload = {'http_password': 'secret'}
+    monkeypatch.setenv('UPTIMEROBOT_API_KEY', 'key-1')
+    keyed = handlers.fingerprint(payload)
+
+    monkeypatch.setenv('UPTIMEROBOT_API_KEY', 'key-2')
+    assert handlers.fingerprint(payload) != keyed
+    assert keyed != handlers.hashlib.sha256(handlers.json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def test_update_skipped_for_unchanged_fingerprint(monkeypatch):
+    monkeypatch.setattr(handlers, 'uptime_robot', None)  # any API call would fail
+    monkeypatch.setattr(handlers.coalescing.coalescer, 'window', 0)
+
+    spec = {'type': 'WEB_HOOK', 'value': 'https://foo.com/hook'}
+    payload = handlers.AlertContactV1Beta1.spec_to_request_dict('foo', spec)
+    status = {handlers.on_ac_create.__name__: {handlers.AC_ID_KEY: 1, handlers.FINGERPRINT_KEY: handlers.fingerprint(payload)}}
+
+    result = asyncio.run(handlers.on_ac_update(name='foo', spec=spec, status=status, logger=logging.getLogger(), diff=[]))
+
+    assert result == {handlers.AC_ID_KEY: 1, handlers.FINGERPRINT_KEY: handlers.fingerprint(payload),
+                      handlers.FIELDS_KEY: handlers.field_hashes(payload)}
+
+
+def test_type_change_of_skipped_update_is_applied(monkeypatch):
+    class FakeApi:
+        def __init__(self):
+            self.calls = []
+
+        async def delete_alert_contact(self, identifier):
+            self.calls.append('deleteAlertContact')
+            return {'stat': 'ok'}
+
+        async def new_alert_contact(self, **params):
+            self.calls.append('newAlertContact')
+            return {'stat': 'ok', 'alertcontact': {'id': 2}}
+
+    fake_api = FakeApi()
+    monkeypatch.setattr(handlers, 'uptime_robot', fake_api)
+    monkeypatch.setattr(handlers.coalescing.coalescer, 'window', 0)
+
+    applied = handlers.AlertContactV1Beta1.spec_to_request_dict('foo', {'type': 'EMAIL', 'value': 'foo@bar.com'})
+    status = {handlers.on_ac_create.__name__: {
+        handlers.AC_ID_KEY: 1, handlers.FINGERPRINT_KEY: handlers.fingerprint(applied), handlers.FIELDS_KEY: handlers.field_hashes(applied)}}
+
+    # the run for the type change has been skipped, the diff of the newest state only changes the value
+    spec = {'type': 'WEB_HOOK', 'value': 'https://foo.com/hook'}
+    diff = [['change', ['spec', 'value'], 'foo@bar.com', 'https://foo.com/hook']]
+    result = asyncio.run(handlers.on_ac_update(name='foo', spec=spec, status=status, logger=logging.getLogger(), diff=diff))
+
+    assert fake_api.calls == ['deleteAlertContact', 'newAlertContact']
+    assert result[handlers.AC_ID_KEY] == 2
+
+
+def test_verify_on_resume_repairs_only_missing_objects(monkeypatch):
+    monkeypatch.setattr(handlers, 'uptime_robot', FakeInventoryApi())
+    monkeypatch.setattr(handlers, 'inventory', inventory.Inventory())
+    handlers.inventory.loaded = True
+    handlers.inventory.alert_contacts.upsert({'id': 1, 'friendly_name': 'foo', 'type': 2, 'value': 'foo@bar.com'})
+
+    recreated = []
+
+    async def create_ac(logger, **kwargs):
+        recreated.append(kwargs['friendly_name'])
+        return 3
+
+    monkeypatch.setattr(handlers, 'create_ac', create_ac)
+
+    def body(name, identifier):
+        return {
+            'metadata': {'namespace': 'default', 'name': name},
+            'spec': {'type': 'EMAIL', 'value': 'foo@bar.com', 'friendlyName': 'foo'},
+            'status': {handlers.on_ac_create.__name__: {handlers.AC_ID_KEY: identifier}}
+        }
+
+    fake_k8s = FakeK8s(body('existing', 1), body('missing', 2))
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+
+    asyncio.run(handlers.verify_on_resume(logging.getLogger(), handlers.AlertContactV1Beta1, body('existing', 1)))
+    asyncio.run(handlers.verify_on_resume(logging.getLogger(), handlers.AlertContactV1Beta1, body('missing', 2)))
+
+    assert recreated == ['foo']
+    assert [patch[2] for patch in fake_k8s.patches] == ['missing']
+
+
+def test_async_client_against_fake_uptimerobot():
+    async def scenario():
+        fake = FakeUptimeRobot(api_key='foo', monitor_limit=200, seed=1)
+        runner = await fake.start(port=0)
+        port = runner.addresses[0][1]
+
+        api = uptimerobot.AsyncUptimeRobot(
+            'foo', endpoint=f'http://127.0.0.1:{port}/v2/',
+            rate_limiter=ratelimit.TokenBucket(6000), backoff=ratelimit.Backoff())
+        try:
+            created = [await api.new_monitor(friendly_name=f'm{i}', url=f'https://{i}.com', type=1) for i in range(60)]
+            assert all(resp['stat'] == 'ok' for resp in created)
+
+            resp = await api.get_all_monitors()
+            assert len(resp['monitors']) == 60
+            assert resp['monitors'][0]['type'] == 1
+
+            resp = await api.delete_monitor(1)
+            assert resp['error']['type'] == 'not_found'
+
+            fake.failure_rate = 1.
+            resp = await api.get_account_details()
+            assert uptimerobot.is_temporary_error(resp['error'])
+            assert fake.requests['getMonitors'] == 2
+        finally:
+            await api.close()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+def test_timed_handler_keeps_name_and_records_duration():
+    @metrics.timed('TestKind', 'create')
+    async def on_test_create(**_):
+        return {'id': 1}
+
+    result = asyncio.run(on_test_create(meta={'creationTimestamp': '2021-01-01T00:00:00Z'}))
+
+    assert result == {'id': 1}
+    assert on_test_create.__name__ == 'on_test_create'
+    assert metrics.prom.REGISTRY.get_sample_value(
+        'uroperator_handler_duration_seconds_count', {'kind': 'TestKind', 'cause': 'create'}) == 1
+    assert metrics.prom.REGISTRY.get_sample_value(
+        'uroperator_convergence_seconds_count', {'kind': 'TestKind'}) == 1
+
+
+def test_traced_handler_continues_trace_of_parent_object():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer('test')
+
+    @tracing.traced('TestKind', 'create')
+    def on_test_create(**_):
+        return 'done'
+
+    with tracer.start_as_current_span('create Ingress') as parent:
+        annotations = tracing.inject({})
+
+    original_tracer = tracing.tracer
+    tracing.tracer = tracer
+    try:
+        assert on_test_create(namespace='default', name='foo', annotations=annotations) == 'done'
+    finally:
+        tracing.tracer = original_tracer
+
+    span = exporter.get_finished_spans()[-1]
+    assert on_test_create.__name__ == 'on_test_create'
+    assert span.name == 'create TestKind'
+    assert span.context.trace_id == parent.get_span_context().trace_id
+    assert span.attributes['k8s.name'] == 'foo'
+
+
+def test_shared_k8s_client_loads_config_once(monkeypatch):
+    k8s_module = sys.modules[handlers.K8s.__module__]
+    created = []
+
+    def create_api_client(pool_size):
+        created.append(pool_size)
+        return k8s_client.ApiClient(k8s_client.Configuration())
+
+    monkeypatch.setattr(k8s_module, 'create_api_client', create_api_client)
+    monkeypatch.setattr(handlers.K8s, '_shared', None)
+    monkeypatch.setenv('URO_K8S_POOL_SIZE', '8')
+
+    assert handlers.K8s.shared() is handlers.K8s.shared()
+    assert created == [8]
+
+
+def test_secret_cache_reports_dependents_of_changed_secret(monkeypatch):
+    cache = handlers.secret_cache.SecretCache()
+    monkeypatch.setattr(handlers.secret_cache, 'cache', cache)
+    monkeypatch.setattr(handlers, 'k8s', SimpleNamespace(get_secret=None))  # served from the cache
+    monitor = (handlers.MonitorV1Beta1, 'default', 'foo')
+    cache.track(monitor, 'auth')
+    assert cache.update('default', 'auth', {'username': 'Zm9v', 'password': 'YmFy'}) == [monitor]  # created after the monitor
+
+    request_dict = asyncio.run(handlers.spec_to_request_dict(
+        handlers.MonitorV1Beta1, 'default', 'foo', {'type': 'HTTP', 'url': 'https://foo.com', 'httpAuthSecret': 'auth'}))
+    assert (request_dict['http_username'], request_dict['http_password']) == ('foo', 'bar')
+
+    assert cache.update('default', 'auth', {'username': 'Zm9v', 'password': 'YmFy'}) == []
+    assert cache.update('default', 'auth', {'username': 'Zm9v', 'password': 'YmF6'}) == [monitor]
+    assert cache.update('default', 'other', {'password': 'YmF6'}) == []
+    assert handlers.is_referenced_secret(namespace='default', name='auth')
+
+    cache.remove('default', 'auth')
+    assert handlers.is_referenced_secret(namespace='default', name='auth')
+    assert cache.update('default', 'auth', {'username': 'Zm9v', 'password': 'YmF6'}) == [monitor]  # created again
+
+    asyncio.run(handlers.spec_to_request_dict(handlers.MonitorV1Beta1, 'default', 'foo', {'type': 'HTTP', 'url': 'https://foo.com'}))
+    assert ('default', 'auth') not in cache
+    assert not cache.data
+
+    with pytest.raises(LookupError):  # never read synchronously on the event loop
+        cache.get(monitor, 'not-loaded')
+
+
+def test_secret_is_loaded_without_blocking_the_event_loop(monkeypatch):
+    reads = []
+
+    class FakeAsyncK8s:
+        async def get_secret(self, namespace, name):
+            reads.append((namespace, name))
+            return SimpleNamespace(data={'password': 'YmFy'})
+
+    monkeypatch.setattr(handlers, 'k8s', FakeAsyncK8s())
+    monkeypatch.setattr(handlers.secret_cache, 'cache', handlers.secret_cache.SecretCache())
+    spec = {'monitors': '0', 'passwordSecret': 'psp-password'}
+
+    async def scenario():
+        return [await handlers.spec_to_request_dict(handlers.PspV1Beta1, 'default', 'foo', spec) for _ in range(2)]
+
+    assert [payload['password'] for payload in asyncio.run(scenario())] == ['bar', 'bar']
+    assert reads == [('default', 'psp-password')]
+
+
+def test_async_k8s_bounds_concurrent_requests():
+    class BlockingK8s:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.created = []
+
+        def create_k8s_crd_obj_with_body(self, crd, namespace, body):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.02)
+            with self.lock:
+                self.in_flight -= 1
+                self.created.append(body['metadata']['name'])
+
+    async def scenario():
+        blocking_k8s = BlockingK8s()
+        async_k8s = handlers.AsyncK8s(blocking_k8s, concurrency=2)
+        await asyncio.gather(*[
+            async_k8s.create_k8s_crd_obj_with_body(handlers.MonitorV1Beta1, 'default', {'metadata': {'name': f'foo-{index}'}})
+            for index in range(6)
+        ])
+        return blocking_k8s
+
+    blocking_k8s = asyncio.run(scenario())
+    assert sorted(blocking_k8s.created) == [f'foo-{index}' for index in range(6)]
+    assert blocking_k8s.max_in_flight == 2
+
+
+class FakeMonitorK8s:
+    def __init__(self, objs):
+        self.objs = objs
+        self.selectors = []
+        self.applied = {}
+        self.deleted = []
+
+    async def list_namespaced_k8s_crd_objs(self, crd, namespace, label_selector=None):
+        self.selectors.append(label_selector)
+
+        def selected(obj):
+            labels = obj['metadata'].get('labels') or {}
+            if label_selector.startswith('!'):
+                return label_selector[1:] not in labels
+            key, value = label_selector.split('=')
+            return labels.get(key) == value
+        return [obj for obj in self.objs if label_selector is None or selected(obj)]
+
+    async def apply_k8s_crd_obj_with_body(self, crd, namespace, name, body):
+        self.applied[name] = body
+
+    async def delete_k8s_crd_obj(self, crd, namespace, name):
+        self.deleted.append(name)
+
+
+def test_ingress_update_only_applies_changed_monitors(monkeypatch):
+    def name(host):
+        return f'foo-{handlers.host_hash(host)}'
+
+    def child(host, url=None):
+        return {
+            'metadata': {
+                'name': name(host),
+                'labels': {handlers.INGRESS_UID_LABEL: 'ingress-uid', handlers.HOST_HASH_LABEL: handlers.host_hash(host)}
+            },
+            'spec': {'type': 'HTTPS', 'url': url or f'https://{host}'}
+        }
+
+    fake_k8s = FakeMonitorK8s([child('a.com'), child('b.com', 'https://old.com'), child('gone.com')])
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+    monkeypatch.setattr(handlers.coalescing.coalescer, 'window', 0)
+
+    # c.com has been inserted before a.com, which must not touch a.com
+    asyncio.run(handlers.on_ingress_update(
+        name='foo', namespace='default', uid='ingress-uid', annotations={f'{handlers.GROUP}/monitor.type': 'HTTPS'},
+        spec={'rules': [{'host': 'c.com'}, {'host': 'a.com'}, {'host': 'b.com'}, {'host': 'a.com'}]},
+        logger=logging.getLogger()))
+
+    assert fake_k8s.selectors == [f'{handlers.INGRESS_UID_LABEL}=ingress-uid']
+    assert sorted(fake_k8s.applied) == sorted([name('b.com'), name('c.com')])
+    assert fake_k8s.deleted == [name('gone.com')]
+
+
+def test_ingress_resume_migrates_monitors_of_earlier_versions_in_place(monkeypatch):
+    def child(index, url):
+        return {
+            'metadata': {'name': f'foo-{index}', 'ownerReferences': [{'uid': 'ingress-uid'}]},
+            'spec': {'type': 'HTTPS', 'url': url}
+        }
+
+    fake_k8s = FakeMonitorK8s([child(0, 'https://a.com'), child(1, 'https://b.com'), child(2, 'https://b.com')])
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+
+    asyncio.run(handlers.on_ingress_resume(
+        name='foo', namespace='default', uid='ingress-uid', annotations={f'{handlers.GROUP}/monitor.type': 'HTTPS'},
+        spec={'rules': [{'host': 'a.com'}, {'host': 'b.com'}]}, logger=logging.getLogger()))
+
+    assert fake_k8s.selectors == [f'{handlers.INGRESS_UID_LABEL}=ingress-uid', f'!{handlers.INGRESS_UID_LABEL}']
+    assert sorted(fake_k8s.applied) == ['foo-0', 'foo-1']
+    assert fake_k8s.applied['foo-0']['metadata']['labels'] == {
+        handlers.INGRESS_UID_LABEL: 'ingress-uid', handlers.HOST_HASH_LABEL: handlers.host_hash('a.com')}
+    assert fake_k8s.deleted == ['foo-2']
+
+
+def test_rebalance_applies_monitors_of_ingresses_taken_over(monkeypatch):
+    class FakeIngressK8s(FakeMonitorK8s):
+        async def list_ingresses(self):
+            return [{
+                'metadata': {'namespace': 'default', 'name': 'foo', 'uid': 'ingress-uid',
+                             'annotations': {f'{handlers.GROUP}/monitor.type': 'HTTPS'}},
+                'spec': {'rules': [{'host': 'a.com'}]}
+            }]
+
+    async def reconcile(logger):
+        pass
+
+    fake_k8s = FakeIngressK8s([])
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+    monkeypatch.setattr(handlers, 'reconcile', reconcile)
+
+    asyncio.run(handlers.rebalance(logging.getLogger()))
+
+    body = fake_k8s.applied[f'foo-{handlers.host_hash("a.com")}']
+    assert body['metadata']['ownerReferences'][0]['kind'] == 'Ingress'
+    assert body['metadata']['ownerReferences'][0]['uid'] == 'ingress-uid'
+
+
+def test_create_crds_only_writes_changed_crds(monkeypatch):
+    manifests = {crd.plural: handlers.crd_manifest(crd.crd) for crd in [
+        handlers.MonitorV1Beta1, handlers.PspV1Beta1, handlers.MaintenanceWindowV1Beta1, handlers.AlertContactV1Beta1]}
+
+    def installed(plural, crd_hash):
+        return SimpleNamespace(metadata=SimpleNamespace(
+            name=manifests[plural]['metadata']['name'], annotations={handlers.CRD_HASH_ANNOTATION: crd_hash}))
+
+    class FakeApiextensionsApi:
+        def __init__(self):
+            self.created = []
+            self.patched = []
+
+        def list_custom_resource_definition(self, label_selector):
+            return SimpleNamespace(items=[
+                installed(handlers.MonitorV1Beta1.plural, manifests[handlers.MonitorV1Beta1.plural]['metadata']['annotations'][handlers.CRD_HASH_ANNOTATION]),
+                installed(handlers.PspV1Beta1.plural, 'outdated'),
+                installed(handlers.MaintenanceWindowV1Beta1.plural, None)
+            ])
+
+        def create_custom_resource_definition(self, body):
+            if body['metadata']['name'] != manifests[handlers.AlertContactV1Beta1.plural]['metadata']['name']:
+                raise ApiException(status=409)
+            self.created.append(body['metadata']['name'])
+
+        def patch_custom_resource_definition(self, name, body):
+            self.patched.append(name)
+
+    api = FakeApiextensionsApi()
+    monkeypatch.setattr(handlers.K8s, 'shared', lambda: SimpleNamespace(apiextensions_api=api))
+    handlers.create_crds(logging.getLogger())
+
+    assert api.created == [manifests[handlers.AlertContactV1Beta1.plural]['metadata']['name']]
+    assert api.patched == [manifests[plural]['metadata']['name'] for plural in [
+        handlers.PspV1Beta1.plural, handlers.MaintenanceWindowV1Beta1.plural]]
+
+
+def test_generated_crd_manifests_are_current():
+    with open(os.path.join(os.path.dirname(__file__), '../helm/uptimerobot-operator/crds/crds.yaml')) as manifests:
+        assert manifests.read() == generate_crd_manifests.render(), 'run tools/generate_crd_manifests.py'
+
+
+def test_handlers_import_stays_within_budget():
+    # kopf imports the kubernetes client if it's installed, but the CRD models
+    # and the sync UptimeRobot client must not be needed to import the handlers
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import handlers'],
+        cwd=os.path.join(os.path.dirname(__file__), '../ur_operator'), capture_output=True, text=True, check=True)
+
+    own_modules = ['handlers', 'config', 'k8s', 'inventory', 'uptimerobot', 'ratelimit', 'metrics', 'tracing', 'secret_cache']
+    imported = {}
+    for line in result.stderr.splitlines()[1:]:
+        _, self_us, _, name = [part.strip() for part in line.replace(':', '|', 1).split('|')]
+        imported[name] = int(self_us)
+
+    assert 'kubernetes.client.models.v1_json_schema_props' not in imported
+    assert 'uptimerobotpy' not in imported
+    assert sum(us for name, us in imported.items() if name in own_modules or name.startswith('crds')) < 200000
+
+
+def test_work_queue_admits_operations_by_lane():
+    async def scenario():
+        queue = workqueue.WorkQueue(1)
+        admitted = []
+
+        async def operation(route):
+            async with queue.slot(workqueue.lane_for(route)):
+                admitted.append(route)
+
+        await queue.acquire(workqueue.Lane.UPDATE, '')  # all slots are taken
+        waiting = [asyncio.ensure_future(operation(route)) for route in ['getMonitors', 'editMonitor', 'newMonitor', 'deleteMonitor']]
+        with workqueue.lane(workqueue.Lane.DRIFT):
+            waiting.append(asyncio.ensure_future(operation('newPSP')))
+        await asyncio.sleep(0)
+
+        queue.release('')
+        await asyncio.gather(*waiting)
+        return admitted, queue.running
+
+    admitted, running = asyncio.run(scenario())
+    assert admitted == ['deleteMonitor', 'newMonitor', 'editMonitor', 'getMonitors', 'newPSP']
+    assert running == 0
+
+
+def test_work_queue_shares_slots_fairly_between_namespaces(monkeypatch):
+    monkeypatch.setattr(workqueue, 'policies', {'capped': workqueue.NamespacePolicy(concurrency=1)})
+
+    async def scenario():
+        queue = workqueue.WorkQueue(1)
+        admitted = []
+
+        async def operation(namespace, index):
+            with workqueue.namespace(namespace):
+                async with queue.slot(workqueue.Lane.UPDATE):
+                    admitted.append(f'{namespace}-{index}')
+
+        await queue.acquire(workqueue.Lane.UPDATE, 'ci')  # all slots are taken
+        waiting = [asyncio.ensure_future(operation('ci', index)) for index in range(3)]
+        waiting.append(asyncio.ensure_future(operation('team', 0)))
+        await asyncio.sleep(0)
+
+        queue.release('ci')
+        await asyncio.gather(*waiting)
+
+        # a namespace capped to one operation in flight waits although slots are free
+        queue.set_concurrency(3)
+        await queue.acquire(workqueue.Lane.UPDATE, 'capped')
+        capped = asyncio.ensure_future(operation('capped', 0))
+        await asyncio.sleep(0)
+        assert not capped.done()
+        queue.release('capped')
+        await capped
+
+        return admitted, queue.running
+
+    admitted, running = asyncio.run(scenario())
+    assert admitted == ['ci-0', 'team-0', 'ci-1', 'ci-2', 'capped-0']
+    assert running == 0
+
+
+def test_work_queue_parks_backlog_of_capped_namespace(monkeypatch):
+    monkeypatch.setattr(workqueue, 'policies', {'capped': workqueue.NamespacePolicy(concurrency=1)})
+
+    async def scenario():
+        queue = workqueue.WorkQueue(4)
+
+        async def operation(namespace):
+            await queue.acquire(workqueue.Lane.UPDATE, namespace)
+            await asyncio.sleep(0)
+            queue.release(namespace)
+
+        await queue.acquire(workqueue.Lane.UPDATE, 'capped')
+        backlog = [asyncio.ensure_future(operation('capped')) for _ in range(1000)]
+        await asyncio.sleep(0)
+        # only the first operation of a namespace is dispatched, the backlog is parked
+        assert not queue._ready
+
+        await asyncio.wait_for(operation('team'), timeout=1)
+        queue.release('capped')
+        await asyncio.gather(*backlog)
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.running == 0
+    assert not queue._queues and not queue._parked and not queue._finish_times
+
+
+def test_work_queue_wakes_up_rate_limited_namespace(monkeypatch):
+    monkeypatch.setattr(workqueue, 'policies', {'limited': workqueue.NamespacePolicy(rate_limit=600)})
+
+    async def scenario():
+        queue = workqueue.WorkQueue(4)
+        for _ in range(600):  # uses up the operations of this minute
+            await queue.acquire(workqueue.Lane.UPDATE, 'limited')
+            queue.release('limited')
+        # nothing else is running, so only the wakeup timer can admit the next operation
+        await asyncio.wait_for(queue.acquire(workqueue.Lane.UPDATE, 'limited'), timeout=1)
+        return queue.running
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_work_queue_wakes_up_each_rate_limited_namespace(monkeypatch):
+    monkeypatch.setattr(workqueue, 'policies', {
+        'fast': workqueue.NamespacePolicy(rate_limit=6000), 'slow': workqueue.NamespacePolicy(rate_limit=1200)})
+
+    async def scenario():
+        queue = workqueue.WorkQueue(4)
+        for namespace, rate_limit in [('slow', 1200), ('fast', 6000)]:
+            limiter = queue._rate_limiter(namespace, rate_limit)
+            while not limiter.try_acquire():  # uses up the operations of this minute
+                pass
+
+        # the wakeup of the fast namespace must not drop the one of the slow namespace
+        await asyncio.wait_for(asyncio.gather(
+            queue.acquire(workqueue.Lane.UPDATE, 'slow'), queue.acquire(workqueue.Lane.UPDATE, 'fast')), timeout=1)
+        return queue.running
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_work_queue_hands_out_rate_limit_tokens_by_lane():
+    async def scenario():
+        limiter = ratelimit.TokenBucket(600)
+        while not limiter.try_acquire():  # uses up the requests of this minute
+            pass
+        queue = workqueue.WorkQueue(32, rate_limiter=limiter)
+        admitted = []
+
+        async def operation(lane):
+            await queue.acquire(lane, '')
+            admitted.append(lane)
+            queue.release('')
+
+        updates = [asyncio.ensure_future(operation(workqueue.Lane.UPDATE)) for _ in range(3)]
+        await asyncio.sleep(0)
+        await asyncio.wait_for(asyncio.gather(operation(workqueue.Lane.DELETE), *updates), timeout=2)
+        return admitted
+
+    assert asyncio.run(scenario()) == [workqueue.Lane.DELETE] + [workqueue.Lane.UPDATE] * 3
+
+
+def test_namespace_annotations_set_scheduling_policy(monkeypatch):
+    monkeypatch.setattr(workqueue, 'policies', {})
+    annotations = {workqueue.WEIGHT_ANNOTATION: '2', workqueue.CONCURRENCY_ANNOTATION: '4'}
+
+    asyncio.run(handlers.on_namespace_event(event={'type': 'ADDED'}, name='team', annotations=annotations, logger=logging))
+    assert workqueue.policies['team'] == workqueue.NamespacePolicy(weight=2., concurrency=4)
+
+    asyncio.run(handlers.on_namespace_event(event={'type': 'MODIFIED'}, name='team', annotations={}, logger=logging))
+    assert 'team' not in workqueue.policies
+
+
+def test_coalescer_skips_superseded_states():
+    coalescer = handlers.coalescing.Coalescer(0.01)
+    fetched = []
+
+    async def fetch():
+        fetched.append(True)
+        return {'url': 'https://c.com'}
+
+    async def scenario():
+        key = ('UptimeRobotMonitor', 'default', 'foo')
+        return [
+            await coalescer.is_latest(key, {'url': 'https://a.com'}, fetch),
+            await coalescer.is_latest(key, {'url': 'https://b.com'}, fetch),
+            await coalescer.is_latest(key, {'url': 'https://c.com'}, fetch)  # has already been waited for
+        ]
+
+    assert asyncio.run(scenario()) == [False, False, True]
+    assert len(fetched) == 2
+    assert not coalescer.latest
+
+
+def test_outdated_update_costs_no_api_calls(monkeypatch):
+    class FakeAsyncK8s:
+        async def get_k8s_crd_obj(self, crd, namespace, name):
+            return {'metadata': {'name': name}, 'spec': {'type': 'WEB_HOOK', 'value': 'https://foo.com/newer-hook'}}
+
+    monkeypatch.setattr(handlers, 'uptime_robot', None)  # any API call would fail
+    monkeypatch.setattr(handlers, 'k8s', FakeAsyncK8s())
+    monkeypatch.setattr(handlers.coalescing.coalescer, 'window', 0.01)
+
+    spec = {'type': 'WEB_HOOK', 'value': 'https://foo.com/hook'}
+    status = {handlers.on_ac_create.__name__: {handlers.AC_ID_KEY: 1}}
+
+    result = asyncio.run(handlers.on_ac_update(
+        namespace='default', name='foo', spec=spec, status=status, logger=logging.getLogger(), diff=[]))
+
+    assert result is None
+
+
+def test_update_sends_only_changed_fields(monkeypatch):
+    class FakeApi:
+        def __init__(self):
+            self.edits = []
+
+        async def edit_monitor(self, identifier, **params):
+            self.edits.append(params)
+            return {'stat': 'ok', 'monitor': {'id': identifier}}
+
+    fake_api = FakeApi()
+    monkeypatch.setattr(handlers, 'uptime_robot', fake_api)
+    monkeypatch.setattr(handlers.coalescing.coalescer, 'window', 0)
+
+    applied = {'url': 'https://foo.com', 'type': 'HTTPS', 'customHttpHeaders': {'X-Foo': 'bar'}, 'keywordType': 'EXISTS', 'keywordValue': 'foo'}
+    payload = handlers.MonitorV1Beta1.spec_to_request_dict('default', 'foo', applied)
+    status = {handlers.on_create.__name__: {
+        handlers.MONITOR_ID_KEY: 1, handlers.FINGERPRINT_KEY: handlers.fingerprint(payload), handlers.FIELDS_KEY: handlers.field_hashes(payload)}}
+
+    def update(spec):
+        return asyncio.run(handlers.on_update(
+            namespace='default', name='foo', spec=spec, status=status, diff=[], logger=logging.getLogger()))
+
+    update({**applied, 'url': 'https://bar.com', 'keywordValue': 'bar'})
+    assert set(fake_api.edits[-1]) == {'url', 'keyword_type', 'keyword_value'}
+
+    # parameters can't be removed with a partial request
+    update({'url': 'https://foo.com', 'type': 'HTTPS'})
+    assert set(fake_api.edits[-1]) == {'url', 'type', 'friendly_name'}
+
+
+def test_leader_election_takes_over_expired_lease():
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    class FakeK8s:
+        def __init__(self):
+            self.lease = None
+            self.replaced = []
+
+        def get_lease(self, namespace, name):
+            if self.lease is None:
+                raise ApiException(status=404)
+            return self.lease
+
+        def create_lease(self, namespace, body):
+            self.lease = lease(body['spec']['holderIdentity'], now)
+
+        def replace_lease(self, namespace, name, body):
+            self.replaced.append(body)
+
+    def lease(holder, renewed):
+        return SimpleNamespace(
+            metadata=SimpleNamespace(resource_version='1'),
+            spec=SimpleNamespace(holder_identity=holder, lease_duration_seconds=15, renew_time=renewed,
+                                 acquire_time=renewed, lease_transitions=0))
+
+    fake_k8s = FakeK8s()
+    standby = leader.LeaderElection(fake_k8s, 'default', 'uptimerobot-operator', 'standby')
+    assert leader.LeaderElection(fake_k8s, 'default', 'uptimerobot-operator', 'leader').try_acquire()
+    assert not standby.try_acquire()
+
+    fake_k8s.lease = lease('leader', now - datetime.timedelta(seconds=20))
+    assert standby.try_acquire()
+    assert fake_k8s.replaced[-1]['spec']['holderIdentity'] == 'standby'
+    assert fake_k8s.replaced[-1]['spec']['leaseTransitions'] == 1
+    assert fake_k8s.replaced[-1]['metadata']['resourceVersion'] == '1'
+
+
+def test_handlers_wait_for_leadership(monkeypatch):
+    calls = []
+
+    @leader.required
+    async def handler(**_):
+        calls.append(True)
+
+    class FakeK8s:
+        def get_resource_version(self, group, version, plural, namespace, name):
+            return {'foo': '1', 'bar': '2'}[name]  # bar has been handled by the previous leader meanwhile
+
+    resource = kopf.Resource(handlers.GROUP, 'v1beta1', 'uptimerobotmonitors')
+
+    def call(name):
+        return asyncio.ensure_future(handler(
+            resource=resource, namespace='default', name=name, body={'metadata': {'resourceVersion': '1'}}))
+
+    async def scenario():
+        election = leader.LeaderElection(FakeK8s(), 'default', 'uptimerobot-operator', 'standby')
+        monkeypatch.setattr(leader, 'election', election)
+
+        pending, outdated = call('foo'), call('bar')
+        await handler(event={'type': 'MODIFIED'})  # events are dropped instead of held
+        await asyncio.sleep(0.01)
+        assert not calls
+
+        await election.take_over()
+        await pending
+        with pytest.raises(kopf.TemporaryError):
+            await outdated
+
+    asyncio.run(scenario())
+    assert calls == [True]
+
+
+def test_failing_take_over_releases_handlers():
+    async def on_elected():
+        raise RuntimeError('UptimeRobot is not available')
+
+    election = leader.LeaderElection(None, 'default', 'uptimerobot-operator', 'standby', on_elected=on_elected)
+    asyncio.run(election.take_over())
+
+    assert election.is_leader
+
+
+def test_hash_ring_moves_only_objects_of_joining_member():
+    keys = [f'default/monitor-{index}' for index in range(1000)]
+    before = sharding.HashRing(['shard-0', 'shard-1'])
+    after = sharding.HashRing(['shard-0', 'shard-1', 'shard-2'])
+
+    owners = {key: before.owner(key) for key in keys}
+    assert 400 < list(owners.values()).count('shard-0') < 600
+
+    moved = [key for key in keys if after.owner(key) != owners[key]]
+    assert all(after.owner(key) == 'shard-2' for key in moved)
+    assert 200 < len(moved) < 450
+
+
+def test_membership_takes_lowest_free_slot():
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def lease(name, holder, renewed):
+        return SimpleNamespace(
+            metadata=SimpleNamespace(name=name, resource_version='1'),
+            spec=SimpleNamespace(holder_identity=holder, lease_duration_seconds=15, renew_time=renewed,
+                                 acquire_time=renewed, lease_transitions=0))
+
+    class FakeK8s:
+        def __init__(self):
+            self.leases = {
+                'uro-shard-0': lease('uro-shard-0', 'pod-a', now),
+                'uro-shard-1': lease('uro-shard-1', 'pod-b', now - datetime.timedelta(seconds=60))
+            }
+
+        def get_lease(self, namespace, name):
+            if name not in self.leases:
+                raise ApiException(status=404)
+            return self.leases[name]
+
+        def create_lease(self, namespace, body):
+            self.leases[body['metadata']['name']] = lease(body['metadata']['name'], body['spec']['holderIdentity'], now)
+
+        def replace_lease(self, namespace, name, body):
+            self.leases[name] = lease(name, body['spec']['holderIdentity'], now)
+
+        def list_leases(self, namespace, label_selector):
+            return list(self.leases.values())
+
+    membership = sharding.Membership(FakeK8s(), 'default', 'uro', 'pod-c')
+    membership.join()
+
+    assert membership.slot == 'shard-1'  # shard-0 is held, shard-1 has expired
+    assert membership.ring.members == ['shard-0', 'shard-1']
+    assert membership.finalizer == f'{handlers.GROUP}/shard-1'
+    assert membership.is_foreign_finalizer(f'{handlers.GROUP}/shard-0')
+    assert membership.is_foreign_finalizer(sharding.KOPF_FINALIZER)
+    assert not membership.is_foreign_finalizer(membership.finalizer)
+
+
+def test_sharded_reconcile_reads_only_owned_objects(monkeypatch):
+    class FakeMembership:
+        finalizer = f'{handlers.GROUP}/shard-0'
+        ring = sharding.HashRing(['shard-0', 'shard-1'])
+
+        def owns(self, namespace, name):
+            return name == 'mine'
+
+        def is_foreign_finalizer(self, finalizer):
+            return False
+
+    class FakeListingK8s(FakeK8s):
+        async def list_k8s_crd_objs(self, crd):
+            if crd is not handlers.MonitorV1Beta1:
+                return []
+            return [{
+                'metadata': {'namespace': 'default', 'name': name},
+                'spec': {'type': 'HTTPS', 'url': 'https://foo.com'},
+                'status': {'on_create': {handlers.MONITOR_ID_KEY: identifier}}
+            } for name, identifier in [('mine', 1), ('theirs', 2)]]
+
+    fake_api = FakeInventoryApi([{'id': 1, 'friendly_name': 'mine', 'url': 'https://foo.com', 'type': 1, 'interval': 300}])
+    monkeypatch.setattr(handlers, 'k8s', FakeListingK8s())
+    monkeypatch.setattr(handlers, 'uptime_robot', fake_api)
+    monkeypatch.setattr(handlers, 'inventory', inventory.Inventory())
+    monkeypatch.setattr(sharding, 'membership', FakeMembership())
+    monkeypatch.setattr(handlers.ratelimit, 'limiter', handlers.ratelimit.TokenBucket(10))
+    monkeypatch.setattr(handlers, 'start_rebalancing', lambda logger: None)
+
+    asyncio.run(handlers.reconcile(logging.getLogger()))
+    handlers.on_ring_change(logging.getLogger())
+
+    assert fake_api.requests == [{'monitors': '1'}]  # no bulk read of the whole account
+    assert not handlers.k8s.patches
+    assert handlers.ratelimit.limiter.shares == 2
+
+
+def test_previous_owner_finalizes_until_taken_over(monkeypatch):
+    class FakeMembership:
+        finalizer = f'{handlers.GROUP}/shard-1'
+
+        def owns(self, namespace, name):
+            return False
+
+        def is_foreign_finalizer(self, finalizer):
+            return finalizer != self.finalizer
+
+    monkeypatch.setattr(sharding, 'membership', FakeMembership())
+    assert sharding.finalizes('default', 'foo', meta={'finalizers': [f'{handlers.GROUP}/shard-1']})
+    assert not sharding.finalizes('default', 'foo', meta={'finalizers': [f'{handlers.GROUP}/shard-0']})
+
+    obj = {'metadata': {'namespace': 'default', 'name': 'foo', 'resourceVersion': '1',
+                        'finalizers': [f'{handlers.GROUP}/shard-0']}}
+    fake_k8s = FakeK8s(obj)
+    monkeypatch.setattr(handlers, 'k8s', fake_k8s)
+
+    asyncio.run(handlers.take_over_finalizers(logging.getLogger(), handlers.MonitorV1Beta1, obj))
+
+    # the finalizer is replaced in one patch, the object is never without one
+    assert fake_k8s.patches[0][3]['metadata']['finalizers'] == [f'{handlers.GROUP}/shard-1']
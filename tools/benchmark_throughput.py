@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Measures how fast the operator converges Ingress and UptimeRobotMonitor
+objects to UptimeRobot monitors
+
+Runs the operator with kopf against the current Kubernetes context (e.g. a
+kind cluster) and the local UptimeRobot stand-in, each in its own process.
+For every kind and size the objects are created, updated and deleted and per
+phase the p50/p99 time until the change is visible in the monitor status, the
+UptimeRobot API calls per object, the highest RSS sampled during the phase and
+the consumed CPU time of the operator process are reported.
+
+Example: python tools/benchmark_throughput.py --sizes 100 1000 --kinds monitor ingress
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import kubernetes.client as k8s_client
+import kubernetes.config as k8s_config
+import kubernetes.watch as k8s_watch
+
+TOOLS_DIR = os.path.abspath(os.path.dirname(__file__))
+OPERATOR_DIR = os.path.abspath(os.path.join(TOOLS_DIR, '../ur_operator'))
+sys.path.insert(0, OPERATOR_DIR)
+
+from crds.constants import GROUP  # pylint: disable=wrong-import-position
+from crds.monitor import MonitorV1Beta1  # pylint: disable=wrong-import-position
+
+NAMESPACE = 'ur-operator-benchmark'
+MONITOR_ID_KEY = 'monitor_id'
+FINGERPRINT_KEY = 'fingerprint'
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def monitor_status(obj: dict):
+    # same precedence as the operator's identifier lookup
+    status = obj.get('status') or {}
+    for handler in ['on_update', 'on_create']:
+        if MONITOR_ID_KEY in status.get(handler, {}):
+            return status[handler][MONITOR_ID_KEY], status[handler].get(FINGERPRINT_KEY)
+    return None, None
+
+
+class Tracker:
+    """records when the change of a benchmark phase became visible per monitor URL"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phase = None
+        self.started = {}
+        self.finished = {}
+        self.fingerprints = {}
+
+    def begin(self, phase):
+        with self.lock:
+            self.phase = phase
+            self.started = {}
+            self.finished = {}
+
+    def start(self, url):
+        with self.lock:
+            self.started[url] = time.monotonic()
+
+    def on_event(self, event_type, obj):
+        url = obj['spec']['url']
+        identifier, fingerprint = monitor_status(obj)
+
+        with self.lock:
+            if url in self.finished:
+                return
+
+            if self.phase == 'create' and identifier is not None:
+                self.fingerprints[url] = fingerprint
+            elif self.phase == 'update' and identifier is not None and fingerprint != self.fingerprints.get(url):
+                pass
+            elif self.phase == 'delete' and event_type == 'DELETED':
+                pass
+            else:
+                return
+
+            self.finished[url] = time.monotonic()
+
+    def latencies(self):
+        with self.lock:
+            return [self.finished[url] - started for url, started in self.started.items() if url in self.finished]
+
+
+def watch_monitors(custom_objects_api, tracker, stop):
+    while not stop.is_set():
+        try:
+            for event in k8s_watch.Watch().stream(
+                    custom_objects_api.list_namespaced_custom_object, GROUP, MonitorV1Beta1.version, NAMESPACE,
+                    MonitorV1Beta1.plural, timeout_seconds=30):
+                tracker.on_event(event['type'], event['object'])
+                if stop.is_set():
+                    return
+        except k8s_client.rest.ApiException:  # CRD not installed yet
+            time.sleep(1)
+
+
+def start_fake_uptimerobot(port: int, latency: float):
+    # a process of its own, so that its CPU time and memory don't count for the operator
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(TOOLS_DIR, 'fake_uptimerobot.py'), '--port', str(port), '--api-key', 'benchmark',
+        '--latency', str(latency), '--monitor-limit', str(10 ** 7), '--monitor-interval', '60'
+    ], stdout=subprocess.DEVNULL)
+
+    while True:
+        try:
+            api_requests(port)
+            return fake
+        except OSError:
+            if fake.poll() is not None:
+                raise RuntimeError('UptimeRobot stand-in failed to start')
+            time.sleep(0.2)
+
+
+def api_requests(port: int) -> int:
+    """returns the number of API requests the UptimeRobot stand-in has answered"""
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/stats') as response:
+        return sum(json.load(response)['requests'].values())
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f'/proc/{pid}/stat') as stat:
+        # utime and stime are the 14th and 15th field, the command in parentheses may contain spaces
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def rss_mb(pid: int) -> float:
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.
+
+
+class Workload:
+    def __init__(self, kind: str, networking_api, custom_objects_api):
+        self.kind = kind
+        self.networking_api = networking_api
+        self.custom_objects_api = custom_objects_api
+
+    @staticmethod
+    def url(index):
+        return f'https://bench-{index}.example.com'
+
+    def create(self, index):
+        name = f'bench-{index}'
+        if self.kind == 'ingress':
+            self.networking_api.create_namespaced_ingress(NAMESPACE, {
+                'apiVersion': 'networking.k8s.io/v1',
+                'kind': 'Ingress',
+                'metadata': {'name': name, 'annotations': {f'{GROUP}/monitor.type': 'HTTPS'}},
+                'spec': {'rules': [{'host': f'bench-{index}.example.com'}]}
+            })
+        else:
+            self.custom_objects_api.create_namespaced_custom_object(
+                GROUP, MonitorV1Beta1.version, NAMESPACE, MonitorV1Beta1.plural,
+                MonitorV1Beta1.construct_k8s_ur_monitor_body(NAMESPACE, name=name, type='HTTPS', url=self.url(index)))
+
+    def update(self, index):
+        name = f'bench-{index}'
+        if self.kind == 'ingress':
+            self.networking_api.patch_namespaced_ingress(
+                name, NAMESPACE, {'metadata': {'annotations': {f'{GROUP}/monitor.interval': '600'}}})
+        else:
+            self.custom_objects_api.patch_namespaced_custom_object(
+                GROUP, MonitorV1Beta1.version, NAMESPACE, MonitorV1Beta1.plural, name, {'spec': {'interval': 600}})
+
+    def delete(self, index):
+        name = f'bench-{index}'
+        if self.kind == 'ingress':
+            self.networking_api.delete_namespaced_ingress(name, NAMESPACE, propagation_policy='Foreground')
+        else:
+            self.custom_objects_api.delete_namespaced_custom_object(
+                GROUP, MonitorV1Beta1.version, NAMESPACE, MonitorV1Beta1.plural, name)
+
+
+def run_phase(phase, workload, size, tracker, operator_pid, port, executor, timeout):
+    tracker.begin(phase)
+    requests_before = api_requests(port)
+    cpu_before = cpu_seconds(operator_pid)
+    peak_rss = rss_mb(operator_pid)
+    started = time.monotonic()
+
+    def apply(index):
+        tracker.start(workload.url(index))
+        getattr(workload, phase)(index)
+
+    list(executor.map(apply, range(size)))
+
+    deadline = started + timeout
+    while len(tracker.latencies()) < size and time.monotonic() < deadline:
+        time.sleep(0.2)
+        peak_rss = max(peak_rss, rss_mb(operator_pid))
+
+    latencies = tracker.latencies()
+    return {
+        'kind': workload.kind,
+        'size': size,
+        'phase': phase,
+        'converged': len(latencies),
+        'seconds': round(time.monotonic() - started, 2),
+        'p50': round(percentile(latencies, 0.5), 3),
+        'p99': round(percentile(latencies, 0.99), 3),
+        'api_calls_per_object': round((api_requests(port) - requests_before) / size, 2),
+        'peak_rss_mb': round(peak_rss, 1),
+        'cpu_seconds': round(cpu_seconds(operator_pid) - cpu_before, 2)
+    }
+
+
+def wait_for_crd(custom_objects_api):
+    while True:
+        try:
+            custom_objects_api.list_namespaced_custom_object(GROUP, MonitorV1Beta1.version, NAMESPACE, MonitorV1Beta1.plural)
+            return
+        except k8s_client.rest.ApiException:
+            time.sleep(1)
+
+
+def wait_for_namespace_deletion(core_api):
+    while True:
+        try:
+            core_api.read_namespace(NAMESPACE)
+            time.sleep(1)
+        except k8s_client.rest.ApiException as error:
+            if error.status == 404:
+                return
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--kinds', nargs='+', choices=['monitor', 'ingress'], default=['monitor', 'ingress'])
+    parser.add_argument('--port', type=int, default=8081, help='port of the UptimeRobot stand-in')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='mean latency of the UptimeRobot stand-in')
+    parser.add_argument('--api-rate-limit', type=int, default=100000, help='requests per minute the operator may send')
+    parser.add_argument('--client-concurrency', type=int, default=16, help='parallel Kubernetes requests of the benchmark')
+    parser.add_argument('--timeout', type=float, default=1800, help='seconds to wait for each phase to converge')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+
+    # fails before any process is started if there is no cluster to run against
+    k8s_config.load_kube_config()
+    core_api = k8s_client.CoreV1Api()
+    custom_objects_api = k8s_client.CustomObjectsApi()
+    networking_api = k8s_client.NetworkingV1Api()
+    executor = concurrent.futures.ThreadPoolExecutor(args.client_concurrency)
+
+    fake = start_fake_uptimerobot(args.port, args.api_latency)
+
+    operator_env = dict(
+        os.environ,
+        UPTIMEROBOT_API_KEY='benchmark',
+        UPTIMEROBOT_API_URL=f'http://127.0.0.1:{args.port}/v2/',
+        URO_API_RATE_LIMIT=str(args.api_rate_limit),
+        URO_RECONCILE_INTERVAL='0',
+        # every update is measured on its own, none of them is superseded
+        URO_COALESCING_WINDOW='0'
+    )
+
+    if not args.json:
+        print('|kind|objects|phase|converged|seconds|p50|p99|API calls/object|operator peak RSS (MB)|operator CPU seconds|')
+        print('|-|-|-|-|-|-|-|-|-|-|')
+
+    try:
+        for kind in args.kinds:
+            for size in args.sizes:
+                core_api.create_namespace({'metadata': {'name': NAMESPACE}})
+                tracker = Tracker()
+                stop = threading.Event()
+
+                operator = subprocess.Popen([
+                    sys.executable, '-m', 'kopf', 'run', '--standalone', '--quiet', '--namespace', NAMESPACE,
+                    os.path.join(OPERATOR_DIR, 'handlers.py')
+                ], env=operator_env)
+                try:
+                    wait_for_crd(custom_objects_api)
+                    threading.Thread(target=watch_monitors, args=(custom_objects_api, tracker, stop), daemon=True).start()
+
+                    for phase in ['create', 'update', 'delete']:
+                        result = run_phase(phase, Workload(kind, networking_api, custom_objects_api), size, tracker,
+                                           operator.pid, args.port, executor, args.timeout)
+                        if args.json:
+                            print(json.dumps(result), flush=True)
+                        else:
+                            print('|' + '|'.join(str(value) for value in result.values()) + '|', flush=True)
+                finally:
+                    stop.set()
+                    operator.terminate()
+                    operator.wait()
+
+                core_api.delete_namespace(NAMESPACE)
+                wait_for_namespace_deletion(core_api)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+if __name__ == '__main__':
+    main()
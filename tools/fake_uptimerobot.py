@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Local stand-in for the UptimeRobot v2 API
+
+Implements the endpoints used by the operator with an in-memory account, so
+the operator and the tests can run without network access or a real account.
+Latency, rate limits and failures can be configured to run load tests.
+
+Point the operator to it with UPTIMEROBOT_API_URL=http://localhost:8081/v2/
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import time
+
+from aiohttp import web
+
+PAGE_SIZE = 50
+
+# parameters the real API returns as numbers
+INT_FIELDS = ['type', 'sub_type', 'port', 'keyword_type', 'interval', 'http_auth_type', 'http_method', 'post_type',
+              'post_content_type', 'status', 'sort', 'duration', 'hide_url_links', 'ignore_ssl_errors']
+
+
+def error(error_type, **details):
+    return {'stat': 'fail', 'error': {'type': error_type, **details}}
+
+
+class FakeUptimeRobot:
+    def __init__(self, api_key=None, latency=0., rate_limit=None, failure_rate=0., monitor_limit=50,
+                 monitor_interval=300, seed=None):
+        self.api_key = api_key
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.monitor_limit = monitor_limit
+        self.monitor_interval = monitor_interval
+
+        self.monitors = {}
+        self.alert_contacts = {}
+        self.mwindows = {}
+        self.psps = {}
+        self.requests = collections.Counter()
+
+        self._ids = itertools.count(780000000)
+        self._random = random.Random(seed)
+        self._window_started = time.time()
+        self._window_requests = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/stats', self.stats)
+        app.router.add_post('/v2/{route}', self.handle)
+        return app
+
+    async def start(self, host='127.0.0.1', port=8081):
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def stats(self, _):
+        return web.json_response({
+            'requests': dict(self.requests),
+            'monitors': len(self.monitors),
+            'alert_contacts': len(self.alert_contacts),
+            'mwindows': len(self.mwindows),
+            'psps': len(self.psps)
+        })
+
+    def _rate_limit_headers(self):
+        if self.rate_limit is None:
+            return {}, False
+
+        now = time.time()
+        if now - self._window_started >= 60:
+            self._window_started = now
+            self._window_requests = 0
+
+        self._window_requests += 1
+        reset = int(self._window_started + 60)
+        headers = {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(max(0, self.rate_limit - self._window_requests)),
+            'X-RateLimit-Reset': str(reset)
+        }
+
+        if self._window_requests > self.rate_limit:
+            headers['Retry-After'] = str(max(1, int(reset - now)))
+            return headers, True
+
+        return headers, False
+
+    async def handle(self, request):
+        route = request.match_info['route']
+        self.requests[route] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+
+        headers, limited = self._rate_limit_headers()
+        if limited:
+            return web.json_response(error('rate_limit', message='too many requests'), status=429, headers=headers)
+
+        if self._random.random() < self.failure_rate:
+            return web.json_response(error('internal', message='injected failure'), status=503, headers=headers)
+
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if self.api_key is not None and params.pop('api_key', None) != self.api_key:
+            return web.json_response(error('invalid_parameter', parameter_name='api_key'), headers=headers)
+
+        method = getattr(self, f'_{route}', None)
+        if method is None:
+            return web.json_response(error('not_found', message=f'unknown method {route}'), status=404, headers=headers)
+
+        params = {k: int(v) if k in INT_FIELDS and str(v).lstrip('-').isdigit() else v
+                  for k, v in params.items() if k not in ['api_key', 'format']}
+        return web.json_response(method(params), headers=headers)
+
+    def _new(self, collection, params, required):
+        missing = [key for key in required if key not in params]
+        if missing:
+            return None, error('missing_parameter', parameter_name=missing[0])
+
+        identifier = next(self._ids)
+        collection[identifier] = {'id': identifier, **params}
+        return identifier, None
+
+    @staticmethod
+    def _lookup(collection, params):
+        try:
+            identifier = int(params.pop('id'))
+        except (KeyError, ValueError):
+            return None, error('missing_parameter', parameter_name='id')
+
+        if identifier not in collection:
+            return None, error('not_found', parameter_name='id', passed_value=str(identifier))
+
+        return identifier, None
+
+    def _edit(self, collection, params, key):
+        identifier, err = self._lookup(collection, params)
+        if err:
+            return err
+
+        collection[identifier].update(params)
+        return {'stat': 'ok', key: {'id': identifier}}
+
+    def _delete(self, collection, params, key):
+        identifier, err = self._lookup(collection, params)
+        if err:
+            return err
+
+        collection.pop(identifier)
+        return {'stat': 'ok', key: {'id': identifier}}
+
+    @staticmethod
+    def _page(collection, params, filter_key=None):
+        items = list(collection.values())
+        if filter_key and params.get(filter_key):
+            wanted = {int(identifier) for identifier in str(params[filter_key]).split('-')}
+            items = [item for item in items if item['id'] in wanted]
+
+        offset = int(params.get('offset', 0))
+        limit = min(int(params.get('limit', PAGE_SIZE)), PAGE_SIZE)
+        return {'offset': offset, 'limit': limit, 'total': len(items)}, items[offset:offset + limit]
+
+    def _getAccountDetails(self, _):
+        return {'stat': 'ok', 'account': {
+            'email': 'fake@uptimerobot.local',
+            'monitor_limit': self.monitor_limit,
+            'monitor_interval': self.monitor_interval,
+            'up_monitors': len(self.monitors),
+            'down_monitors': 0,
+            'paused_monitors': 0
+        }}
+
+    def _getMonitors(self, params):
+        pagination, monitors = self._page(self.monitors, params, filter_key='monitors')
+        return {'stat': 'ok', 'pagination': pagination, 'monitors': monitors}
+
+    def _newMonitor(self, params):
+        if len(self.monitors) >= self.monitor_limit:
+            return error('invalid_parameter', message='monitor limit reached')
+
+        identifier, err = self._new(self.monitors, {'interval': 300, 'status': 1, **params}, ['friendly_name', 'url', 'type'])
+        return err or {'stat': 'ok', 'monitor': {'id': identifier, 'status': 1}}
+
+    def _editMonitor(self, params):
+        return self._edit(self.monitors, params, 'monitor')
+
+    def _deleteMonitor(self, params):
+        return self._delete(self.monitors, params, 'monitor')
+
+    def _getAlertContacts(self, params):
+        pagination, alert_contacts = self._page(self.alert_contacts, params, filter_key='alert_contacts')
+        return {'stat': 'ok', **pagination, 'alert_contacts': alert_contacts}
+
+    def _newAlertContact(self, params):
+        identifier, err = self._new(self.alert_contacts, {'status': 2, **params}, ['type', 'value'])
+        return err or {'stat': 'ok', 'alertcontact': {'id': identifier, 'status': 0}}
+
+    def _editAlertContact(self, params):
+        return self._edit(self.alert_contacts, params, 'alert_contact')
+
+    def _deleteAlertContact(self, params):
+        return self._delete(self.alert_contacts, params, 'alert_contact')
+
+    def _getMWindows(self, params):
+        pagination, mwindows = self._page(self.mwindows, params, filter_key='mwindows')
+        return {'stat': 'ok', 'pagination': pagination, 'mwindows': mwindows}
+
+    def _newMWindow(self, params):
+        identifier, err = self._new(self.mwindows, {'status': 1, **params}, ['friendly_name', 'type', 'start_time', 'duration'])
+        return err or {'stat': 'ok', 'mwindow': {'id': identifier, 'status': 1}}
+
+    def _editMWindow(self, params):
+        return self._edit(self.mwindows, params, 'mwindow')
+
+    def _deleteMWindow(self, params):
+        return self._delete(self.mwindows, params, 'mwindow')
+
+    def _getPSPs(self, params):
+        pagination, psps = self._page(self.psps, params, filter_key='psps')
+        return {'stat': 'ok', 'pagination': pagination, 'psps': psps}
+
+    @staticmethod
+    def _psp_params(params):
+        # getPSPs reports the custom domain as custom_url
+        if 'custom_domain' in params:
+            params['custom_url'] = params.pop('custom_domain')
+        return params
+
+    def _newPSP(self, params):
+        identifier, err = self._new(self.psps, {'status': 1, **self._psp_params(params)}, ['friendly_name', 'monitors'])
+        return err or {'stat': 'ok', 'psp': {'id': identifier}}
+
+    def _editPSP(self, params):
+        return self._edit(self.psps, self._psp_params(params), 'psp')
+
+    def _deletePSP(self, params):
+        return self._delete(self.psps, params, 'psp')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--api-key', help='only accept requests with this API key')
+    parser.add_argument('--latency', type=float, default=0., help='mean response latency in seconds')
+    parser.add_argument('--rate-limit', type=int, help='requests per minute before answering with 429')
+    parser.add_argument('--failure-rate', type=float, default=0., help='fraction of requests answered with 503')
+    parser.add_argument('--monitor-limit', type=int, default=50)
+    parser.add_argument('--monitor-interval', type=int, default=300, help='minimum interval, below 300 means pro plan')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    fake = FakeUptimeRobot(
+        api_key=args.api_key,
+        latency=args.latency,
+        rate_limit=args.rate_limit,
+        failure_rate=args.failure_rate,
+        monitor_limit=args.monitor_limit,
+        monitor_interval=args.monitor_interval,
+        seed=args.seed
+    )
+    print(json.dumps({'listening': f'http://{args.host}:{args.port}/v2/'}))
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Renders the CRDs of the operator to static manifests
+
+Install the output with kubectl or ship it in the crds/ directory of the Helm
+chart and set URO_DISABLE_CRD_MANAGEMENT=1, then the operator does not touch
+the CRDs on startup.
+
+Example: python tools/generate_crd_manifests.py > helm/uptimerobot-operator/crds/crds.yaml
+"""
+
+import os
+import sys
+
+import yaml
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../ur_operator')))
+
+from crds.utils import crd_manifest  # pylint: disable=wrong-import-position
+from crds.monitor import MonitorV1Beta1  # pylint: disable=wrong-import-position
+from crds.psp import PspV1Beta1  # pylint: disable=wrong-import-position
+from crds.maintenance_window import MaintenanceWindowV1Beta1  # pylint: disable=wrong-import-position
+from crds.alert_contact import AlertContactV1Beta1  # pylint: disable=wrong-import-position
+
+
+def render() -> str:
+    return yaml.safe_dump_all(
+        [crd_manifest(crd.crd) for crd in [MonitorV1Beta1, PspV1Beta1, MaintenanceWindowV1Beta1, AlertContactV1Beta1]],
+        sort_keys=False
+    )
+
+
+if __name__ == '__main__':
+    sys.stdout.write(render())
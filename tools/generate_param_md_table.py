@@ -17,5 +17,5 @@ for crd in [MonitorV1Beta1, PspV1Beta1, MaintenanceWindowV1Beta1, AlertContactV1
     print('|-|-|-|')
 
     for key, prop in crd.spec_properties.items():
-        print(f'|`{key}`{" (required)" if key in crd.required_props else ""}|`{prop.type}`|{prop.description}|')
+        print(f'|`{key}`{" (required)" if key in crd.required_props else ""}|`{prop["type"]}`|{prop["description"]}|')
     print()
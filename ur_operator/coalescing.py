@@ -0,0 +1,71 @@
+import asyncio
+import functools
+
+from config import Config
+import metrics
+
+
+class Coalescer:
+    """skips update handler runs for states of an object that are already outdated
+
+    Helm upgrades and GitOps tools often change an object several times
+    within seconds, kopf runs the update handler for each of these changes
+    one after another. An update handler waits for the coalescing window and
+    then reads the object again, if it has changed in the meantime the run is
+    skipped and the handler run for the newest state applies it without
+    waiting again.
+
+    Objects are identified by a (kind, namespace, name) tuple.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self.latest = {}  # object -> state read after its last window
+
+    async def is_latest(self, key: tuple, state, fetch) -> bool:
+        """waits for the window and returns whether state is still the newest state of the object"""
+        if self.latest.get(key) != state:
+            await asyncio.sleep(self.window)
+            latest = await fetch()
+            if latest != state:
+                if latest is None:  # deleted in the meantime
+                    self.latest.pop(key, None)
+                else:
+                    self.latest[key] = latest
+                return False
+
+        self.latest.pop(key, None)
+        return True
+
+
+coalescer = Coalescer(Config().COALESCING_WINDOW)
+
+
+def coalesced(kind: str, fetch, state):
+    """skips runs of an update handler whose state has been superseded within the coalescing window
+
+    fetch(namespace, name) returns the current object or None, state(spec,
+    annotations) the parts of an object the handler applies. Runs that are
+    forced, e.g. drift repairs, are never skipped.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if kwargs.get('force') or not coalescer.window:
+                return await fn(*args, **kwargs)
+
+            namespace, name = kwargs['namespace'], kwargs['name']
+
+            async def fetch_state():
+                obj = await fetch(namespace, name)
+                return None if obj is None else state(obj.get('spec', {}), obj['metadata'].get('annotations', {}))
+
+            current = state(kwargs['spec'], kwargs.get('annotations', {}))
+            if not await coalescer.is_latest((kind, namespace, name), current, fetch_state):
+                kwargs['logger'].info(f'{kind} {namespace}/{name} has changed again, skipping outdated update')
+                metrics.COALESCED_UPDATES.labels(kind).inc()
+                return None
+
+            return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
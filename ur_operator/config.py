@@ -1,10 +1,108 @@
 import os
+import socket
 
 class Config:
     @property
     def DISABLE_INGRESS_HANDLING(self):
         return os.getenv('URO_DISABLE_INGRESS_HANDLING', 'False').lower() in ['true', '1']
 
+    @property
+    def DISABLE_CRD_MANAGEMENT(self):
+        # CRDs are installed from the manifests generated with tools/generate_crd_manifests.py
+        return os.getenv('URO_DISABLE_CRD_MANAGEMENT', 'False').lower() in ['true', '1']
+
     @property
     def UPTIMEROBOT_API_KEY(self):
         return os.environ['UPTIMEROBOT_API_KEY']
+
+    @property
+    def UPTIMEROBOT_API_URL(self):
+        return os.getenv('UPTIMEROBOT_API_URL', 'https://api.uptimerobot.com/v2/')
+
+    @property
+    def API_POOL_SIZE(self):
+        return int(os.getenv('URO_API_POOL_SIZE', '32'))
+
+    @property
+    def K8S_POOL_SIZE(self):
+        return int(os.getenv('URO_K8S_POOL_SIZE', '32'))
+
+    @property
+    def K8S_CONCURRENCY(self):
+        # Kubernetes requests the operator sends concurrently
+        return int(os.getenv('URO_K8S_CONCURRENCY', '16'))
+
+    @property
+    def API_CONCURRENCY(self):
+        # UptimeRobot operations in flight at once, waiting ones are admitted by priority
+        return int(os.getenv('URO_API_CONCURRENCY', '32'))
+
+    @property
+    def API_KEEPALIVE_TIMEOUT(self):
+        return float(os.getenv('URO_API_KEEPALIVE_TIMEOUT', '60'))
+
+    @property
+    def API_CONNECT_TIMEOUT(self):
+        return float(os.getenv('URO_API_CONNECT_TIMEOUT', '5'))
+
+    @property
+    def API_READ_TIMEOUT(self):
+        return float(os.getenv('URO_API_READ_TIMEOUT', '30'))
+
+    @property
+    def API_RATE_LIMIT(self):
+        # requests per minute, derived from the UptimeRobot plan if not set
+        value = os.getenv('URO_API_RATE_LIMIT')
+        return int(value) if value else None
+
+    @property
+    def COALESCING_WINDOW(self):
+        # seconds an update waits for further changes of the same object, 0 disables it
+        return float(os.getenv('URO_COALESCING_WINDOW', '0'))
+
+    @property
+    def LEADER_ELECTION(self):
+        # replicas elect a leader with a Lease, the others wait as hot standby
+        return os.getenv('URO_LEADER_ELECTION', 'False').lower() in ['true', '1']
+
+    @property
+    def SHARDING(self):
+        # replicas split the objects between them with a consistent hash ring
+        return os.getenv('URO_SHARDING', 'False').lower() in ['true', '1']
+
+    @property
+    def LEASE_NAME(self):
+        return os.getenv('URO_LEASE_NAME', 'uptimerobot-operator')
+
+    @property
+    def LEASE_NAMESPACE(self):
+        return os.getenv('URO_LEASE_NAMESPACE', os.getenv('POD_NAMESPACE', 'default'))
+
+    @property
+    def LEASE_DURATION(self):
+        # seconds a leader that stopped renewing its Lease keeps it
+        return float(os.getenv('URO_LEASE_DURATION', '15'))
+
+    @property
+    def POD_NAME(self):
+        # identity of this replica in the Lease
+        return os.getenv('POD_NAME', socket.gethostname())
+
+    @property
+    def RECONCILE_INTERVAL(self):
+        # seconds between two drift reconciliation runs, 0 disables them
+        return float(os.getenv('URO_RECONCILE_INTERVAL', '600'))
+
+    @property
+    def METRICS_PORT(self):
+        # port serving Prometheus metrics on /metrics, 0 disables it
+        return int(os.getenv('URO_METRICS_PORT', '9090'))
+
+    @property
+    def TRACING_EXPORTER(self):
+        # one of otlp, file, tracing is disabled if empty
+        return os.getenv('URO_TRACING_EXPORTER', '')
+
+    @property
+    def TRACING_FILE(self):
+        return os.getenv('URO_TRACING_FILE', '/tmp/uroperator-traces.jsonl')
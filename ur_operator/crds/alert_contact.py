@@ -2,10 +2,7 @@
 
 import enum
 
-import kubernetes.client as k8s_client
-
-from .constants import GROUP
-from .utils import camel_to_snake_case
+from .utils import camel_to_snake_case, crd_definition, schema_props
 
 
 @enum.unique
@@ -31,59 +28,29 @@ class AlertContactV1Beta1:
 
     required_props = ['type', 'value']
 
+    # request parameters that getAlertContacts reports back, used to detect drift
+    reported_fields = ['friendly_name', 'type', 'value']
+    # request parameters that are reported back under another name
+    reported_names = {}
+
     spec_properties = {
-        'type': k8s_client.V1JSONSchemaProps(
+        'type': schema_props(
             type='string',
             enum=list(
                 AlertContactType.__members__.keys()),
             description=f'the type of alert contact, one of: {",".join(list(AlertContactType.__members__.keys()))}'
         ),
-        'value': k8s_client.V1JSONSchemaProps(
+        'value': schema_props(
             type='string',
             description='the alert contact\'s mail address / phone number / URL / connection string'
         ),
-        'friendlyName': k8s_client.V1JSONSchemaProps(
+        'friendlyName': schema_props(
             type='string',
             description='friendly name of the alert contact, defaults to name of the AlertContact object'
         )
     }
 
-    crd = k8s_client.V1CustomResourceDefinition(
-        api_version='apiextensions.k8s.io/v1',
-        kind='CustomResourceDefinition',
-        metadata=k8s_client.V1ObjectMeta(name=f'{plural}.{GROUP}'),
-        spec=k8s_client.V1CustomResourceDefinitionSpec(
-            group=GROUP,
-            versions=[k8s_client.V1CustomResourceDefinitionVersion(
-                name=version,
-                served=True,
-                storage=True,
-                schema=k8s_client.V1CustomResourceValidation(
-                    open_apiv3_schema=k8s_client.V1JSONSchemaProps(
-                        type='object',
-                        properties={
-                            'spec': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                required=required_props,
-                                properties=spec_properties
-                            ),
-                            'status': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                x_kubernetes_preserve_unknown_fields=True
-                            )
-                        }
-                    )
-                )
-            )],
-            scope='Namespaced',
-            names=k8s_client.V1CustomResourceDefinitionNames(
-                plural=plural,
-                singular=singular,
-                kind=kind,
-                short_names=short_names
-            )
-        )
-    )
+    crd = crd_definition(plural, singular, kind, short_names, version, required_props, spec_properties)
 
     @staticmethod
     def spec_to_request_dict(name: str, spec: dict) -> dict:
@@ -2,10 +2,7 @@
 
 import enum
 
-import kubernetes.client as k8s_client
-
-from .constants import GROUP
-from .utils import camel_to_snake_case
+from .utils import camel_to_snake_case, crd_definition, schema_props
 
 
 @enum.unique
@@ -25,67 +22,37 @@ class MaintenanceWindowV1Beta1:
 
     required_props = ['type', 'startTime', 'duration']
 
+    # request parameters that getMWindows reports back, used to detect drift
+    reported_fields = ['friendly_name', 'type', 'value', 'start_time', 'duration']
+    # request parameters that are reported back under another name
+    reported_names = {}
+
     spec_properties = {
-        'type': k8s_client.V1JSONSchemaProps(
+        'type': schema_props(
             type='string',
             enum=list(
                 MaintenanceWindowType.__members__.keys()),
             description=f'the type of maintenance window, one of: {",".join(list(MaintenanceWindowType.__members__.keys()))}'
         ),
-        'startTime': k8s_client.V1JSONSchemaProps(
+        'startTime': schema_props(
             type='string',
             description=f'the start time of the maintenance window, in seconds since epoch for type {MaintenanceWindowType.ONCE}, in HH:mm format for the other types'
         ),
-        'duration': k8s_client.V1JSONSchemaProps(
+        'duration': schema_props(
             type='number',
             description='the number of seconds the maintenance window will be active'
         ),
-        'friendlyName': k8s_client.V1JSONSchemaProps(
+        'friendlyName': schema_props(
             type='string',
             description='friendly name of the maintenance window, defaults to name of the MaintenanceWindow object'
         ),
-        'value': k8s_client.V1JSONSchemaProps(
+        'value': schema_props(
             type='string',
             description=f'allows to specify the maintenance window selection, e.g. 2-4-5 for Tuesday-Thursday-Friday or 10-17-26 for the days of the month, only valid and required for {MaintenanceWindowType.WEEKLY} and {MaintenanceWindowType.MONTHLY}'
         )
     }
 
-    crd = k8s_client.V1CustomResourceDefinition(
-        api_version='apiextensions.k8s.io/v1',
-        kind='CustomResourceDefinition',
-        metadata=k8s_client.V1ObjectMeta(name=f'{plural}.{GROUP}'),
-        spec=k8s_client.V1CustomResourceDefinitionSpec(
-            group=GROUP,
-            versions=[k8s_client.V1CustomResourceDefinitionVersion(
-                name=version,
-                served=True,
-                storage=True,
-                schema=k8s_client.V1CustomResourceValidation(
-                    open_apiv3_schema=k8s_client.V1JSONSchemaProps(
-                        type='object',
-                        properties={
-                            'spec': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                required=required_props,
-                                properties=spec_properties
-                            ),
-                            'status': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                x_kubernetes_preserve_unknown_fields=True
-                            )
-                        }
-                    )
-                )
-            )],
-            scope='Namespaced',
-            names=k8s_client.V1CustomResourceDefinitionNames(
-                plural=plural,
-                singular=singular,
-                kind=kind,
-                short_names=short_names
-            )
-        )
-    )
+    crd = crd_definition(plural, singular, kind, short_names, version, required_props, spec_properties)
 
     @staticmethod
     def spec_to_request_dict(name: str, spec: dict) -> dict:
@@ -4,11 +4,8 @@ import base64
 import enum
 import json
 
-import kubernetes.client as k8s_client
-
-from k8s import K8s
 from .constants import GROUP
-from .utils import camel_to_snake_case
+from .utils import camel_to_snake_case, crd_definition, schema_props
 
 
 class MonitorType(enum.Enum):
@@ -81,163 +78,142 @@ class MonitorV1Beta1:
 
     required_props = ['url', 'type']
 
+    # request parameters that getMonitors reports back, used to detect drift
+    reported_fields = ['friendly_name', 'url', 'type', 'sub_type', 'port', 'keyword_type', 'keyword_value', 'interval', 'http_username']
+    # request parameters that are reported back under another name
+    reported_names = {}
+
+    # request parameters that editMonitor only accepts together
+    coupled_fields = [
+        {'sub_type', 'port'},
+        {'keyword_type', 'keyword_value'},
+        {'http_username', 'http_password', 'http_auth_type'},
+        {'http_method', 'post_type', 'post_content_type', 'post_value'}
+    ]
+
+    # spec property referencing a Secret, loaded into the secret cache before translating the spec
+    secret_field = 'httpAuthSecret'
+
     spec_properties = {
-        'url': k8s_client.V1JSONSchemaProps(
+        'url': schema_props(
             type='string',
             description='URL that will be monitored'
         ),
-        'type': k8s_client.V1JSONSchemaProps(
+        'type': schema_props(
             type='string',
             enum=list(
                 MonitorType.__members__.keys()),
             description=f'Type of monitor, one of: {",".join(list(MonitorType.__members__.keys()))}'
         ),
-        'friendlyName': k8s_client.V1JSONSchemaProps(
+        'friendlyName': schema_props(
             type='string',
             description='Friendly name of monitor, defaults to name of UptimeRobotMonitor object'
         ),
-        'subType': k8s_client.V1JSONSchemaProps(
+        'subType': schema_props(
             type='string',
             enum=list(
                 MonitorSubType.__members__.keys()),
             description=f'Subtype of monitor, one of: {",".join(list(MonitorType.__members__.keys()))}'
         ),
-        'port': k8s_client.V1JSONSchemaProps(
+        'port': schema_props(
             type='integer',
             description=f'Port to monitor when using monitor sub type {MonitorType.PORT.name}'
         ),
-        'keywordType': k8s_client.V1JSONSchemaProps(
+        'keywordType': schema_props(
             type='string',
             enum=list(
                 MonitorKeywordType.__members__.keys()),
             description=f'Keyword type when using monitor type {MonitorType.KEYWORD.name}, one of: {",".join(list(MonitorKeywordType.__members__.keys()))}'
         ),
-        'keywordValue': k8s_client.V1JSONSchemaProps(
+        'keywordValue': schema_props(
             type='string',
             description=f'Keyword value when using monitor type {MonitorType.KEYWORD.name}'
         ),
-        'interval': k8s_client.V1JSONSchemaProps(
+        'interval': schema_props(
             type='integer',
             multiple_of=60.,
             description='The interval for the monitoring check (300 seconds by default)'
         ),
-        'httpUsername': k8s_client.V1JSONSchemaProps(
+        'httpUsername': schema_props(
             type='string',
             description=f'Used for password protected pages when using monitor type {MonitorType.HTTP.name},{MonitorType.HTTPS.name} or {MonitorType.KEYWORD.name}, deprecated: use httpAuthSecret'
         ),
-        'httpPassword': k8s_client.V1JSONSchemaProps(
+        'httpPassword': schema_props(
             type='string',
             description=f'Used for password protected pages when using monitor type {MonitorType.HTTP.name},{MonitorType.HTTPS.name} or {MonitorType.KEYWORD.name}, deprecated: use httpAuthSecret'
         ),
-        'httpAuthSecret': k8s_client.V1JSONSchemaProps(
+        'httpAuthSecret': schema_props(
             type='string',
             description=f'reference to a Kubernetes secret in the same namespace containing user and password for password protected pages when using monitor type {MonitorType.HTTP.name},{MonitorType.HTTPS.name} or {MonitorType.KEYWORD.name}'
         ),
-        'httpAuthType': k8s_client.V1JSONSchemaProps(
+        'httpAuthType': schema_props(
             type='string',
             enum=list(
                 MonitorHttpAuthType.__members__.keys()),
             description=f'Used for password protected pages when using monitor type {MonitorType.HTTP.name},{MonitorType.HTTPS.name} or {MonitorType.KEYWORD.name}, one of: {",".join(list(MonitorHttpAuthType.__members__.keys()))}'
         ),
-        'httpMethod': k8s_client.V1JSONSchemaProps(
+        'httpMethod': schema_props(
             type='string',
             enum=list(
                 MonitorHttpMethod.__members__.keys()),
             description=f'The HTTP method to be used, one of: {",".join(list(MonitorHttpMethod.__members__.keys()))}'
         ),
-        'postType': k8s_client.V1JSONSchemaProps(
+        'postType': schema_props(
             type='string',
             enum=list(
                 MonitorPostType.__members__.keys()),
             description='The format of data to be sent with POST, PUT, PATCH, DELETE, OPTIONS requests'
         ),
-        'postContentType': k8s_client.V1JSONSchemaProps(
+        'postContentType': schema_props(
             type='string',
             enum=list(
                 MonitorPostContentType.__members__.keys()),
             description=f'The Content-Type header to be sent with POST, PUT, PATCH, DELETE, OPTIONS requests, one of: {",".join(list(MonitorPostContentType.__members__.keys()))}'
         ),
-        'postValue': k8s_client.V1JSONSchemaProps(
+        'postValue': schema_props(
             type='object',
             description='The data to be sent with POST, PUT, PATCH, DELETE, OPTIONS requests',
             x_kubernetes_preserve_unknown_fields=True
         ),
-        'customHttpHeaders': k8s_client.V1JSONSchemaProps(
+        'customHttpHeaders': schema_props(
             type='object',
             description='Custom HTTP headers to be sent along monitor request, formatted as JSON',
             x_kubernetes_preserve_unknown_fields=True
         ),
-        'customHttpStatuses': k8s_client.V1JSONSchemaProps(
+        'customHttpStatuses': schema_props(
             type='string',
             description='Allows to define HTTP status codes that will be handled as up or down, e.g. 404:0_200:1 to accept 404 as down and 200 as up'
         ),
-        'ignoreSslErrors': k8s_client.V1JSONSchemaProps(
+        'ignoreSslErrors': schema_props(
             type='boolean',
             description='Flag to ignore SSL certificate related issues'
         ),
-        'alertContacts': k8s_client.V1JSONSchemaProps(
+        'alertContacts': schema_props(
             type='string',
             description='Alert contacts to be notified when monitor goes up or down. For syntax check https://uptimerobot.com/api/#newMonitorWrap'
         ),
-        'mwindows': k8s_client.V1JSONSchemaProps(
+        'mwindows': schema_props(
             type='string',
             description='Maintenance window IDs for this monitor'
         )
     }
 
-    crd = k8s_client.V1CustomResourceDefinition(
-        api_version='apiextensions.k8s.io/v1',
-        kind='CustomResourceDefinition',
-        metadata=k8s_client.V1ObjectMeta(name=f'{plural}.{GROUP}'),
-        spec=k8s_client.V1CustomResourceDefinitionSpec(
-            group=GROUP,
-            versions=[k8s_client.V1CustomResourceDefinitionVersion(
-                name=version,
-                served=True,
-                storage=True,
-                schema=k8s_client.V1CustomResourceValidation(
-                    open_apiv3_schema=k8s_client.V1JSONSchemaProps(
-                        type='object',
-                        properties={
-                            'spec': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                required=required_props,
-                                properties=spec_properties
-                            ),
-                            'status': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                x_kubernetes_preserve_unknown_fields=True
-                            )
-                        }
-                    )
-                )
-            )],
-            scope='Namespaced',
-            names=k8s_client.V1CustomResourceDefinitionNames(
-                plural=plural,
-                singular=singular,
-                kind=kind,
-                short_names=short_names
-            )
-        )
-    )
+    crd = crd_definition(plural, singular, kind, short_names, version, required_props, spec_properties)
 
     @staticmethod
-    def spec_to_request_dict(namespace:str, name: str, spec: dict) -> dict:
-        k8s = K8s()
-
+    def spec_to_request_dict(namespace:str, name: str, spec: dict, secret: dict = None) -> dict:
         # convert all keys from camel to snake case
         request_dict = {camel_to_snake_case(k): v for k, v in spec.items()}
         request_dict['friendly_name'] = request_dict.get('friendly_name', name)
         request_dict['type'] = MonitorType[spec['type']].value
 
+        # secret holds the data of the Secret named in httpAuthSecret
         if 'http_auth_secret' in request_dict:
-            secret = k8s.get_secret(namespace, request_dict['http_auth_secret'])
-
-            request_dict['http_username'] = base64.b64decode(secret.data['username']).decode()
-            request_dict['http_password'] = base64.b64decode(secret.data['password']).decode()
             request_dict.pop('http_auth_secret')
 
+            request_dict['http_username'] = base64.b64decode(secret['username']).decode()
+            request_dict['http_password'] = base64.b64decode(secret['password']).decode()
+
         # map enum values
         for key, enum_class in {
             'sub_type': MonitorSubType,
@@ -262,9 +238,9 @@ class MonitorV1Beta1:
             if key not in MonitorV1Beta1.spec_properties:
                 continue
 
-            if MonitorV1Beta1.spec_properties[key].type == 'integer':
+            if MonitorV1Beta1.spec_properties[key]['type'] == 'integer':
                 spec[key] = int(value)
-            elif MonitorV1Beta1.spec_properties[key].type == 'object':
+            elif MonitorV1Beta1.spec_properties[key]['type'] == 'object':
                 spec[key] = json.loads(value)
             else:
                 spec[key] = value
@@ -2,11 +2,7 @@
 import enum
 import base64
 
-import kubernetes.client as k8s_client
-
-from k8s import K8s
-from .constants import GROUP
-from .utils import camel_to_snake_case
+from .utils import camel_to_snake_case, crd_definition, schema_props
 
 @enum.unique
 class PspStatus(enum.Enum):
@@ -31,96 +27,70 @@ class PspV1Beta1:
 
     required_props = ['monitors']
 
+    # request parameters that getPSPs reports back, used to detect drift
+    reported_fields = ['friendly_name', 'custom_domain', 'sort', 'status']
+    # request parameters that are reported back under another name
+    reported_names = {'custom_domain': 'custom_url'}
+
+    # request parameters that editPSP only accepts together
+    coupled_fields = []
+
+    # spec property referencing a Secret, loaded into the secret cache before translating the spec
+    secret_field = 'passwordSecret'
+
     spec_properties = {
-        'monitors': k8s_client.V1JSONSchemaProps(
+        'monitors': schema_props(
             type='string',
             description='the list of monitor IDs to be displayed in status page (the values are seperated with "-" or 0 for all monitors)'
         ),
-        'friendlyName': k8s_client.V1JSONSchemaProps(
+        'friendlyName': schema_props(
             type='string',
             description='Friendly name of public status page, defaults to name of PublicStatusPage object'
         ),
-        'customDomain': k8s_client.V1JSONSchemaProps(
+        'customDomain': schema_props(
             type='string',
             description='the domain or subdomain that the status page will run on'
         ),
-        'password': k8s_client.V1JSONSchemaProps(
+        'password': schema_props(
             type='string',
             description='the password for the status page, deprecated: use passwordSecret'
         ),
-        'passwordSecret': k8s_client.V1JSONSchemaProps(
+        'passwordSecret': schema_props(
             type='string',
             description='reference to a Kubernetes secret in the same namespace containing the password for the status page'
         ),
-        'sort': k8s_client.V1JSONSchemaProps(
+        'sort': schema_props(
             type='string',
             enum=list(
                 PspSort.__members__.keys()),
             description=f'the sorting of the monitors on the status page, one of: {",".join(list(PspSort.__members__.keys()))}'
         ),
-        'status': k8s_client.V1JSONSchemaProps(
+        'status': schema_props(
             type='string',
             enum=list(
                 PspStatus.__members__.keys()),
             description=f'the status of the status page, one of: {",".join(list(PspStatus.__members__.keys()))}'
         ),
-        'hideUrlLinks': k8s_client.V1JSONSchemaProps(
+        'hideUrlLinks': schema_props(
             type='boolean',
             description='Flag to remove the UptimeRobot link from the status page (pro plan feature)'
         )
     }
 
-    crd = k8s_client.V1CustomResourceDefinition(
-        api_version='apiextensions.k8s.io/v1',
-        kind='CustomResourceDefinition',
-        metadata=k8s_client.V1ObjectMeta(name=f'{plural}.{GROUP}'),
-        spec=k8s_client.V1CustomResourceDefinitionSpec(
-            group=GROUP,
-            versions=[k8s_client.V1CustomResourceDefinitionVersion(
-                name=version,
-                served=True,
-                storage=True,
-                schema=k8s_client.V1CustomResourceValidation(
-                    open_apiv3_schema=k8s_client.V1JSONSchemaProps(
-                        type='object',
-                        properties={
-                            'spec': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                required=required_props,
-                                properties=spec_properties
-                            ),
-                            'status': k8s_client.V1JSONSchemaProps(
-                                type='object',
-                                x_kubernetes_preserve_unknown_fields=True
-                            )
-                        }
-                    )
-                )
-            )],
-            scope='Namespaced',
-            names=k8s_client.V1CustomResourceDefinitionNames(
-                plural=plural,
-                singular=singular,
-                kind=kind,
-                short_names=short_names
-            )
-        )
-    )
+    crd = crd_definition(plural, singular, kind, short_names, version, required_props, spec_properties)
 
     @staticmethod
-    def spec_to_request_dict(namespace: str, name: str, spec: dict) -> dict:
-        k8s = K8s()
-
+    def spec_to_request_dict(namespace: str, name: str, spec: dict, secret: dict = None) -> dict:
         # convert all keys from camel to snake case
         request_dict = {camel_to_snake_case(k): v for k, v in spec.items()}
         request_dict['friendly_name'] = request_dict.get('friendly_name', name)
 
+        # secret holds the data of the Secret named in passwordSecret
         if 'password_secret' in request_dict:
-            secret = k8s.get_secret(namespace, request_dict['password_secret'])
-
-            request_dict['password'] = base64.b64decode(secret.data['password']).decode()
             request_dict.pop('password_secret')
 
+            request_dict['password'] = base64.b64decode(secret['password']).decode()
+
         # map enum values
         for key, enum_class in {
             'sort': PspSort,
@@ -1,4 +1,76 @@
+import copy
+import hashlib
+import json
 import re
 
+from .constants import GROUP
+
+# hash of the generated CRD, used to skip writing CRDs that are already current
+CRD_HASH_ANNOTATION = f'{GROUP}/crd-hash'
+MANAGED_BY_LABEL = 'app.kubernetes.io/managed-by'
+MANAGED_BY = 'uptimerobot-operator'
+
+# keyword arguments of V1JSONSchemaProps whose field name isn't the camel case version
+SCHEMA_FIELD_NAMES = {
+    'multiple_of': 'multipleOf',
+    'x_kubernetes_preserve_unknown_fields': 'x-kubernetes-preserve-unknown-fields'
+}
+
 pattern = re.compile(r'(?<!^)(?=[A-Z])')
 def camel_to_snake_case(string): return pattern.sub('_', string).lower()
+
+
+def schema_props(**props) -> dict:
+    """JSON schema of a CRD property as plain dict, takes the keyword arguments
+    of kubernetes.client.V1JSONSchemaProps without having to import the models"""
+    return {SCHEMA_FIELD_NAMES.get(key, key): value for key, value in props.items()}
+
+
+def crd_definition(plural: str, singular: str, kind: str, short_names: list, version: str, required_props: list,
+                   spec_properties: dict) -> dict:
+    return {
+        'apiVersion': 'apiextensions.k8s.io/v1',
+        'kind': 'CustomResourceDefinition',
+        'metadata': {'name': f'{plural}.{GROUP}'},
+        'spec': {
+            'group': GROUP,
+            'names': {
+                'kind': kind,
+                'plural': plural,
+                'shortNames': short_names,
+                'singular': singular
+            },
+            'scope': 'Namespaced',
+            'versions': [{
+                'name': version,
+                'schema': {
+                    'openAPIV3Schema': {
+                        'properties': {
+                            'spec': {
+                                'properties': spec_properties,
+                                'required': required_props,
+                                'type': 'object'
+                            },
+                            'status': {
+                                'type': 'object',
+                                'x-kubernetes-preserve-unknown-fields': True
+                            }
+                        },
+                        'type': 'object'
+                    }
+                },
+                'served': True,
+                'storage': True
+            }]
+        }
+    }
+
+
+def crd_manifest(crd: dict) -> dict:
+    """returns a copy of the CRD labeled and annotated with the hash of its content"""
+    manifest = copy.deepcopy(crd)
+    digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:16]
+
+    manifest['metadata'].setdefault('labels', {})[MANAGED_BY_LABEL] = MANAGED_BY
+    manifest['metadata'].setdefault('annotations', {})[CRD_HASH_ANNOTATION] = digest
+    return manifest
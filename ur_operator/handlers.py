@@ -1,7 +1,15 @@
+import asyncio
+import fnmatch
+import hashlib
+import hmac
+import json
 import logging
+import os
+import random
+import signal
+import sys
+import urllib.parse
 
-import kubernetes.config as k8s_config
-import kubernetes.client as k8s_client
 import kopf
 
 from crds.monitor import MonitorV1Beta1, MonitorType
@@ -9,18 +17,43 @@ from crds.psp import PspV1Beta1
 from crds.maintenance_window import MaintenanceWindowV1Beta1
 from crds.alert_contact import AlertContactV1Beta1, AlertContactType
 from crds.constants import GROUP
-from k8s import K8s
-import uptimerobot 
+from crds.utils import crd_manifest, CRD_HASH_ANNOTATION, MANAGED_BY_LABEL, MANAGED_BY
+from k8s import K8s, AsyncK8s
+from inventory import Inventory, matches
+import uptimerobot
+import ratelimit
+import metrics
+import tracing
+import secret_cache
+import workqueue
+import coalescing
+import leader
+import sharding
 from config import Config
 
 MONITOR_ID_KEY = 'monitor_id'
 PSP_ID_KEY = 'psp_id'
 MW_ID_KEY = 'mw_id'
 AC_ID_KEY = 'ac_id'
+FINGERPRINT_KEY = 'fingerprint'
+FIELDS_KEY = 'fields'
+# changed when a referenced secret changes, causes the update handler to run
+SECRET_VERSION_ANNOTATION = f'{GROUP}/secret-version'
+# labels of the UptimeRobotMonitors created for an Ingress
+INGRESS_UID_LABEL = f'{GROUP}/ingress-uid'
+HOST_HASH_LABEL = f'{GROUP}/host-hash'
 
 config = Config()
 uptime_robot = None
 k8s = None
+inventory = Inventory()
+reconciliation = None
+election_task = None
+membership_task = None
+rebalancing = None
+# namespace patterns kopf watches, all namespaces if empty
+namespaces = []
+metrics_server = None
 
 
 # disable liveness check request logs
@@ -28,37 +61,63 @@ logging.getLogger('aiohttp.access').setLevel(logging.WARN)
 
 
 def create_crds(logger):
-    try:
-        k8s_config.load_kube_config()
-    except k8s_config.ConfigException:
-        k8s_config.load_incluster_config()
+    """creates or patches the CRDs whose installed version differs from the generated one"""
+    from kubernetes.client.rest import ApiException
+
+    api_instance = K8s.shared().apiextensions_api
+    installed = {
+        crd.metadata.name: (crd.metadata.annotations or {}).get(CRD_HASH_ANNOTATION)
+        for crd in api_instance.list_custom_resource_definition(label_selector=f'{MANAGED_BY_LABEL}={MANAGED_BY}').items
+    }
 
-    api_instance = k8s_client.ApiextensionsV1Api()
     for crd in [MonitorV1Beta1.crd, PspV1Beta1.crd, MaintenanceWindowV1Beta1.crd, AlertContactV1Beta1.crd]:
+        manifest = crd_manifest(crd)
+        name = manifest['metadata']['name']
+        if installed.get(name) == manifest['metadata']['annotations'][CRD_HASH_ANNOTATION]:
+            logger.debug(f'CRD {name} is up to date')
+            continue
+
         try:
-            api_instance.create_custom_resource_definition(crd)
-            logger.info(f'CRD {crd.metadata.name} successfully created')
-        except k8s_client.rest.ApiException as error:
+            api_instance.create_custom_resource_definition(manifest)
+            logger.info(f'CRD {name} successfully created')
+        except ApiException as error:
             if error.status == 409:
-                api_instance.patch_custom_resource_definition(
-                    name=crd.metadata.name, body=crd)
-                logger.debug(f'CRD {crd.metadata.name} successfully patched')
+                api_instance.patch_custom_resource_definition(name=name, body=manifest)
+                logger.info(f'CRD {name} successfully patched')
             else:
-                logger.error(f'CRD {crd.metadata.name} failed to create')
+                logger.error(f'CRD {name} failed to create')
                 raise error
 
 
-def init_uptimerobot_api(logger):
+async def init_uptimerobot_api(logger):
     global uptime_robot
     try:
-        uptime_robot = uptimerobot.create_uptimerobot_api()
+        uptime_robot = await uptimerobot.create_async_uptimerobot_api()
     except Exception as error:
         logger.error('failed to create UptimeRobot API')
         raise kopf.PermanentError(error)
 
 
-def create_monitor(logger, **kwargs):
-    resp = uptime_robot.new_monitor(
+async def load_inventory(logger):
+    try:
+        await inventory.refresh(uptime_robot)
+    except RuntimeError as error:
+        logger.warning(f'failed to load UptimeRobot inventory: {error}')
+        return
+
+    logger.info(f'loaded UptimeRobot inventory with {len(inventory.monitors)} monitors, {len(inventory.psps)} PSPs, '
+                f'{len(inventory.mwindows)} MWs and {len(inventory.alert_contacts)} ACs')
+
+
+def raise_for_error(message: str, error: dict):
+    if uptimerobot.is_temporary_error(error):
+        raise kopf.TemporaryError(f'{message}: {error}', delay=ratelimit.backoff.failure())
+
+    raise kopf.PermanentError(f'{message}: {error}')
+
+
+async def create_monitor(logger, **kwargs):
+    resp = await uptime_robot.new_monitor(
         **{k:str(v) for k,v in kwargs.items()}
         )
 
@@ -66,13 +125,14 @@ def create_monitor(logger, **kwargs):
         identifier = resp['monitor']['id']
         logger.info(
             f'monitor with ID {identifier} has been created successfully')
+        inventory.monitors.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to create monitor: {resp["error"]}')
+    raise_for_error('failed to create monitor', resp['error'])
 
 
-def update_monitor(logger, identifier, **kwargs):
-    resp = uptime_robot.edit_monitor(
+async def update_monitor(logger, identifier, **kwargs):
+    resp = await uptime_robot.edit_monitor(
         identifier,
         **{k:str(v) for k,v in kwargs.items()}
         )
@@ -81,27 +141,29 @@ def update_monitor(logger, identifier, **kwargs):
         identifier = resp['monitor']['id']
         logger.info(
             f'monitor with ID {identifier} has been updated successfully')
+        inventory.monitors.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to update monitor with ID {identifier}: {resp["error"]}')
+    raise_for_error(f'failed to update monitor with ID {identifier}', resp['error'])
 
 
-def delete_monitor(logger, identifier):
-    resp = uptime_robot.delete_monitor(identifier)
+async def delete_monitor(logger, identifier):
+    resp = await uptime_robot.delete_monitor(identifier)
     if resp['stat'] == 'ok':
         logger.info(
             f'monitor with ID {identifier} has been deleted successfully')
+        inventory.monitors.remove(identifier)
     else:
         if resp['error']['type'] == 'not_found':
             logger.info(
                 f'monitor with ID {identifier} has already been deleted')
+            inventory.monitors.remove(identifier)
             return
 
-        raise kopf.PermanentError(
-            f'failed to delete monitor with ID {identifier}: {resp["error"]}')
+        raise_for_error(f'failed to delete monitor with ID {identifier}', resp['error'])
 
-def create_psp(logger, **kwargs):
-    resp = uptime_robot.new_psp(
+async def create_psp(logger, **kwargs):
+    resp = await uptime_robot.new_psp(
         type='1',
         **{k:str(v) for k,v in kwargs.items()}
         )
@@ -110,13 +172,14 @@ def create_psp(logger, **kwargs):
         identifier = resp['psp']['id']
         logger.info(
             f'PSP with ID {identifier} has been created successfully')
+        inventory.psps.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to create PSP: {resp["error"]}')
+    raise_for_error('failed to create PSP', resp['error'])
 
 
-def update_psp(logger, identifier, **kwargs):
-    resp = uptime_robot.edit_psp(
+async def update_psp(logger, identifier, **kwargs):
+    resp = await uptime_robot.edit_psp(
         identifier,
         **{k:str(v) for k,v in kwargs.items()}
         )
@@ -125,27 +188,29 @@ def update_psp(logger, identifier, **kwargs):
         identifier = resp['psp']['id']
         logger.info(
             f'PSP with ID {identifier} has been updated successfully')
+        inventory.psps.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to update PSP with ID {identifier}: {resp["error"]}')
+    raise_for_error(f'failed to update PSP with ID {identifier}', resp['error'])
 
 
-def delete_psp(logger, identifier):
-    resp = uptime_robot.delete_psp(identifier)
+async def delete_psp(logger, identifier):
+    resp = await uptime_robot.delete_psp(identifier)
     if resp['stat'] == 'ok':
         logger.info(
             f'PSP with ID {identifier} has been deleted successfully')
+        inventory.psps.remove(identifier)
     else:
         if resp['error']['type'] == 'not_found':
             logger.info(
                 f'PSP with ID {identifier} has already been deleted')
+            inventory.psps.remove(identifier)
             return
 
-        raise kopf.PermanentError(
-            f'failed to delete PSP with ID {identifier}: {resp["error"]}')
+        raise_for_error(f'failed to delete PSP with ID {identifier}', resp['error'])
 
-def create_mw(logger, **kwargs):
-    resp = uptime_robot.new_m_window(
+async def create_mw(logger, **kwargs):
+    resp = await uptime_robot.new_m_window(
         **{k:str(v) for k,v in kwargs.items()}
         )
 
@@ -153,13 +218,14 @@ def create_mw(logger, **kwargs):
         identifier = resp['mwindow']['id']
         logger.info(
             f'MW with ID {identifier} has been created successfully')
+        inventory.mwindows.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to create MW: {resp["error"]}')
+    raise_for_error('failed to create MW', resp['error'])
 
 
-def update_mw(logger, identifier, **kwargs):
-    resp = uptime_robot.edit_m_window(
+async def update_mw(logger, identifier, **kwargs):
+    resp = await uptime_robot.edit_m_window(
         identifier,
         **{k:str(v) for k,v in kwargs.items()}
         )
@@ -168,27 +234,29 @@ def update_mw(logger, identifier, **kwargs):
         identifier = resp['mwindow']['id']
         logger.info(
             f'MW with ID {identifier} has been updated successfully')
+        inventory.mwindows.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to update MW with ID {identifier}: {resp["error"]}')
+    raise_for_error(f'failed to update MW with ID {identifier}', resp['error'])
 
 
-def delete_mw(logger, identifier):
-    resp = uptime_robot.delete_m_window(identifier)
+async def delete_mw(logger, identifier):
+    resp = await uptime_robot.delete_m_window(identifier)
     if resp['stat'] == 'ok':
         logger.info(
             f'MW with ID {identifier} has been deleted successfully')
+        inventory.mwindows.remove(identifier)
     else:
         if resp['error']['type'] == 'not_found':
             logger.info(
                 f'MW with ID {identifier} has already been deleted')
+            inventory.mwindows.remove(identifier)
             return
 
-        raise kopf.PermanentError(
-            f'failed to delete MW with ID {identifier}: {resp["error"]}')
+        raise_for_error(f'failed to delete MW with ID {identifier}', resp['error'])
 
-def create_ac(logger, **kwargs):
-    resp = uptime_robot.new_alert_contact(
+async def create_ac(logger, **kwargs):
+    resp = await uptime_robot.new_alert_contact(
         **{k:str(v) for k,v in kwargs.items()}
         )
 
@@ -196,13 +264,14 @@ def create_ac(logger, **kwargs):
         identifier = resp['alertcontact']['id']
         logger.info(
             f'AC with ID {identifier} has been created successfully')
+        inventory.alert_contacts.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to create AC: {resp["error"]}')
+    raise_for_error('failed to create AC', resp['error'])
 
 
-def update_ac(logger, identifier, **kwargs):
-    resp = uptime_robot.edit_alert_contact(
+async def update_ac(logger, identifier, **kwargs):
+    resp = await uptime_robot.edit_alert_contact(
         str(identifier),
         **{k:str(v) for k,v in kwargs.items()}
         )
@@ -211,24 +280,26 @@ def update_ac(logger, identifier, **kwargs):
         identifier = resp['alert_contact']['id']
         logger.info(
             f'AC with ID {identifier} has been updated successfully')
+        inventory.alert_contacts.upsert({'id': identifier, **kwargs})
         return identifier
 
-    raise kopf.PermanentError(f'failed to update AC with ID {identifier}: {resp["error"]}')
+    raise_for_error(f'failed to update AC with ID {identifier}', resp['error'])
 
 
-def delete_ac(logger, identifier):
-    resp = uptime_robot.delete_alert_contact(str(identifier))
+async def delete_ac(logger, identifier):
+    resp = await uptime_robot.delete_alert_contact(str(identifier))
     if resp['stat'] == 'ok':
         logger.info(
             f'AC with ID {identifier} has been deleted successfully')
+        inventory.alert_contacts.remove(identifier)
     else:
         if resp['error']['type'] == 'not_found':
             logger.info(
                 f'AC with ID {identifier} has already been deleted')
+            inventory.alert_contacts.remove(identifier)
             return
 
-        raise kopf.PermanentError(
-            f'failed to delete AC with ID {identifier}: {resp["error"]}')
+        raise_for_error(f'failed to delete AC with ID {identifier}', resp['error'])
 
 def type_changed(diff: list):
     try:
@@ -240,6 +311,82 @@ def type_changed(diff: list):
     return False
 
 
+def fingerprint(payload: dict) -> str:
+    """hash of the last applied request payload, allows to skip no-op updates
+
+    The payload contains the values of referenced Secrets, so the hash is
+    keyed with the API key. Without it, anyone able to read the resource
+    could guess the Secret values offline by comparing hashes.
+    """
+    key = os.getenv('UPTIMEROBOT_API_KEY', '').encode()
+    return hmac.new(key, json.dumps(payload, sort_keys=True, default=str).encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def field_hashes(payload: dict) -> dict:
+    """short keyed hash of every request parameter, allows to send only the
+    changed parameters"""
+    return {key: fingerprint(value)[:8] for key, value in payload.items()}
+
+
+def get_fingerprint(status: dict, update_handler, create_handler, key: str = FINGERPRINT_KEY):
+    for handler in [update_handler, create_handler]:
+        if handler.__name__ in status:
+            return status[handler.__name__].get(key)
+
+    return None
+
+
+def changed_fields(status: dict, update_handler, create_handler, payload: dict, coupled_fields: list) -> dict:
+    """returns the parameters of payload that differ from the last applied request
+
+    UptimeRobot keeps parameters that are missing in an edit request, so the
+    full payload is returned if a parameter has been removed or the hashes of
+    the last request are unknown. Coupled parameters are only sent together.
+    """
+    applied = get_fingerprint(status, update_handler, create_handler, FIELDS_KEY)
+    if applied is None or set(applied) - set(payload):
+        return payload
+
+    hashes = field_hashes(payload)
+    changed = {key for key in payload if applied.get(key) != hashes[key]}
+    for fields in coupled_fields:
+        if changed & fields:
+            changed |= fields & payload.keys()
+
+    return {key: value for key, value in payload.items() if key in changed}
+
+
+def applied_type_changed(status: dict, update_handler, create_handler, payload: dict, diff: list) -> bool:
+    """returns whether the type differs from the last applied request
+
+    kopf's diff only covers the changes since the last handled state, which
+    misses a type change of a skipped outdated update. Objects applied before
+    the hashes of the parameters were stored fall back to the diff.
+    """
+    applied = get_fingerprint(status, update_handler, create_handler, FIELDS_KEY)
+    if applied is None or 'type' not in applied:
+        return type_changed(diff)
+
+    return applied['type'] != field_hashes(payload).get('type')
+
+
+def ac_value_changed(status: dict, identifier, payload: dict, force: bool) -> bool:
+    """editAlertContact only changes the value of WEB_HOOK alert contacts,
+    other alert contacts have to be recreated for a new value, which changes
+    their ID in the monitors using them"""
+    if force:  # drift repairs compare with the account
+        item = inventory.alert_contacts.get(identifier)
+        return item is None or not matches(item, {'value': payload.get('value')})
+
+    return 'value' in changed_fields(status, on_ac_update, on_ac_create, payload, [])
+
+
+def is_unchanged(status: dict, update_handler, create_handler, payload: dict) -> bool:
+    unchanged = get_fingerprint(status, update_handler, create_handler) == fingerprint(payload)
+    metrics.CACHE_LOOKUPS.labels('fingerprint', 'hit' if unchanged else 'miss').inc()
+    return unchanged
+
+
 # TODO merge get_identifier functions
 def get_identifier(status: dict):
     if on_update.__name__ in status:
@@ -277,26 +424,177 @@ def get_ac_identifier(status: dict):
 
     raise KeyError(AC_ID_KEY)
 
+def setup_kubernetes(logger) -> K8s:
+    shared = K8s.shared()
+    if config.DISABLE_CRD_MANAGEMENT:
+        logger.info('management of CRDs has been disabled')
+    else:
+        create_crds(logger)
+    return shared
+
 @kopf.on.startup()
-def startup(logger, **_):
-    if config.DISABLE_INGRESS_HANDLING:
-        logger.info('handling of Ingress resources has been disabled')
+async def startup(logger, settings: kopf.OperatorSettings, **_):
+    tracing.setup(config.TRACING_EXPORTER, config.TRACING_FILE)
 
-    global k8s
-    k8s = K8s()
-    init_uptimerobot_api(logger)
-    create_crds(logger)
+    # the periodic reconciliation only lists the namespaces kopf watches
+    global namespaces
+    namespaces = watched_namespaces(sys.argv)
 
-@kopf.on.create('networking.k8s.io', 'v1', 'ingresses')
-def on_ingress_create(name: str, namespace: str, annotations: dict, spec: dict, logger, **_):
     if config.DISABLE_INGRESS_HANDLING:
-        logger.debug('handling of Ingress resources has been disabled')
+        logger.info('handling of Ingress resources has been disabled')
+
+    global k8s, metrics_server
+    if config.METRICS_PORT:
+        metrics_server = await metrics.serve(config.METRICS_PORT)
+        metrics.track_rate_limiter(ratelimit.limiter)
+
+    # loading the Kubernetes client and the CRDs overlaps with connecting to UptimeRobot
+    kubernetes_ready = asyncio.get_running_loop().run_in_executor(None, setup_kubernetes, logger)
+    await init_uptimerobot_api(logger)
+    if not config.SHARDING:  # with sharding every replica only reads the objects it owns when rebalancing
+        await load_inventory(logger)
+    k8s = AsyncK8s(await kubernetes_ready, config.K8S_CONCURRENCY)
+
+    if config.SHARDING:
+        global membership_task
+        sharding.membership = sharding.Membership(
+            k8s.k8s, config.LEASE_NAMESPACE, config.LEASE_NAME, config.POD_NAME, config.LEASE_DURATION)
+        # the ring has to be known before kopf hands over the first objects
+        await asyncio.get_running_loop().run_in_executor(None, sharding.membership.join)
+        settings.persistence.finalizer = sharding.membership.finalizer
+        membership_task = asyncio.create_task(sharding.membership.run(lambda: on_ring_change(logger), stop_operator))
+        logger.info(f'handling the objects of {sharding.membership.slot} in shard ring {config.LEASE_NAME} '
+                    f'with {len(sharding.membership.ring.members)} members')
+        on_ring_change(logger)
+    elif config.LEADER_ELECTION:
+        # handlers wait for the leadership, kopf keeps watching in the meantime
+        global election_task
+        leader.election = leader.LeaderElection(
+            k8s.k8s, config.LEASE_NAMESPACE, config.LEASE_NAME, config.POD_NAME, config.LEASE_DURATION,
+            on_elected=lambda: load_inventory(logger))
+        election_task = asyncio.create_task(leader.election.run(stop_operator))
+        logger.info(f'waiting for the leadership of Lease {config.LEASE_NAMESPACE}/{config.LEASE_NAME} as {config.POD_NAME}')
+
+    if config.RECONCILE_INTERVAL > 0:
+        global reconciliation
+        reconciliation = asyncio.create_task(reconcile_periodically(logger))
+
+def stop_operator():
+    # kopf shuts down gracefully on SIGTERM, the pod is restarted as standby
+    os.kill(os.getpid(), signal.SIGTERM)
+
+@kopf.on.cleanup()
+async def cleanup(logger, **_):
+    if reconciliation is not None:
+        reconciliation.cancel()
+
+    if membership_task is not None:
+        membership_task.cancel()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, sharding.membership.leave)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(f'failed to leave shard ring: {error}')
+
+    if election_task is not None:
+        election_task.cancel()
+        if leader.election.leading:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, leader.election.release)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.warning(f'failed to release Lease: {error}')
+
+    if metrics_server is not None:
+        await metrics_server.cleanup()
+
+    if uptime_robot is not None:
+        for route, stats in uptime_robot.stats.items():
+            logger.debug(f'{route}: {stats.count} requests, {stats.errors} errors, mean latency {stats.mean_seconds:.3f}s, max latency {stats.max_seconds:.3f}s')
+        await uptime_robot.close()
+
+@kopf.on.event('', 'v1', 'namespaces')
+@metrics.timed('Namespace', 'event')
+@tracing.traced('Namespace', 'event')
+async def on_namespace_event(event: dict, name: str, annotations: dict, logger, **_):
+    policy = workqueue.NamespacePolicy.from_annotations(annotations)
+    if event['type'] == 'DELETED' or policy == workqueue.DEFAULT_POLICY:
+        workqueue.policies.pop(name, None)
+    elif workqueue.policies.get(name) != policy:
+        logger.info(f'scheduling operations of namespace {name} with weight {policy.weight}, '
+                    f'concurrency {policy.concurrency or "unlimited"}, rate limit {policy.rate_limit or "unlimited"}')
+        workqueue.policies[name] = policy
+
+def is_referenced_secret(namespace: str, name: str, **_):
+    return (namespace, name) in secret_cache.cache
+
+@kopf.on.event('', 'v1', 'secrets', when=is_referenced_secret)
+@leader.required
+@metrics.timed('Secret', 'event')
+@tracing.traced('Secret', 'event')
+@workqueue.namespaced
+async def on_secret_event(event: dict, namespace: str, name: str, body: dict, logger, **_):
+    if event['type'] == 'DELETED':
+        secret_cache.cache.remove(namespace, name)
         return
 
+    for crd, dependent_namespace, dependent_name in secret_cache.cache.update(namespace, name, dict(body.get('data') or {})):
+        if not sharding.owns(dependent_namespace, dependent_name):  # moved to another replica
+            continue
+
+        logger.info(f'secret {name} has changed, updating {crd.kind} {dependent_namespace}/{dependent_name}')
+        await k8s.update_k8s_crd_obj_with_body(crd, dependent_namespace, dependent_name, {
+            'metadata': {'annotations': {SECRET_VERSION_ANNOTATION: body['metadata']['resourceVersion']}}
+        })
+
+def host_hash(host: str) -> str:
+    return hashlib.sha1(host.encode()).hexdigest()[:8]
+
+
+def monitor_annotations(annotations: dict) -> dict:
+    """returns the spec of the monitors of an Ingress set with annotations"""
     monitor_prefix = f'{GROUP}/monitor.'
-    monitor_spec = {k.replace(monitor_prefix, ''): v for k, v in annotations.items() if k.startswith(monitor_prefix)}
+    return {k.replace(monitor_prefix, ''): v for k, v in annotations.items() if k.startswith(monitor_prefix)}
+
+
+def ingress_state(spec: dict, annotations: dict):
+    return dict(spec), monitor_annotations(annotations)
+
+
+def crd_state(spec: dict, annotations: dict):
+    return dict(spec)
+
+
+async def get_or_none(get, *args):
+    from kubernetes.client.rest import ApiException
+
+    try:
+        return await get(*args)
+    except ApiException as error:
+        if error.status == 404:
+            return None
+        raise
+
+
+async def fetch_ingress(namespace: str, name: str):
+    return await get_or_none(k8s.get_ingress, namespace, name)
+
+
+def crd_fetcher(crd):
+    async def fetch(namespace: str, name: str):
+        return await get_or_none(k8s.get_k8s_crd_obj, crd, namespace, name)
+    return fetch
 
-    index = 0
+
+def construct_ingress_monitor_bodies(namespace: str, name: str, uid: str, annotations: dict, spec: dict) -> list:
+    """returns a host and UptimeRobotMonitor body for each host of the Ingress
+
+    Monitors are named after the host, so reordering the rules does not
+    change any monitor.
+    """
+    monitor_spec = monitor_annotations(annotations)
+    owner = {'apiVersion': 'networking.k8s.io/v1', 'kind': 'Ingress', 'metadata': {'namespace': namespace, 'name': name, 'uid': uid}}
+
+    monitors = []
+    hosts = set()
     for rule in spec['rules']:
         if 'host' not in rule:
             continue
@@ -305,6 +603,9 @@ def on_ingress_create(name: str, namespace: str, annotations: dict, spec: dict,
             continue
 
         host = rule['host']
+        if host in hosts:  # a host with multiple rules gets a single monitor
+            continue
+        hosts.add(host)
 
         # we default to a ping check
         if 'type' not in monitor_spec:
@@ -318,159 +619,297 @@ def on_ingress_create(name: str, namespace: str, annotations: dict, spec: dict,
             monitor_spec['url'] = host
 
         monitor_body = MonitorV1Beta1.construct_k8s_ur_monitor_body(
-            namespace, name=f"{name}-{index}", **MonitorV1Beta1.annotations_to_spec_dict(monitor_spec))
-        kopf.adopt(monitor_body)
+            namespace, name=f"{name}-{host_hash(host)}", **MonitorV1Beta1.annotations_to_spec_dict(monitor_spec))
+        monitor_body['metadata']['labels'] = {INGRESS_UID_LABEL: uid, HOST_HASH_LABEL: host_hash(host)}
+        # passed explicitly, rebalancing applies the monitors outside of the Ingress handlers
+        kopf.adopt(monitor_body, owner=owner)
+        tracing.inject(monitor_body['metadata'].setdefault('annotations', {}))
+        monitors.append((host, monitor_body))
+
+    return monitors
+
+
+def is_owned_by(obj: dict, uid: str) -> bool:
+    return any(reference.get('uid') == uid for reference in obj['metadata'].get('ownerReferences', []))
+
+
+def monitor_host_hash(obj: dict) -> str:
+    """returns the host hash of an UptimeRobotMonitor of an Ingress, monitors
+    created by earlier versions lack the label and are matched by their URL"""
+    labels = obj['metadata'].get('labels') or {}
+    if HOST_HASH_LABEL in labels:
+        return labels[HOST_HASH_LABEL]
+
+    url = obj['spec'].get('url', '')
+    return host_hash(urllib.parse.urlsplit(url).hostname if '://' in url else url)
+
+
+async def apply_ingress_monitors(namespace: str, name: str, uid: str, annotations: dict, spec: dict, logger,
+                                 include_unlabeled: bool = False):
+    """brings the UptimeRobotMonitors of an Ingress in line with its hosts,
+    only monitors that are missing or whose spec differs are written
+
+    With include_unlabeled also monitors that have been created by earlier
+    versions of the operator, named by rule index and without labels, are
+    taken into account. They are matched by their URL and labeled in place,
+    keeping their name and the UptimeRobot monitor behind it.
+    """
+    desired = construct_ingress_monitor_bodies(namespace, name, uid, annotations, spec)
+    objs = await k8s.list_namespaced_k8s_crd_objs(MonitorV1Beta1, namespace, f'{INGRESS_UID_LABEL}={uid}')
+    if include_unlabeled:
+        # only monitors without the label, so the cost doesn't grow with the monitors once they are migrated
+        objs += [obj for obj in await k8s.list_namespaced_k8s_crd_objs(MonitorV1Beta1, namespace, f'!{INGRESS_UID_LABEL}')
+                 if is_owned_by(obj, uid)]
+
+    current = {}
+    obsolete = []
+    for obj in objs:
+        if monitor_host_hash(obj) in current:  # earlier versions created a monitor per rule
+            obsolete.append(obj['metadata']['name'])
+        else:
+            current[monitor_host_hash(obj)] = obj
+
+    changed = []
+    for host, monitor_body in desired:
+        obj = current.pop(host_hash(host), None)
+        if obj is None:
+            changed.append((host, monitor_body))
+            continue
+
+        monitor_body['metadata']['name'] = obj['metadata']['name']
+        labels = obj['metadata'].get('labels') or {}
+        if obj['spec'] != monitor_body['spec'] or \
+                any(labels.get(key) != value for key, value in monitor_body['metadata']['labels'].items()):
+            changed.append((host, monitor_body))
+    obsolete.extend(obj['metadata']['name'] for obj in current.values())
+
+    async def apply(host, monitor_body):
+        await k8s.apply_k8s_crd_obj_with_body(MonitorV1Beta1, namespace, monitor_body['metadata']['name'], monitor_body)
+        logger.info(f'applied UptimeRobotMonitor object for URL {host}')
 
-        k8s.create_k8s_crd_obj_with_body(MonitorV1Beta1, namespace, monitor_body)
-        logger.info(f'created new UptimeRobotMonitor object for URL {host}')
-        index += 1
+    async def delete(monitor_name):
+        await k8s.delete_k8s_crd_obj(MonitorV1Beta1, namespace, monitor_name)
+        logger.info(f'deleted obsolete UptimeRobotMonitor object {monitor_name}')
+
+    await asyncio.gather(
+        *[apply(host, monitor_body) for host, monitor_body in changed],
+        *[delete(monitor_name) for monitor_name in obsolete]
+    )
 
 
-@kopf.on.update('networking.k8s.io', 'v1', 'ingresses')
-def on_ingress_update(name: str, namespace: str, annotations: dict, spec: dict, old: dict, logger, **_):
+@kopf.on.create('networking.k8s.io', 'v1', 'ingresses', when=sharding.owns)
+@leader.required
+@metrics.timed('Ingress', 'create')
+@tracing.traced('Ingress', 'create')
+@workqueue.namespaced
+async def on_ingress_create(name: str, namespace: str, uid: str, annotations: dict, spec: dict, logger, **_):
     if config.DISABLE_INGRESS_HANDLING:
         logger.debug('handling of Ingress resources has been disabled')
         return
 
-    monitor_prefix = f'{GROUP}/monitor.'
-    monitor_spec = {k.replace(monitor_prefix, ''): v for k, v in annotations.items() if k.startswith(monitor_prefix)}
+    await apply_ingress_monitors(namespace, name, uid, annotations, spec, logger)
 
-    previous_rule_count = len(old['spec']['rules'])
-    index = 0
 
-    for rule in spec['rules']:
-        if 'host' not in rule:
-            continue
-
-        if rule['host'].startswith('*'):  # filter out wildcard domains
-            continue
+@kopf.on.resume('networking.k8s.io', 'v1', 'ingresses', when=sharding.owns)
+@leader.required
+@metrics.timed('Ingress', 'resume')
+@tracing.traced('Ingress', 'resume')
+@workqueue.namespaced
+async def on_ingress_resume(name: str, namespace: str, uid: str, annotations: dict, spec: dict, logger, **_):
+    if config.DISABLE_INGRESS_HANDLING:
+        logger.debug('handling of Ingress resources has been disabled')
+        return
 
-        host = rule['host']
+    await apply_ingress_monitors(namespace, name, uid, annotations, spec, logger, include_unlabeled=True)
 
-        # we default to a ping check
-        if 'type' not in monitor_spec:
-            monitor_spec['type'] = MonitorType.PING.name
 
-        if monitor_spec['type'] == 'HTTP':
-            monitor_spec['url'] = f"http://{host}"
-        elif monitor_spec['type'] == 'HTTPS':
-            monitor_spec['url'] = f"https://{host}"
-        else:
-            monitor_spec['url'] = host
+@kopf.on.update('networking.k8s.io', 'v1', 'ingresses', when=sharding.owns)
+@leader.required
+@metrics.timed('Ingress', 'update')
+@tracing.traced('Ingress', 'update')
+@workqueue.namespaced
+@coalescing.coalesced('Ingress', fetch_ingress, ingress_state)
+async def on_ingress_update(name: str, namespace: str, uid: str, annotations: dict, spec: dict, logger, **_):
+    if config.DISABLE_INGRESS_HANDLING:
+        logger.debug('handling of Ingress resources has been disabled')
+        return
 
-        monitor_name = f"{name}-{index}"
+    await apply_ingress_monitors(namespace, name, uid, annotations, spec, logger)
 
-        monitor_body = MonitorV1Beta1.construct_k8s_ur_monitor_body(
-            namespace, name=monitor_name, **MonitorV1Beta1.annotations_to_spec_dict(monitor_spec))
-        kopf.adopt(monitor_body)
-
-        if index >= previous_rule_count:  # at first update existing UptimeRobotMonitors, we currently don't check if there's actually a change
-            k8s.create_k8s_crd_obj_with_body(MonitorV1Beta1, namespace, monitor_body)
-            logger.info(f'created new UptimeRobotMonitor object for URL {host}')
-        else:  # then create new UptimeRobotMonitors
-            k8s.update_k8s_crd_obj_with_body(MonitorV1Beta1, namespace, monitor_name, monitor_body)
-            logger.info(f'updated UptimeRobotMonitor object for URL {host}')
-
-        index += 1
-
-    while index < previous_rule_count:  # make sure to clean up remaining UptimeRobotMonitors
-        k8s.delete_k8s_crd_obj(MonitorV1Beta1, namespace, f"{name}-{index}")
-        logger.info('deleted obsolete UptimeRobotMonitor object')
-        index += 1
-
-@kopf.on.create(GROUP, MonitorV1Beta1.version, MonitorV1Beta1.plural)
-def on_create(namespace: str, name: str, spec: dict, logger, **_):
-    identifier = create_monitor(
+@kopf.on.create(GROUP, MonitorV1Beta1.version, MonitorV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(MonitorV1Beta1.kind, 'create')
+@tracing.traced(MonitorV1Beta1.kind, 'create')
+@workqueue.namespaced
+async def on_create(namespace: str, name: str, spec: dict, logger, **_):
+    payload = await spec_to_request_dict(MonitorV1Beta1, namespace, name, spec)
+    identifier = await create_monitor(
         logger,
-        **MonitorV1Beta1.spec_to_request_dict(namespace, name, spec)
+        **payload
     )
 
-    return {MONITOR_ID_KEY: identifier}
+    return {MONITOR_ID_KEY: identifier, FINGERPRINT_KEY: fingerprint(payload), FIELDS_KEY: field_hashes(payload)}
 
-@kopf.on.update(GROUP, MonitorV1Beta1.version, MonitorV1Beta1.plural)
-def on_update(namespace: str, name: str, spec: dict, status: dict, diff: list, logger, **_):
+@kopf.on.update(GROUP, MonitorV1Beta1.version, MonitorV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(MonitorV1Beta1.kind, 'update')
+@tracing.traced(MonitorV1Beta1.kind, 'update')
+@workqueue.namespaced
+@coalescing.coalesced(MonitorV1Beta1.kind, crd_fetcher(MonitorV1Beta1), crd_state)
+async def on_update(namespace: str, name: str, spec: dict, status: dict, diff: list, logger, force: bool = False, **_):
     try:
         identifier = get_identifier(status)
     except KeyError as error:
         raise kopf.PermanentError(
             "was not able to determine the monitor ID for update") from error
 
-    if type_changed(diff):
+    payload = await spec_to_request_dict(MonitorV1Beta1, namespace, name, spec)
+
+    if applied_type_changed(status, on_update, on_create, payload, diff):
         logger.info('monitor type changed, need to delete and recreate')
-        delete_monitor(logger, identifier)
+        await delete_monitor(logger, identifier)
 
-        identifier = create_monitor(
+        identifier = await create_monitor(
             logger,
-            **MonitorV1Beta1.spec_to_request_dict(namespace, name, spec)
+            **payload
+        )
+    elif not force and is_unchanged(status, on_update, on_create, payload):
+        logger.info('monitor is already up to date, skipping update')
+    elif force:  # drift repairs can't rely on the last applied request
+        identifier = await update_monitor(
+            logger,
+            identifier,
+            **payload
         )
     else:
-        identifier = update_monitor(
+        identifier = await update_monitor(
             logger,
             identifier,
-            **MonitorV1Beta1.spec_to_request_dict(namespace, name, spec)
+            **changed_fields(status, on_update, on_create, payload, MonitorV1Beta1.coupled_fields)
         )
 
-    return {MONITOR_ID_KEY: identifier}
+    return {MONITOR_ID_KEY: identifier, FINGERPRINT_KEY: fingerprint(payload), FIELDS_KEY: field_hashes(payload)}
+
 
+@kopf.on.resume(GROUP, MonitorV1Beta1.version, MonitorV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(MonitorV1Beta1.kind, 'resume')
+@tracing.traced(MonitorV1Beta1.kind, 'resume')
+@workqueue.namespaced
+async def on_resume(body: dict, logger, **_):
+    await verify_on_resume(logger, MonitorV1Beta1, body)
 
-@kopf.on.delete(GROUP, MonitorV1Beta1.version, MonitorV1Beta1.plural)
-def on_delete(status: dict, logger, **_):
+@kopf.on.delete(GROUP, MonitorV1Beta1.version, MonitorV1Beta1.plural, when=sharding.finalizes)
+@leader.required
+@metrics.timed(MonitorV1Beta1.kind, 'delete')
+@tracing.traced(MonitorV1Beta1.kind, 'delete')
+@workqueue.namespaced
+async def on_delete(namespace: str, name: str, status: dict, logger, **_):
+    secret_cache.cache.forget((MonitorV1Beta1, namespace, name))
     try:  # making sure to catch all exceptions here to prevent blocking deletion
         identifier = get_identifier(status)
-        delete_monitor(logger, identifier)
+        await delete_monitor(logger, identifier)
     except KeyError as error:
         raise kopf.PermanentError(
             "was not able to determine the monitor ID for deletion") from error
+    except kopf.TemporaryError:  # retry later, the object still exists at UptimeRobot
+        raise
     except Exception as error:
         raise kopf.PermanentError(f"deleting monitor failed: {error}") from error
 
-@kopf.on.create(GROUP, MonitorV1Beta1.version, PspV1Beta1.plural)
-def on_psp_create(namespace: str, name: str, spec: dict, logger, **_):
-    identifier = create_psp(
+@kopf.on.create(GROUP, MonitorV1Beta1.version, PspV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(PspV1Beta1.kind, 'create')
+@tracing.traced(PspV1Beta1.kind, 'create')
+@workqueue.namespaced
+async def on_psp_create(namespace: str, name: str, spec: dict, logger, **_):
+    payload = await spec_to_request_dict(PspV1Beta1, namespace, name, spec)
+    identifier = await create_psp(
         logger,
-        **PspV1Beta1.spec_to_request_dict(namespace, name, spec)
+        **payload
     )
 
-    return {PSP_ID_KEY: identifier}
+    return {PSP_ID_KEY: identifier, FINGERPRINT_KEY: fingerprint(payload), FIELDS_KEY: field_hashes(payload)}
 
-@kopf.on.update(GROUP, MonitorV1Beta1.version, PspV1Beta1.plural)
-def on_psp_update(namespace: str, name: str, spec: dict, status: dict, logger, **_):
+@kopf.on.update(GROUP, MonitorV1Beta1.version, PspV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(PspV1Beta1.kind, 'update')
+@tracing.traced(PspV1Beta1.kind, 'update')
+@workqueue.namespaced
+@coalescing.coalesced(PspV1Beta1.kind, crd_fetcher(PspV1Beta1), crd_state)
+async def on_psp_update(namespace: str, name: str, spec: dict, status: dict, logger, force: bool = False, **_):
     try:
         identifier = get_psp_identifier(status)
     except KeyError as error:
         raise kopf.PermanentError(
             "was not able to determine the PSP ID for update") from error
 
-    identifier = update_psp(
-        logger,
-        identifier,
-        **PspV1Beta1.spec_to_request_dict(namespace, name, spec)
-    )
+    payload = await spec_to_request_dict(PspV1Beta1, namespace, name, spec)
 
-    return {PSP_ID_KEY: identifier}
+    if not force and is_unchanged(status, on_psp_update, on_psp_create, payload):
+        logger.info('PSP is already up to date, skipping update')
+    elif force:  # drift repairs can't rely on the last applied request
+        identifier = await update_psp(
+            logger,
+            identifier,
+            **payload
+        )
+    else:
+        identifier = await update_psp(
+            logger,
+            identifier,
+            **changed_fields(status, on_psp_update, on_psp_create, payload, PspV1Beta1.coupled_fields)
+        )
 
-@kopf.on.delete(GROUP, MonitorV1Beta1.version, PspV1Beta1.plural)
-def on_psp_delete(status: dict, logger, **_):
+    return {PSP_ID_KEY: identifier, FINGERPRINT_KEY: fingerprint(payload), FIELDS_KEY: field_hashes(payload)}
+
+@kopf.on.resume(GROUP, MonitorV1Beta1.version, PspV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(PspV1Beta1.kind, 'resume')
+@tracing.traced(PspV1Beta1.kind, 'resume')
+@workqueue.namespaced
+async def on_psp_resume(body: dict, logger, **_):
+    await verify_on_resume(logger, PspV1Beta1, body)
+
+@kopf.on.delete(GROUP, MonitorV1Beta1.version, PspV1Beta1.plural, when=sharding.finalizes)
+@leader.required
+@metrics.timed(PspV1Beta1.kind, 'delete')
+@tracing.traced(PspV1Beta1.kind, 'delete')
+@workqueue.namespaced
+async def on_psp_delete(namespace: str, name: str, status: dict, logger, **_):
+    secret_cache.cache.forget((PspV1Beta1, namespace, name))
     try:  # making sure to catch all exceptions here to prevent blocking deletion
         identifier = get_psp_identifier(status)
-        delete_psp(logger, identifier)
+        await delete_psp(logger, identifier)
     except KeyError as error:
         raise kopf.PermanentError(
             "was not able to determine the PSP ID for deletion") from error
+    except kopf.TemporaryError:  # retry later, the object still exists at UptimeRobot
+        raise
     except Exception as error:
         raise kopf.PermanentError(f"deleting PSP failed: {error}") from error
 
-@kopf.on.create(GROUP, MonitorV1Beta1.version, MaintenanceWindowV1Beta1.plural)
-def on_mw_create(name: str, spec: dict, logger, **_):
-    identifier = create_mw(
+@kopf.on.create(GROUP, MonitorV1Beta1.version, MaintenanceWindowV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(MaintenanceWindowV1Beta1.kind, 'create')
+@tracing.traced(MaintenanceWindowV1Beta1.kind, 'create')
+@workqueue.namespaced
+async def on_mw_create(name: str, spec: dict, logger, **_):
+    payload = MaintenanceWindowV1Beta1.spec_to_request_dict(name, spec)
+    identifier = await create_mw(
         logger,
-        **MaintenanceWindowV1Beta1.spec_to_request_dict(name, spec)
+        **payload
     )
 
-    return {MW_ID_KEY: identifier}
+    return {MW_ID_KEY: identifier, FINGERPRINT_KEY: fingerprint(payload), FIELDS_KEY: field_hashes(payload)}
 
-@kopf.on.update(GROUP, MonitorV1Beta1.version, MaintenanceWindowV1Beta1.plural)
-def on_mw_update(name: str, spec: dict, status: dict, logger, diff: dict, **_):
+@kopf.on.update(GROUP, MonitorV1Beta1.version, MaintenanceWindowV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(MaintenanceWindowV1Beta1.kind, 'update')
+@tracing.traced(MaintenanceWindowV1Beta1.kind, 'update')
+@workqueue.namespaced
+@coalescing.coalesced(MaintenanceWindowV1Beta1.kind, crd_fetcher(MaintenanceWindowV1Beta1), crd_state)
+async def on_mw_update(name: str, spec: dict, status: dict, logger, diff: dict, force: bool = False, **_):
     try:
         identifier = get_mw_identifier(status)
     except KeyError as error:
@@ -478,48 +917,77 @@ def on_mw_update(name: str, spec: dict, status: dict, logger, diff: dict, **_):
             "was not able to determine the MW ID for update") from error
 
     update_payload = MaintenanceWindowV1Beta1.spec_to_request_dict(name, spec)
+    update_fingerprint, update_fields = fingerprint(update_payload), field_hashes(update_payload)
+    recreate = applied_type_changed(status, on_mw_update, on_mw_create, update_payload, diff)
 
-    if type_changed(diff):
+    if not force and not recreate and is_unchanged(status, on_mw_update, on_mw_create, update_payload):
+        logger.info('MW is already up to date, skipping update')
+    elif recreate:
         logger.info('maintenance window type changed, need to delete and recreate')
-        delete_mw(logger, identifier)
+        await delete_mw(logger, identifier)
 
-        identifier = create_mw(
+        identifier = await create_mw(
             logger,
             **update_payload
         )
     else:
+        # editMWindow replaces the whole window, so it always gets the full payload
         update_payload.pop('type', None) # update does not accept type parameter
 
-        identifier = update_mw(
+        identifier = await update_mw(
             logger,
             identifier,
             **update_payload
         )
 
-    return {MW_ID_KEY: identifier}
-
-@kopf.on.delete(GROUP, MonitorV1Beta1.version, MaintenanceWindowV1Beta1.plural)
-def on_mw_delete(status: dict, logger, **_):
+    return {MW_ID_KEY: identifier, FINGERPRINT_KEY: update_fingerprint, FIELDS_KEY: update_fields}
+
+@kopf.on.resume(GROUP, MonitorV1Beta1.version, MaintenanceWindowV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(MaintenanceWindowV1Beta1.kind, 'resume')
+@tracing.traced(MaintenanceWindowV1Beta1.kind, 'resume')
+@workqueue.namespaced
+async def on_mw_resume(body: dict, logger, **_):
+    await verify_on_resume(logger, MaintenanceWindowV1Beta1, body)
+
+@kopf.on.delete(GROUP, MonitorV1Beta1.version, MaintenanceWindowV1Beta1.plural, when=sharding.finalizes)
+@leader.required
+@metrics.timed(MaintenanceWindowV1Beta1.kind, 'delete')
+@tracing.traced(MaintenanceWindowV1Beta1.kind, 'delete')
+@workqueue.namespaced
+async def on_mw_delete(status: dict, logger, **_):
     try:  # making sure to catch all exceptions here to prevent blocking deletion
         identifier = get_mw_identifier(status)
-        delete_mw(logger, identifier)
+        await delete_mw(logger, identifier)
     except KeyError as error:
         raise kopf.PermanentError(
             "was not able to determine the MW ID for deletion") from error
+    except kopf.TemporaryError:  # retry later, the object still exists at UptimeRobot
+        raise
     except Exception as error:
         raise kopf.PermanentError(f"deleting MW failed: {error}") from error
 
-@kopf.on.create(GROUP, MonitorV1Beta1.version, AlertContactV1Beta1.plural)
-def on_ac_create(name: str, spec: dict, logger, **_):
-    identifier = create_ac(
+@kopf.on.create(GROUP, MonitorV1Beta1.version, AlertContactV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(AlertContactV1Beta1.kind, 'create')
+@tracing.traced(AlertContactV1Beta1.kind, 'create')
+@workqueue.namespaced
+async def on_ac_create(name: str, spec: dict, logger, **_):
+    payload = AlertContactV1Beta1.spec_to_request_dict(name, spec)
+    identifier = await create_ac(
         logger,
-        **AlertContactV1Beta1.spec_to_request_dict(name, spec)
+        **payload
     )
 
-    return {AC_ID_KEY: identifier}
+    return {AC_ID_KEY: identifier, FINGERPRINT_KEY: fingerprint(payload), FIELDS_KEY: field_hashes(payload)}
 
-@kopf.on.update(GROUP, MonitorV1Beta1.version, AlertContactV1Beta1.plural)
-def on_ac_update(name: str, spec: dict, status: dict, logger, diff: dict, **_):
+@kopf.on.update(GROUP, MonitorV1Beta1.version, AlertContactV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(AlertContactV1Beta1.kind, 'update')
+@tracing.traced(AlertContactV1Beta1.kind, 'update')
+@workqueue.namespaced
+@coalescing.coalesced(AlertContactV1Beta1.kind, crd_fetcher(AlertContactV1Beta1), crd_state)
+async def on_ac_update(name: str, spec: dict, status: dict, logger, diff: dict, force: bool = False, **_):
     try:
         identifier = get_ac_identifier(status)
     except KeyError as error:
@@ -527,33 +995,352 @@ def on_ac_update(name: str, spec: dict, status: dict, logger, diff: dict, **_):
             "was not able to determine the AC ID for update") from error
 
     update_payload = AlertContactV1Beta1.spec_to_request_dict(name, spec)
+    update_fingerprint, update_fields = fingerprint(update_payload), field_hashes(update_payload)
+    recreate = applied_type_changed(status, on_ac_update, on_ac_create, update_payload, diff)
 
-    if type_changed(diff) or spec['type'] != AlertContactType.WEB_HOOK.name:
-        logger.info('alert contact type changed or is not of type WEB_HOOK, need to delete and recreate')
-        delete_ac(logger, identifier)
+    if not force and not recreate and is_unchanged(status, on_ac_update, on_ac_create, update_payload):
+        logger.info('AC is already up to date, skipping update')
+    elif recreate or (spec['type'] != AlertContactType.WEB_HOOK.name and ac_value_changed(status, identifier, update_payload, force)):
+        logger.info('alert contact type or value of an alert contact not of type WEB_HOOK changed, need to delete and recreate')
+        await delete_ac(logger, identifier)
 
-        identifier = create_ac(
+        identifier = await create_ac(
             logger,
             **update_payload
         )
     else:
         update_payload.pop('type', None) # update does not accept type parameter
+        if spec['type'] != AlertContactType.WEB_HOOK.name:
+            update_payload.pop('value', None)
 
-        identifier = update_ac(
+        identifier = await update_ac(
             logger,
             identifier,
             **update_payload
         )
 
-    return {AC_ID_KEY: identifier}
-
-@kopf.on.delete(GROUP, MonitorV1Beta1.version, AlertContactV1Beta1.plural)
-def on_ac_delete(status: dict, logger, **_):
+    return {AC_ID_KEY: identifier, FINGERPRINT_KEY: update_fingerprint, FIELDS_KEY: update_fields}
+
+@kopf.on.resume(GROUP, MonitorV1Beta1.version, AlertContactV1Beta1.plural, when=sharding.owns)
+@leader.required
+@metrics.timed(AlertContactV1Beta1.kind, 'resume')
+@tracing.traced(AlertContactV1Beta1.kind, 'resume')
+@workqueue.namespaced
+async def on_ac_resume(body: dict, logger, **_):
+    await verify_on_resume(logger, AlertContactV1Beta1, body)
+
+@kopf.on.delete(GROUP, MonitorV1Beta1.version, AlertContactV1Beta1.plural, when=sharding.finalizes)
+@leader.required
+@metrics.timed(AlertContactV1Beta1.kind, 'delete')
+@tracing.traced(AlertContactV1Beta1.kind, 'delete')
+@workqueue.namespaced
+async def on_ac_delete(status: dict, logger, **_):
     try:  # making sure to catch all exceptions here to prevent blocking deletion
         identifier = get_ac_identifier(status)
-        delete_ac(logger, identifier)
+        await delete_ac(logger, identifier)
     except KeyError as error:
         raise kopf.PermanentError(
             "was not able to determine the AC ID for deletion") from error
+    except kopf.TemporaryError:  # retry later, the object still exists at UptimeRobot
+        raise
     except Exception as error:
         raise kopf.PermanentError(f"deleting AC failed: {error}") from error
+
+
+async def spec_to_request_dict(crd, namespace: str, name: str, spec: dict) -> dict:
+    if crd in (MonitorV1Beta1, PspV1Beta1):
+        # the secret is cached and watched, a changed secret triggers an update
+        dependent = (crd, namespace, name)
+        if crd.secret_field not in spec:
+            secret_cache.cache.forget(dependent)
+            return crd.spec_to_request_dict(namespace, name, spec)
+
+        # translating the spec must not block the event loop for reading a referenced Secret
+        await secret_cache.cache.load(dependent, spec[crd.secret_field], k8s.get_secret)
+        return crd.spec_to_request_dict(namespace, name, spec, secret_cache.cache.get(dependent, spec[crd.secret_field]))
+
+    return crd.spec_to_request_dict(name, spec)
+
+
+def delete_handlers():
+    return {
+        MonitorV1Beta1: on_delete,
+        PspV1Beta1: on_psp_delete,
+        MaintenanceWindowV1Beta1: on_mw_delete,
+        AlertContactV1Beta1: on_ac_delete
+    }
+
+
+def reconciled_kinds():
+    # CRD, inventory index, identifier lookup, create and update handler
+    return [
+        (MonitorV1Beta1, inventory.monitors, get_identifier, on_create, on_update),
+        (PspV1Beta1, inventory.psps, get_psp_identifier, on_psp_create, on_psp_update),
+        (MaintenanceWindowV1Beta1, inventory.mwindows, get_mw_identifier, on_mw_create, on_mw_update),
+        (AlertContactV1Beta1, inventory.alert_contacts, get_ac_identifier, on_ac_create, on_ac_update)
+    ]
+
+
+async def reconcile_object(logger, crd, index, get_id, create_handler, update_handler, obj: dict):
+    metadata = obj['metadata']
+    namespace, name, spec, status = metadata['namespace'], metadata['name'], obj['spec'], obj.get('status', {})
+    with workqueue.namespace(namespace):
+        return await repair_object(logger, crd, index, get_id, create_handler, update_handler, namespace, name, spec, status)
+
+
+async def repair_object(logger, crd, index, get_id, create_handler, update_handler, namespace: str, name: str, spec: dict,
+                        status: dict):
+    from kubernetes.client.rest import ApiException
+
+    try:
+        identifier = get_id(status)
+    except KeyError:  # not created yet, the create handler takes care of it
+        return False
+
+    metrics.CACHE_LOOKUPS.labels('inventory', 'hit' if identifier in index else 'miss').inc()
+    if identifier not in index:
+        # the paginated bulk read misses objects created or moved between its pages, confirm with a read by ID
+        try:
+            await inventory.refresh_objects(uptime_robot, index, [identifier])
+        except RuntimeError as error:
+            raise kopf.TemporaryError(f'failed to read {crd.kind} {namespace}/{name}: {error}') from error
+
+    payload = await spec_to_request_dict(crd, namespace, name, spec)
+    if identifier in index and matches(index.get(identifier), payload, crd.reported_fields, crd.reported_names):
+        return False
+
+    # the object may have been deleted or recreated in UptimeRobot by its handlers since it has been listed
+    obj = await crd_fetcher(crd)(namespace, name)
+    if obj is None or obj['metadata'].get('deletionTimestamp'):
+        return False
+    spec, status = obj['spec'], obj.get('status', {})
+    try:
+        if get_id(status) != identifier:
+            return False
+    except KeyError:
+        return False
+
+    # repairs yield to the operations on objects that have just been changed
+    with workqueue.lane(workqueue.Lane.DRIFT):
+        if identifier in index:
+            logger.info(f'{crd.kind} {namespace}/{name} has drifted from its spec, updating it')
+            result = await update_handler(namespace=namespace, name=name, spec=spec, status=status, diff=[], logger=logger, force=True)
+        else:
+            logger.info(f'{crd.kind} {namespace}/{name} does no longer exist in UptimeRobot, recreating it')
+            result = await create_handler(namespace=namespace, name=name, spec=spec, logger=logger)
+
+    # store the identifier where the identifier lookup expects it
+    status_key = update_handler.__name__ if update_handler.__name__ in status else create_handler.__name__
+    try:
+        await k8s.update_k8s_crd_obj_with_body(crd, namespace, name, {'status': {status_key: result}})
+    except ApiException as error:
+        if error.status != 404:
+            raise
+        logger.info(f'{crd.kind} {namespace}/{name} has been deleted while repairing it, deleting it in UptimeRobot')
+        await delete_handlers()[crd](namespace=namespace, name=name, status={status_key: result}, logger=logger)
+        return False
+    return True
+
+
+async def verify_on_resume(logger, crd, body):
+    """checks a resumed object against the inventory loaded on startup, so that
+    only objects that diverge from the UptimeRobot account cause API calls"""
+    if not inventory.loaded:
+        return
+
+    for kind in reconciled_kinds():
+        if kind[0] is crd:
+            await reconcile_object(logger, *kind, body)
+
+
+async def take_over_finalizers(logger, crd, obj):
+    """replaces the finalizers of other slots of an object this replica has got
+    with its own
+
+    The previous owner keeps its finalizer and handles deletions until then,
+    so the object is never left without a finalizer. Objects that are
+    already being deleted can't get a new finalizer, they are deleted in
+    UptimeRobot here.
+    """
+    from kubernetes.client.rest import ApiException
+
+    metadata = obj['metadata']
+    finalizers = metadata.get('finalizers', [])
+    foreign = [finalizer for finalizer in finalizers if sharding.membership.is_foreign_finalizer(finalizer)]
+    if not foreign:
+        return
+
+    if metadata.get('deletionTimestamp') and sharding.membership.finalizer not in finalizers:
+        logger.info(f'taking over deletion of {crd.kind} {metadata["namespace"]}/{metadata["name"]}')
+        await delete_handlers()[crd](namespace=metadata['namespace'], name=metadata['name'],
+                                     status=obj.get('status', {}), logger=logger)
+
+    remaining = [finalizer for finalizer in finalizers if finalizer not in foreign]
+    if not metadata.get('deletionTimestamp') and sharding.membership.finalizer not in remaining:
+        remaining.append(sharding.membership.finalizer)
+
+    try:
+        # the resourceVersion makes the patch fail if kopf has changed the finalizers in the meantime
+        await k8s.update_k8s_crd_obj_with_body(crd, metadata['namespace'], metadata['name'], {'metadata': {
+            'finalizers': remaining,
+            'resourceVersion': metadata['resourceVersion']
+        }})
+    except ApiException as error:
+        if error.status not in [404, 409]:  # deleted or changed, taken over with the next reconciliation
+            raise
+
+
+def watched_namespaces(argv: list) -> list:
+    """returns the namespace patterns kopf run has been started with, an empty
+    list if all namespaces are watched or the operator isn't run by kopf run"""
+    if len(argv) < 2 or argv[1] != 'run':
+        return []
+
+    import kopf.cli
+    try:
+        return list(kopf.cli.run.make_context('run', argv[2:]).params['namespaces'])
+    except Exception:  # pylint: disable=broad-except
+        return []
+
+
+def is_watched(namespace: str) -> bool:
+    """matches a namespace against the patterns the same way kopf does"""
+    if not namespaces:
+        return True
+
+    for pattern in namespaces:
+        # comma separated globs, a leading exclusion implies a preceding catch-all
+        globs = [glob.strip() for glob in pattern.split(',')]
+        if globs[0].startswith('!'):
+            globs.insert(0, '*')
+
+        matched = first_match = fnmatch.fnmatch(namespace, globs[0])
+        for glob in globs[1:]:
+            if glob.startswith('!'):
+                matched = matched and not fnmatch.fnmatch(namespace, glob.lstrip('!'))
+            else:
+                matched = matched or (first_match and fnmatch.fnmatch(namespace, glob))
+
+        if matched:
+            return True
+    return False
+
+
+async def list_watched_crd_objs(crd) -> list:
+    """lists the objects of a CRD in the namespaces kopf watches"""
+    if namespaces and not any(char in pattern for pattern in namespaces for char in '*?[,!'):
+        return [obj for namespace in namespaces for obj in await k8s.list_namespaced_k8s_crd_objs(crd, namespace)]
+
+    return [obj for obj in await k8s.list_k8s_crd_objs(crd) if is_watched(obj['metadata']['namespace'])]
+
+
+def identifiers(get_id, objs: list) -> list:
+    """returns the UptimeRobot IDs of the objects that have been created"""
+    ids = []
+    for obj in objs:
+        try:
+            ids.append(get_id(obj.get('status', {})))
+        except KeyError:
+            pass
+    return ids
+
+
+async def reconcile(logger):
+    """compares all custom resources with the UptimeRobot account and repairs
+    the objects that have been changed or deleted outside of the operator
+
+    Reading the account costs one request per 50 objects, only objects that
+    differ from their spec cause a write. With sharding only the objects of
+    this replica are read by ID and compared, so the reads of all replicas
+    together stay the same, and the finalizers of their previous owners are
+    taken over.
+    """
+    from kubernetes.client.rest import ApiException
+
+    if sharding.membership is None:
+        await inventory.refresh(uptime_robot)
+
+    repaired = 0
+    for crd, index, get_id, create_handler, update_handler in reconciled_kinds():
+        objs = [obj for obj in await list_watched_crd_objs(crd)
+                if sharding.owns(obj['metadata']['namespace'], obj['metadata']['name'])]
+
+        if sharding.membership is not None:
+            await inventory.refresh_objects(uptime_robot, index, identifiers(get_id, objs))
+
+        for obj in objs:
+            metadata = obj['metadata']
+            if sharding.membership is not None:
+                try:
+                    await take_over_finalizers(logger, crd, obj)
+                except (kopf.PermanentError, kopf.TemporaryError, ApiException) as error:
+                    logger.warning(f'failed to take over {crd.kind} {metadata["namespace"]}/{metadata["name"]}: {error}')
+                    continue
+
+            if metadata.get('deletionTimestamp'):
+                continue
+
+            try:
+                if await reconcile_object(logger, crd, index, get_id, create_handler, update_handler, obj):
+                    repaired += 1
+            except (kopf.PermanentError, kopf.TemporaryError, ApiException) as error:
+                logger.warning(f'failed to reconcile {crd.kind} {obj["metadata"]["namespace"]}/{obj["metadata"]["name"]}: {error}')
+
+    logger.info(f'reconciliation finished, repaired {repaired} objects')
+
+
+async def rebalance(logger):
+    """takes over the objects this replica has got after the shard ring has changed
+
+    kopf ignores objects of other replicas completely, so the objects this
+    replica has got are compared with UptimeRobot and the monitors of its
+    Ingresses are applied, both only cause writes for objects that differ.
+    """
+    await reconcile(logger)
+
+    if config.DISABLE_INGRESS_HANDLING:
+        return
+
+    for ingress in await k8s.list_ingresses():
+        metadata = ingress['metadata']
+        if not is_watched(metadata['namespace']) or not sharding.owns(metadata['namespace'], metadata['name']) or metadata.get('deletionTimestamp'):
+            continue
+
+        with workqueue.namespace(metadata['namespace']):
+            await apply_ingress_monitors(metadata['namespace'], metadata['name'], metadata['uid'],
+                                         metadata.get('annotations', {}), ingress['spec'], logger)
+
+
+def on_ring_change(logger):
+    # the replicas split the rate limit of the account between them
+    ratelimit.limiter.set_shares(len(sharding.membership.ring.members))
+    start_rebalancing(logger)
+
+
+def start_rebalancing(logger):
+    global rebalancing
+    if rebalancing is not None:  # superseded by the newer ring
+        rebalancing.cancel()
+
+    async def run():
+        try:
+            await rebalance(logger)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error(f'rebalancing failed: {error}')
+
+    rebalancing = asyncio.create_task(run())
+
+
+async def reconcile_periodically(logger):
+    while True:
+        # jitter the interval to not hit the API at the same time as other operators using the same account
+        await asyncio.sleep(config.RECONCILE_INTERVAL * random.uniform(0.9, 1.1))
+
+        try:
+            if leader.election is not None and not leader.election.is_leader:
+                # a standby only keeps its inventory warm for taking over
+                await load_inventory(logger)
+            else:
+                await reconcile(logger)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error(f'reconciliation failed: {error}')
@@ -0,0 +1,113 @@
+import json
+
+PAGE_SIZE = 50
+
+
+def normalize_value(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return str(value)
+
+
+def matches(item: dict, payload: dict, fields: list = None, names: dict = None) -> bool:
+    """checks if all request parameters that UptimeRobot reports back have the requested value,
+    names maps the request parameters UptimeRobot reports under another name to that name"""
+    names = names or {}
+    return all(
+        normalize_value(item[names.get(key, key)]) == normalize_value(value)
+        for key, value in payload.items() if names.get(key, key) in item and (fields is None or key in fields)
+    )
+
+
+class ResourceIndex:
+    """UptimeRobot objects of a single kind indexed by ID"""
+
+    def __init__(self):
+        self.by_id = {}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __contains__(self, identifier):
+        return str(identifier) in self.by_id
+
+    def get(self, identifier):
+        return self.by_id.get(str(identifier))
+
+    def upsert(self, item: dict):
+        identifier = str(item['id'])
+        self.by_id[identifier] = {**self.by_id.get(identifier, {}), **item}
+
+    def remove(self, identifier):
+        self.by_id.pop(str(identifier), None)
+
+    def replace_all(self, items: list):
+        self.by_id = {}
+        for item in items:
+            self.upsert(item)
+
+
+class Inventory:
+    """in-memory copy of the monitors, alert contacts, maintenance windows and
+    public status pages of the UptimeRobot account
+
+    The inventory is built with paginated bulk reads and kept up to date by
+    the handlers after each write, so the existence and state of an object can
+    be checked without spending an API call.
+    """
+
+    def __init__(self):
+        self.monitors = ResourceIndex()
+        self.alert_contacts = ResourceIndex()
+        self.mwindows = ResourceIndex()
+        self.psps = ResourceIndex()
+        self.loaded = False
+
+    def _sources(self, api):
+        # the key of the response is also the parameter filtering by IDs
+        return [
+            (self.monitors, api.get_monitors, 'monitors'),
+            (self.alert_contacts, api.get_alert_contacts, 'alert_contacts'),
+            (self.mwindows, api.get_m_windows, 'mwindows'),
+            (self.psps, api.get_psps, 'psps')
+        ]
+
+    async def refresh(self, api):
+        """reloads all objects of the account, reading PAGE_SIZE objects per request"""
+        for index, method, key in self._sources(api):
+            index.replace_all(await fetch_all(method, key))
+        self.loaded = True
+
+    async def refresh_objects(self, api, index: ResourceIndex, identifiers: list):
+        """reloads only the given objects of an index and drops the ones that no longer exist"""
+        method, key = next((method, key) for source, method, key in self._sources(api) if source is index)
+        identifiers = [str(identifier) for identifier in identifiers]
+
+        for start in range(0, len(identifiers), PAGE_SIZE):
+            chunk = identifiers[start:start + PAGE_SIZE]
+            found = await fetch_all(method, key, **{key: '-'.join(chunk)})
+
+            for item in found:
+                index.upsert(item)
+            for identifier in set(chunk) - {str(item['id']) for item in found}:
+                index.remove(identifier)
+
+
+async def fetch_all(method, key: str, **params) -> list:
+    items = []
+
+    while True:
+        resp = await method(offset=len(items), limit=PAGE_SIZE, **params)
+        if resp['stat'] != 'ok':
+            raise RuntimeError(f'failed to list {key}: {resp["error"]}')
+
+        page = resp.get(key, [])
+        items += page
+
+        # getMonitors, getMWindows and getPSPs return a pagination object,
+        # getAlertContacts returns the pagination fields at the top level
+        pagination = resp.get('pagination', resp)
+        if not page or len(items) >= int(pagination.get('total', len(items))):
+            return items
@@ -1,41 +1,79 @@
+import asyncio
+import contextvars
+import functools
 import logging
 
-import kubernetes.config as k8s_config
-import kubernetes.client as k8s_client
-
 from crds import constants
+from config import Config
+import tracing
+import workqueue
 
-class K8s:
-    def __init__(self):
+# name of the operator's field manager for server-side apply
+FIELD_MANAGER = 'uptimerobot-operator'
+
+def create_api_client(pool_size: int = 32):
+    # importing the kubernetes client with all its models is slow, so it's done when it's needed
+    import kubernetes.config as k8s_config
+    import kubernetes.client as k8s_client
+
+    configuration = k8s_client.Configuration()
+    try:
+        k8s_config.load_kube_config(client_configuration=configuration)
+    except k8s_config.ConfigException:
         try:
-            k8s_config.load_kube_config()
-        except k8s_config.ConfigException:
-            k8s_config.load_incluster_config()
+            k8s_config.load_incluster_config(client_configuration=configuration)
         except k8s_config.ConfigException as error:
             logging.error("Failed to load kube and incluster config, giving up...")
             raise error
 
-        self.custom_objects_api = k8s_client.CustomObjectsApi()
-        self.core_api = k8s_client.CoreV1Api()
+    # AsyncK8s runs up to K8S_CONCURRENCY blocking calls in the executor at once,
+    # each of them needs its own connection
+    configuration.connection_pool_maxsize = pool_size
+    return k8s_client.ApiClient(configuration)
+
+
+class K8s:
+    _shared = None
+
+    def __init__(self, api_client=None):
+        import kubernetes.client as k8s_client
+
+        if api_client is None:
+            api_client = create_api_client()
+
+        self.api_client = api_client
+        self.custom_objects_api = k8s_client.CustomObjectsApi(api_client)
+        self.core_api = k8s_client.CoreV1Api(api_client)
+        self.apiextensions_api = k8s_client.ApiextensionsV1Api(api_client)
+        self.coordination_api = k8s_client.CoordinationV1Api(api_client)
+
+    @classmethod
+    def shared(cls):
+        """process-wide instance, the config is loaded and the connection pool created only once"""
+        if cls._shared is None:
+            cls._shared = cls(create_api_client(Config().K8S_POOL_SIZE))
+        return cls._shared
 
     def create_k8s_crd_obj_with_body(self, crd, namespace, body):
-        return self.custom_objects_api.create_namespaced_custom_object(
-            group=constants.GROUP,
-            version=crd.version,
-            namespace=namespace,
-            plural=crd.plural,
-            body=body
-        )
+        with tracing.span(f'create {crd.kind}', **{'k8s.namespace': namespace}):
+            return self.custom_objects_api.create_namespaced_custom_object(
+                group=constants.GROUP,
+                version=crd.version,
+                namespace=namespace,
+                plural=crd.plural,
+                body=body
+            )
 
     def update_k8s_crd_obj_with_body(self, crd, namespace, name, body):
-        return self.custom_objects_api.patch_namespaced_custom_object(
-            group=constants.GROUP,
-            version=crd.version,
-            plural=crd.plural,
-            namespace=namespace,
-            name=name,
-            body=body
-        )
+        with tracing.span(f'patch {crd.kind}', **{'k8s.namespace': namespace, 'k8s.name': name}):
+            return self.custom_objects_api.patch_namespaced_custom_object(
+                group=constants.GROUP,
+                version=crd.version,
+                plural=crd.plural,
+                namespace=namespace,
+                name=name,
+                body=body
+            )
 
     def create_k8s_crd_obj(self, crd, namespace, name, **spec):
         return self.create_k8s_crd_obj_with_body(
@@ -59,14 +97,155 @@ class K8s:
             }
         )
 
+    def apply_k8s_crd_obj_with_body(self, crd, namespace, name, body):
+        # server-side apply, fields the operator applied before but are missing in body get removed
+        with tracing.span(f'apply {crd.kind}', **{'k8s.namespace': namespace, 'k8s.name': name}):
+            return self.custom_objects_api.patch_namespaced_custom_object(
+                group=constants.GROUP,
+                version=crd.version,
+                plural=crd.plural,
+                namespace=namespace,
+                name=name,
+                body=body,
+                field_manager=FIELD_MANAGER,
+                force=True,
+                _content_type='application/apply-patch+yaml'
+            )
+
     def delete_k8s_crd_obj(self, crd, namespace, name):
-        self.custom_objects_api.delete_namespaced_custom_object(
-            group=constants.GROUP,
-            version=crd.version,
-            plural=crd.plural,
-            namespace=namespace,
-            name=name,
-        )
+        with tracing.span(f'delete {crd.kind}', **{'k8s.namespace': namespace, 'k8s.name': name}):
+            self.custom_objects_api.delete_namespaced_custom_object(
+                group=constants.GROUP,
+                version=crd.version,
+                plural=crd.plural,
+                namespace=namespace,
+                name=name,
+            )
+
+    def get_k8s_crd_obj(self, crd, namespace, name):
+        with tracing.span(f'get {crd.kind}', **{'k8s.namespace': namespace, 'k8s.name': name}):
+            return self.custom_objects_api.get_namespaced_custom_object(
+                group=constants.GROUP,
+                version=crd.version,
+                namespace=namespace,
+                plural=crd.plural,
+                name=name
+            )
+
+    def get_ingress(self, namespace, name):
+        # read as plain dict like the custom objects, the same as kopf passes it to the handlers
+        with tracing.span('get Ingress', **{'k8s.namespace': namespace, 'k8s.name': name}):
+            return self.custom_objects_api.get_namespaced_custom_object(
+                group='networking.k8s.io',
+                version='v1',
+                namespace=namespace,
+                plural='ingresses',
+                name=name
+            )
+
+    def list_k8s_crd_objs(self, crd):
+        with tracing.span(f'list {crd.kind}'):
+            return self.custom_objects_api.list_cluster_custom_object(
+                group=constants.GROUP,
+                version=crd.version,
+                plural=crd.plural
+            )['items']
+
+    def list_namespaced_k8s_crd_objs(self, crd, namespace, label_selector=None):
+        with tracing.span(f'list {crd.kind}', **{'k8s.namespace': namespace}):
+            return self.custom_objects_api.list_namespaced_custom_object(
+                group=constants.GROUP,
+                version=crd.version,
+                namespace=namespace,
+                plural=crd.plural,
+                label_selector=label_selector
+            )['items']
+
+    def get_resource_version(self, group, version, plural, namespace, name):
+        # read like a custom object, which works for all namespaced resources of a named API group
+        with tracing.span(f'get {plural}', **{'k8s.namespace': namespace, 'k8s.name': name}):
+            return self.custom_objects_api.get_namespaced_custom_object(
+                group=group,
+                version=version,
+                namespace=namespace,
+                plural=plural,
+                name=name
+            )['metadata']['resourceVersion']
 
     def get_secret(self, namespace, name):
-        return self.core_api.read_namespaced_secret(name, namespace)
+        with tracing.span('get Secret', **{'k8s.namespace': namespace, 'k8s.name': name}):
+            return self.core_api.read_namespaced_secret(name, namespace)
+
+    def get_lease(self, namespace, name):
+        return self.coordination_api.read_namespaced_lease(name, namespace)
+
+    def create_lease(self, namespace, body):
+        return self.coordination_api.create_namespaced_lease(namespace, body)
+
+    def replace_lease(self, namespace, name, body):
+        # fails with a conflict if the lease has been changed since body's resourceVersion has been read
+        return self.coordination_api.replace_namespaced_lease(name, namespace, body)
+
+    def list_leases(self, namespace, label_selector):
+        return self.coordination_api.list_namespaced_lease(namespace, label_selector=label_selector).items
+
+    def list_ingresses(self):
+        with tracing.span('list Ingress'):
+            return self.custom_objects_api.list_cluster_custom_object(
+                group='networking.k8s.io',
+                version='v1',
+                plural='ingresses'
+            )['items']
+
+
+class AsyncK8s:
+    """asyncio interface to K8s
+
+    The blocking client calls run in the default executor, a work queue
+    bounds how many of them are in flight at once so that fanning out many
+    requests neither exhausts the thread pool nor the connection pool, and
+    shares them fairly between namespaces.
+    """
+
+    def __init__(self, k8s: K8s, concurrency: int = 16):
+        self.k8s = k8s
+        self.work_queue = workqueue.WorkQueue(concurrency, name='kubernetes')
+
+    async def _run(self, lane, fn, *args):
+        if workqueue.lane_override.get() is not None:
+            lane = workqueue.lane_override.get()
+
+        async with self.work_queue.slot(lane):
+            # keep the context, e.g. the current trace, in the executor thread
+            return await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(contextvars.copy_context().run, fn, *args))
+
+    async def create_k8s_crd_obj_with_body(self, crd, namespace, body):
+        return await self._run(workqueue.Lane.CREATE, self.k8s.create_k8s_crd_obj_with_body, crd, namespace, body)
+
+    async def update_k8s_crd_obj_with_body(self, crd, namespace, name, body):
+        return await self._run(workqueue.Lane.UPDATE, self.k8s.update_k8s_crd_obj_with_body, crd, namespace, name, body)
+
+    async def apply_k8s_crd_obj_with_body(self, crd, namespace, name, body):
+        return await self._run(workqueue.Lane.CREATE, self.k8s.apply_k8s_crd_obj_with_body, crd, namespace, name, body)
+
+    async def delete_k8s_crd_obj(self, crd, namespace, name):
+        return await self._run(workqueue.Lane.DELETE, self.k8s.delete_k8s_crd_obj, crd, namespace, name)
+
+    async def get_k8s_crd_obj(self, crd, namespace, name):
+        return await self._run(workqueue.Lane.UPDATE, self.k8s.get_k8s_crd_obj, crd, namespace, name)
+
+    async def get_ingress(self, namespace, name):
+        return await self._run(workqueue.Lane.UPDATE, self.k8s.get_ingress, namespace, name)
+
+    async def list_ingresses(self):
+        return await self._run(workqueue.Lane.UPDATE, self.k8s.list_ingresses)
+
+    async def list_k8s_crd_objs(self, crd):
+        return await self._run(workqueue.Lane.UPDATE, self.k8s.list_k8s_crd_objs, crd)
+
+    async def list_namespaced_k8s_crd_objs(self, crd, namespace, label_selector=None):
+        return await self._run(workqueue.Lane.UPDATE, self.k8s.list_namespaced_k8s_crd_objs, crd, namespace, label_selector)
+
+    async def get_secret(self, namespace, name):
+        return await self._run(workqueue.Lane.UPDATE, self.k8s.get_secret, namespace, name)
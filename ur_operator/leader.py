@@ -0,0 +1,193 @@
+import asyncio
+import datetime
+import functools
+import logging
+import time
+
+import kopf
+
+
+def format_time(value: datetime.datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class LeaderElection:
+    """Lease based leader election between the replicas of the operator
+
+    Every replica runs kopf and watches all resources, but only the replica
+    holding the Lease runs handlers. The others block their handlers until
+    they take over the Lease, which happens once the leader hasn't renewed
+    it for the lease duration or has released it on shutdown. A standby has
+    already connected to UptimeRobot and loaded the inventory, so taking over
+    only has to process the events the leader hasn't handled.
+
+    on_elected is awaited after acquiring the Lease and before the handlers
+    are released, e.g. to bring the inventory up to date.
+    """
+
+    def __init__(self, k8s, namespace: str, name: str, identity: str, lease_duration: float = 15.,
+                 on_elected=None, labels: dict = None, clock=time.monotonic):
+        self.k8s = k8s
+        self.namespace = namespace
+        self.name = name
+        self.identity = identity
+        self.labels = labels
+        self.lease_duration = lease_duration
+        self.renew_interval = lease_duration / 3
+        # step down before another replica may consider the Lease expired
+        self.renew_deadline = lease_duration * 2 / 3
+        self.on_elected = on_elected
+        self.clock = clock
+        self.leading = False  # holds the Lease
+        self.elected = asyncio.Event()  # holds the Lease and is ready to run handlers
+        self.renewed = None
+
+    @property
+    def is_leader(self):
+        return self.elected.is_set()
+
+    def body(self, spec: dict, resource_version: str = None) -> dict:
+        metadata = {'name': self.name, 'namespace': self.namespace}
+        if self.labels:
+            metadata['labels'] = self.labels
+        if resource_version:
+            metadata['resourceVersion'] = resource_version
+        return {'apiVersion': 'coordination.k8s.io/v1', 'kind': 'Lease', 'metadata': metadata, 'spec': spec}
+
+    def is_expired(self, lease) -> bool:
+        duration = datetime.timedelta(seconds=lease.spec.lease_duration_seconds or self.lease_duration)
+        return not lease.spec.renew_time or lease.spec.renew_time + duration <= datetime.datetime.now(datetime.timezone.utc)
+
+    def try_acquire(self) -> bool:
+        """acquires or renews the Lease, returns whether this replica holds it"""
+        from kubernetes.client.rest import ApiException
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        spec = {
+            'holderIdentity': self.identity,
+            'leaseDurationSeconds': int(self.lease_duration),
+            'acquireTime': format_time(now),
+            'renewTime': format_time(now),
+            'leaseTransitions': 0
+        }
+
+        try:
+            lease = self.k8s.get_lease(self.namespace, self.name)
+        except ApiException as error:
+            if error.status != 404:
+                raise
+            try:
+                self.k8s.create_lease(self.namespace, self.body(spec))
+                return True
+            except ApiException as error:
+                if error.status == 409:  # created by another replica in the meantime
+                    return False
+                raise
+
+        holder = lease.spec.holder_identity
+        if holder == self.identity:
+            spec['acquireTime'] = format_time(lease.spec.acquire_time or now)
+            spec['leaseTransitions'] = lease.spec.lease_transitions or 0
+        else:
+            if holder and not self.is_expired(lease):
+                return False
+            spec['leaseTransitions'] = (lease.spec.lease_transitions or 0) + 1
+
+        try:
+            self.k8s.replace_lease(self.namespace, self.name, self.body(spec, lease.metadata.resource_version))
+            return True
+        except ApiException as error:
+            if error.status == 409:  # changed by another replica since reading it
+                return False
+            raise
+
+    def release(self):
+        """hands the Lease over to a standby without waiting for it to expire"""
+        lease = self.k8s.get_lease(self.namespace, self.name)
+        if lease.spec.holder_identity != self.identity:
+            return
+
+        spec = {'holderIdentity': '', 'leaseDurationSeconds': 1, 'leaseTransitions': lease.spec.lease_transitions or 0}
+        self.k8s.replace_lease(self.namespace, self.name, self.body(spec, lease.metadata.resource_version))
+
+    async def run(self, on_lost):
+        """acquires and renews the Lease until it is lost, then calls on_lost"""
+        loop = asyncio.get_running_loop()
+        while True:
+            # the Lease bypasses the Kubernetes work queue, renewals must not wait for handlers
+            try:
+                leading = await loop.run_in_executor(None, self.try_acquire)
+            except Exception as error:  # pylint: disable=broad-except
+                logging.warning(f'failed to acquire Lease {self.namespace}/{self.name}: {error}')
+                leading = False
+
+            if leading:
+                self.renewed = self.clock()
+                if not self.leading:
+                    logging.info(f'{self.identity} has been elected as leader')
+                    self.leading = True
+                    # taking over runs next to the renewals, which must not be delayed by it
+                    asyncio.ensure_future(self.take_over())
+            elif self.leading and self.clock() - self.renewed >= self.renew_deadline:
+                logging.error(f'{self.identity} has lost the leadership')
+                on_lost()
+                return
+
+            await asyncio.sleep(self.renew_interval)
+
+    async def take_over(self):
+        # the handlers are released even if on_elected fails, otherwise they would wait forever
+        try:
+            if self.on_elected is not None:
+                await self.on_elected()
+        except Exception as error:  # pylint: disable=broad-except
+            logging.error(f'failed to prepare taking over the leadership: {error}')
+        finally:
+            self.elected.set()
+
+    async def wait(self):
+        await self.elected.wait()
+
+    async def resource_version(self, resource, namespace: str, name: str):
+        """reads the current resourceVersion of an object, None if it has been deleted"""
+        from kubernetes.client.rest import ApiException
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.k8s.get_resource_version, resource.group, resource.version, resource.plural, namespace, name)
+        except ApiException as error:
+            if error.status == 404:
+                return None
+            raise
+
+
+# set on startup if leader election is enabled
+election = None
+
+
+def required(fn):
+    """delays an async handler until this replica is the leader
+
+    A call held by a standby carries the object as it was when the standby
+    got the event. If the object has changed since then, most likely because
+    the previous leader has handled it, the call is dropped and kopf retries
+    it with the current object, which skips handlers that are already done.
+    Event handlers are not held at all, a standby has nothing to update.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if election is None or election.is_leader:
+            return await fn(*args, **kwargs)
+
+        if 'event' in kwargs:
+            return None
+
+        held = kwargs['body']['metadata'].get('resourceVersion')
+        await election.wait()
+        current = await election.resource_version(kwargs['resource'], kwargs['namespace'], kwargs['name'])
+        if current is None:  # deleted while waiting
+            return None
+        if current != held:
+            raise kopf.TemporaryError('changed while waiting for the leadership, retrying with the current state', delay=0)
+        return await fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,105 @@
+import datetime
+import functools
+import inspect
+
+import prometheus_client as prom
+from aiohttp import web
+
+API_REQUEST_DURATION = prom.Histogram(
+    'uroperator_uptimerobot_request_duration_seconds',
+    'Duration of UptimeRobot API requests',
+    ['endpoint', 'outcome']
+)
+API_REQUESTS_IN_FLIGHT = prom.Gauge(
+    'uroperator_uptimerobot_requests_in_flight',
+    'UptimeRobot API requests currently waiting for a response'
+)
+WORK_QUEUE_WAITING = prom.Gauge(
+    'uroperator_work_queue_waiting',
+    'Operations waiting for a free slot or a rate limit token in the UptimeRobot or Kubernetes work queue',
+    ['queue', 'lane']
+)
+RATE_LIMITER_TOKENS = prom.Gauge(
+    'uroperator_rate_limiter_tokens',
+    'Requests that can currently be sent to the UptimeRobot API without waiting'
+)
+RATE_LIMITER_CAPACITY = prom.Gauge(
+    'uroperator_rate_limiter_capacity',
+    'Requests per minute allowed for the UptimeRobot API key'
+)
+HANDLER_DURATION = prom.Histogram(
+    'uroperator_handler_duration_seconds',
+    'Duration of handler executions',
+    ['kind', 'cause'],
+    buckets=(.01, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60., 120., 300., float('inf'))
+)
+HANDLERS_IN_FLIGHT = prom.Gauge(
+    'uroperator_handlers_in_flight',
+    'Handlers currently being executed',
+    ['kind', 'cause']
+)
+CACHE_LOOKUPS = prom.Counter(
+    'uroperator_cache_lookups_total',
+    'Lookups answered locally (hit) or requiring an API call (miss)',
+    ['cache', 'result']
+)
+COALESCED_UPDATES = prom.Counter(
+    'uroperator_coalesced_updates_total',
+    'Update handler runs skipped because the object changed again within the coalescing window',
+    ['kind']
+)
+CONVERGENCE = prom.Histogram(
+    'uroperator_convergence_seconds',
+    'Time from creating a resource until it exists in UptimeRobot',
+    ['kind'],
+    buckets=(.1, .5, 1., 2.5, 5., 10., 30., 60., 120., 300., 600., 1800., float('inf'))
+)
+
+
+def observe_convergence(kind: str, meta: dict):
+    created = datetime.datetime.strptime(meta['creationTimestamp'], '%Y-%m-%dT%H:%M:%SZ')
+    CONVERGENCE.labels(kind).observe((datetime.datetime.utcnow() - created).total_seconds())
+
+
+def timed(kind: str, cause: str):
+    """records duration and concurrency of a sync or async handler, for create
+    handlers also the time since the object has been created"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with HANDLERS_IN_FLIGHT.labels(kind, cause).track_inprogress(), \
+                        HANDLER_DURATION.labels(kind, cause).time():
+                    result = await fn(*args, **kwargs)
+
+                if cause == 'create' and 'creationTimestamp' in kwargs.get('meta', {}):
+                    observe_convergence(kind, kwargs['meta'])
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with HANDLERS_IN_FLIGHT.labels(kind, cause).track_inprogress(), \
+                    HANDLER_DURATION.labels(kind, cause).time():
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def track_rate_limiter(limiter):
+    RATE_LIMITER_TOKENS.set_function(lambda: limiter.fill_ratio * limiter.capacity)
+    RATE_LIMITER_CAPACITY.set_function(lambda: limiter.capacity)
+
+
+async def get_metrics(_):
+    return web.Response(body=prom.generate_latest(), headers={'Content-Type': prom.CONTENT_TYPE_LATEST})
+
+
+async def serve(port: int):
+    app = web.Application()
+    app.router.add_get('/metrics', get_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    return runner
@@ -0,0 +1,125 @@
+import random
+import time
+
+FREE_PLAN_REQUESTS_PER_MINUTE = 10
+PRO_PLAN_MAX_REQUESTS_PER_MINUTE = 5000
+
+
+def requests_per_minute_for_account(account: dict) -> int:
+    # the free plan is limited to 10 requests per minute, the pro plan allows
+    # twice the monitor limit per minute, capped at 5000
+    if int(account.get('monitor_interval', 300)) >= 300:
+        return FREE_PLAN_REQUESTS_PER_MINUTE
+
+    return min(2 * int(account['monitor_limit']), PRO_PLAN_MAX_REQUESTS_PER_MINUTE)
+
+
+class TokenBucket:
+    """token bucket limiting the requests sent to the UptimeRobot API
+
+    The bucket starts from the configured requests per minute and is adapted
+    by the X-RateLimit-* and Retry-After headers UptimeRobot returns, so that
+    the operator stays right below the quota of the API key. Replicas sharing
+    the API key each get an equal share of the quota.
+    """
+
+    def __init__(self, requests_per_minute: int, clock=time.monotonic):
+        self._clock = clock
+        self.limit = float(requests_per_minute)
+        self.shares = 1
+        self.capacity = self.limit
+        self.tokens = self.capacity
+        self.blocked_until = 0.
+        self._refilled_at = clock()
+
+    @property
+    def rate(self):
+        return self.capacity / 60.
+
+    @property
+    def fill_ratio(self):
+        self._refill()
+        return self.tokens / self.capacity
+
+    def set_limit(self, requests_per_minute: int):
+        self._refill()
+        self.limit = float(requests_per_minute)
+        self.capacity = self.limit / self.shares
+        self.tokens = min(self.tokens, self.capacity)
+
+    def set_shares(self, shares: int):
+        """splits the limit of the API key between the given number of replicas"""
+        self.shares = max(1, shares)
+        self.set_limit(self.limit)
+
+    def _refill(self):
+        now = self._clock()
+        if now > self._refilled_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def delay(self) -> float:
+        """returns the seconds until a token is available without taking it"""
+        self._refill()
+
+        now = self._clock()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        if self.tokens >= 1.:
+            return 0.
+
+        return (1. - self.tokens) / self.rate
+
+    def try_acquire(self) -> float:
+        """takes a token if available and returns 0, otherwise returns the seconds to wait"""
+        wait = self.delay()
+        if not wait:
+            self.tokens -= 1.
+        return wait
+
+    def update_from_headers(self, headers):
+        limit = headers.get('X-RateLimit-Limit')
+        if limit is not None and float(limit) != self.limit:
+            self.set_limit(int(limit))
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining) / self.shares)
+
+            reset = headers.get('X-RateLimit-Reset')
+            if reset is not None and float(remaining) < 1:
+                self.blocked_until = max(self.blocked_until, self._clock() + float(reset) - time.time())
+
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():  # HTTP date values are not supported
+            self.tokens = 0.
+            self.blocked_until = max(self.blocked_until, self._clock() + float(retry_after))
+
+
+class Backoff:
+    """exponential backoff with full jitter shared by all UptimeRobot calls
+
+    Every temporary failure grows the delay for all handlers while a single
+    successful request resets it, so the operator recovers quickly after an
+    outage and the jitter spreads out the retries.
+    """
+
+    def __init__(self, base: float = 1., cap: float = 300., rand=random.random):
+        self.base = base
+        self.cap = cap
+        self.failures = 0
+        self._rand = rand
+
+    def failure(self) -> float:
+        """records a temporary failure and returns the delay before retrying"""
+        self.failures += 1
+        return max(self.base, self._rand() * min(self.cap, self.base * 2 ** min(self.failures, 32)))
+
+    def success(self):
+        self.failures = 0
+
+
+limiter = TokenBucket(FREE_PLAN_REQUESTS_PER_MINUTE)
+backoff = Backoff()
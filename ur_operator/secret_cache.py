@@ -0,0 +1,86 @@
+import metrics
+
+
+class SecretCache:
+    """data of the Secrets referenced by custom resources
+
+    Only Secrets that are referenced by at least one object are kept. The
+    cache is filled by load before the spec of an object is translated and
+    kept up to date by watching Secrets, the reverse index from Secret to the
+    referencing objects tells which objects need to be updated when a Secret
+    changes.
+
+    Objects are identified by a (crd, namespace, name) tuple.
+    """
+
+    def __init__(self):
+        self.data = {}  # (namespace, secret name) -> data of the Secret
+        self.references = {}  # object -> name of the referenced Secret
+        self.dependents = {}  # (namespace, secret name) -> objects referencing the Secret
+
+    def __contains__(self, key):
+        return key in self.dependents
+
+    async def load(self, dependent: tuple, secret_name: str, get_secret):
+        """reads a Secret in the namespace of the object with the async
+        get_secret unless it is cached and records the reference"""
+        self.track(dependent, secret_name)
+
+        key = (dependent[1], secret_name)
+        metrics.CACHE_LOOKUPS.labels('secret', 'hit' if key in self.data else 'miss').inc()
+        if key not in self.data:
+            data = (await get_secret(*key)).data or {}
+            self.data.setdefault(key, data)  # the watch may have stored a newer version in the meantime
+
+    def get(self, dependent: tuple, secret_name: str) -> dict:
+        """returns the data of a loaded Secret in the namespace of the object and records the reference"""
+        self.track(dependent, secret_name)
+
+        key = (dependent[1], secret_name)
+        if key not in self.data:
+            raise LookupError(f'Secret {key[0]}/{key[1]} has not been loaded')
+
+        return self.data[key]
+
+    def track(self, dependent: tuple, secret_name: str = None):
+        previous = self.references.get(dependent)
+        if previous == secret_name:
+            return
+
+        if previous is not None:
+            key = (dependent[1], previous)
+            self.dependents[key].discard(dependent)
+            if not self.dependents[key]:  # no longer referenced, stop caching it
+                self.dependents.pop(key)
+                self.data.pop(key, None)
+
+        if secret_name is None:
+            self.references.pop(dependent, None)
+        else:
+            self.references[dependent] = secret_name
+            self.dependents.setdefault((dependent[1], secret_name), set()).add(dependent)
+
+    def forget(self, dependent: tuple):
+        self.track(dependent, None)
+
+    def update(self, namespace: str, secret_name: str, data: dict) -> list:
+        """stores the data of a watched Secret, returns the objects that need
+        to be updated because the Secret they reference has changed or appeared"""
+        key = (namespace, secret_name)
+        if key not in self.dependents:
+            return []
+
+        previous = self.data.get(key)
+        self.data[key] = data
+        if previous == data:
+            return []
+
+        return list(self.dependents[key])
+
+    def remove(self, namespace: str, secret_name: str):
+        """drops the data of a deleted Secret but keeps its dependents, so
+        they are updated when the Secret is created again"""
+        self.data.pop((namespace, secret_name), None)
+
+
+cache = SecretCache()
@@ -0,0 +1,140 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+
+from crds.constants import GROUP
+from crds.utils import MANAGED_BY_LABEL, MANAGED_BY
+from leader import LeaderElection
+
+# label on the slot Leases, the value is the name of the ring
+RING_LABEL = f'{GROUP}/shard-ring'
+# finalizers of the slots, replace kopf's finalizer as every slot needs its own,
+# named after the slot as in uroperator.brennerm.github.io/shard-<n>
+FINALIZER_PREFIX = f'{GROUP}/shard-'
+KOPF_FINALIZER = 'kopf.zalando.org/KopfFinalizerMarker'
+
+
+def ring_hash(value: str) -> int:
+    return int(hashlib.sha1(value.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """consistent hash ring assigning objects to the replicas of the operator
+
+    Every member gets a number of virtual nodes on the ring, an object
+    belongs to the member of the first virtual node following the hash of
+    its key. When a member joins or leaves only the objects next to its
+    virtual nodes move.
+    """
+
+    def __init__(self, members: list, virtual_nodes: int = 64):
+        self.members = sorted(set(members))
+        points = sorted((ring_hash(f'{member}#{index}'), member) for member in self.members for index in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [member for _, member in points]
+
+    def owner(self, key: str):
+        if not self.owners:
+            return None
+        return self.owners[bisect.bisect(self.hashes, ring_hash(key)) % len(self.owners)]
+
+
+class Membership:
+    """membership of a replica in the hash ring
+
+    Every replica holds one slot Lease, it takes the lowest slot that isn't
+    held by another replica, so restarted replicas get the same slots and
+    the same objects again. The members of the ring are the slots whose
+    Leases are held, a slot that hasn't been renewed for the lease duration
+    is removed from the ring and its objects are taken over by the others.
+
+    kopf marks objects with the finalizer of the slot handling them. After
+    the ring has changed, the new owner of an object replaces the finalizer
+    of the previous owner, which ignores the object from then on.
+    """
+
+    def __init__(self, k8s, namespace: str, name: str, identity: str, lease_duration: float = 15.):
+        self.k8s = k8s
+        self.namespace = namespace
+        self.name = name
+        self.identity = identity
+        self.lease_duration = lease_duration
+        self.slot = None
+        self.election = None
+        self.ring = HashRing([])
+
+    @property
+    def finalizer(self):
+        return f'{GROUP}/{self.slot}'
+
+    def is_foreign_finalizer(self, finalizer: str) -> bool:
+        return finalizer != self.finalizer and (finalizer == KOPF_FINALIZER or finalizer.startswith(FINALIZER_PREFIX))
+
+    def owns(self, namespace: str, name: str) -> bool:
+        return self.ring.owner(f'{namespace}/{name}') == self.slot
+
+    def join(self):
+        """takes the lowest free slot"""
+        for index in itertools.count():
+            election = LeaderElection(self.k8s, self.namespace, f'{self.name}-shard-{index}', self.identity,
+                                      self.lease_duration, labels={MANAGED_BY_LABEL: MANAGED_BY, RING_LABEL: self.name})
+            if election.try_acquire():
+                self.slot, self.election = f'shard-{index}', election
+                self.refresh()
+                return
+
+    def refresh(self) -> bool:
+        """reads the members of the ring, returns whether they have changed"""
+        members = [self.slot]
+        for lease in self.k8s.list_leases(self.namespace, f'{RING_LABEL}={self.name}'):
+            if lease.spec.holder_identity and lease.spec.holder_identity != self.identity and \
+                    not self.election.is_expired(lease):
+                members.append(lease.metadata.name[len(self.name) + 1:])
+
+        if sorted(members) == self.ring.members:
+            return False
+
+        logging.info(f'shard ring {self.name} has changed to {len(members)} members: {", ".join(sorted(members))}')
+        self.ring = HashRing(members)
+        return True
+
+    def leave(self):
+        """releases the slot, so the others take over its objects right away"""
+        self.election.release()
+
+    async def run(self, on_change, on_lost):
+        """renews the slot and calls on_change when the members of the ring have changed,
+        on_lost is called when the slot couldn't be renewed in time"""
+        async def watch():
+            loop = asyncio.get_running_loop()
+            while True:
+                await asyncio.sleep(self.election.renew_interval)
+                try:
+                    if await loop.run_in_executor(None, self.refresh):
+                        on_change()
+                except Exception as error:  # pylint: disable=broad-except
+                    logging.warning(f'failed to read the members of shard ring {self.name}: {error}')
+
+        await asyncio.gather(self.election.run(on_lost), watch())
+
+
+# set on startup if sharding is enabled
+membership = None
+
+
+def owns(namespace: str, name: str, **_) -> bool:
+    """kopf filter selecting the objects of this replica"""
+    return membership is None or membership.owns(namespace, name)
+
+
+def finalizes(namespace: str, name: str, meta: dict, **_) -> bool:
+    """kopf filter of the deletion handlers, also selecting the objects that
+    still carry the finalizer of this replica
+
+    kopf removes its finalizer from objects no handler requires it for, so
+    without it an object deleted after the ring has changed, but before its
+    new owner has taken it over, would be left without any finalizer.
+    """
+    return owns(namespace, name) or membership.finalizer in meta.get('finalizers', [])
@@ -0,0 +1,87 @@
+import functools
+import inspect
+
+from opentelemetry import propagate, trace
+
+from crds.constants import GROUP
+
+# annotation carrying the trace context from an Ingress to its UptimeRobotMonitor objects
+TRACE_CONTEXT_ANNOTATION = f'{GROUP}/traceparent'
+
+tracer = trace.get_tracer('uroperator')
+
+
+def setup(exporter: str, file_path: str):
+    """configures the exporter for the spans, without it all spans are no-ops"""
+    if not exporter:
+        return
+
+    # imported here as the SDK is only needed when tracing is enabled
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter == 'otlp':
+        # endpoint and headers are configured with the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        span_exporter = OTLPSpanExporter()
+    elif exporter == 'file':
+        span_exporter = ConsoleSpanExporter(
+            out=open(file_path, 'a'),  # pylint: disable=consider-using-with
+            formatter=lambda span: span.to_json(indent=None) + '\n'
+        )
+    else:
+        raise ValueError(f'unknown tracing exporter {exporter}, use one of: otlp,file')
+
+    provider = TracerProvider(resource=Resource.create({'service.name': 'uptimerobot-operator'}))
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+
+
+def span(name: str, **attributes):
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+def inject(annotations: dict) -> dict:
+    """adds the current trace context to the given annotations"""
+    carrier = {}
+    propagate.inject(carrier)
+    if 'traceparent' in carrier:
+        annotations[TRACE_CONTEXT_ANNOTATION] = carrier['traceparent']
+    return annotations
+
+
+def extract(annotations: dict):
+    if not annotations or TRACE_CONTEXT_ANNOTATION not in annotations:
+        return None
+    return propagate.extract({'traceparent': annotations[TRACE_CONTEXT_ANNOTATION]})
+
+
+def traced(kind: str, cause: str):
+    """runs a sync or async handler in a span, continuing the trace of the
+    parent object if its context has been passed in the annotations"""
+    def decorator(fn):
+        def start_span(kwargs):
+            return tracer.start_as_current_span(
+                f'{cause} {kind}',
+                context=extract(kwargs.get('annotations')),
+                attributes={
+                    'k8s.kind': kind,
+                    'k8s.namespace': kwargs.get('namespace') or '',
+                    'k8s.name': kwargs.get('name') or ''
+                }
+            )
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(kwargs):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(kwargs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,10 +1,30 @@
+import asyncio
 import logging
+import time
+import urllib.parse
 
-import uptimerobotpy as ur
+import aiohttp
 import config
+import metrics
+import ratelimit
+import tracing
+import workqueue
+
+# errors that are expected to go away when retrying later
+TEMPORARY_ERROR_TYPES = ['rate_limit', 'internal', 'internal_error', 'connection_error', 'timeout']
+TEMPORARY_HTTP_STATUSES = [408, 425, 429, 500, 502, 503, 504]
+
+
+def is_temporary_error(error: dict) -> bool:
+    if error.get('status') in TEMPORARY_HTTP_STATUSES:
+        return True
+
+    return error.get('type') in TEMPORARY_ERROR_TYPES
 
 
 def create_uptimerobot_api():
+    import uptimerobotpy as ur
+
     try:
         ur_api_key = config.Config().UPTIMEROBOT_API_KEY
     except KeyError as error:
@@ -12,7 +32,7 @@ def create_uptimerobot_api():
         logging.error(msg)
         raise RuntimeError(msg)
 
-    uptime_robot = ur.UptimeRobot(api_key=ur_api_key)
+    uptime_robot = ur.UptimeRobot(endpoint=config.Config().UPTIMEROBOT_API_URL, api_key=ur_api_key)
     resp = uptime_robot.get_account_details()
 
     if resp['stat'] != 'ok':
@@ -20,3 +40,209 @@ def create_uptimerobot_api():
         raise RuntimeError(resp['error'])
 
     return uptime_robot
+
+
+async def create_async_uptimerobot_api():
+    try:
+        ur_api_key = config.Config().UPTIMEROBOT_API_KEY
+    except KeyError as error:
+        msg = f'Required environment variable {error.args[0]} has not been provided'
+        logging.error(msg)
+        raise RuntimeError(msg)
+
+    uptime_robot = AsyncUptimeRobot(
+        api_key=ur_api_key,
+        endpoint=config.Config().UPTIMEROBOT_API_URL,
+        pool_size=config.Config().API_POOL_SIZE,
+        keepalive_timeout=config.Config().API_KEEPALIVE_TIMEOUT,
+        connect_timeout=config.Config().API_CONNECT_TIMEOUT,
+        read_timeout=config.Config().API_READ_TIMEOUT
+    )
+    resp = await uptime_robot.get_account_details()
+
+    if resp['stat'] != 'ok':
+        await uptime_robot.close()
+        logging.error('failed to authenticate against UptimeRobot API')
+        raise RuntimeError(resp['error'])
+
+    requests_per_minute = config.Config().API_RATE_LIMIT or ratelimit.requests_per_minute_for_account(resp['account'])
+    uptime_robot.rate_limiter.set_limit(requests_per_minute)
+    uptime_robot.work_queue.set_concurrency(config.Config().API_CONCURRENCY)
+    logging.info(f'limiting UptimeRobot API requests to {requests_per_minute} per minute')
+
+    return uptime_robot
+
+
+class EndpointStats:
+    """latency accounting for a single UptimeRobot API endpoint"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.
+        self.max_seconds = 0.
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.count if self.count else 0.
+
+    def record(self, seconds: float, failed: bool):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if failed:
+            self.errors += 1
+
+
+class AsyncUptimeRobot:
+    """asyncio based client for the UptimeRobot v2 API
+
+    Mirrors the methods of uptimerobotpy.UptimeRobot that are used by the
+    operator but awaits the responses on the event loop instead of blocking a
+    thread, so that many requests can be in flight at the same time.
+
+    All requests share one session with a bounded keep-alive connection pool,
+    so bursts of calls reuse established TLS connections, and pass the
+    process-wide work queue, which admits them within the rate limit.
+
+    HTTP and connection failures are not raised but returned as failed
+    responses with an error of type http_error, connection_error or timeout,
+    so callers can handle them like any other API error.
+    """
+
+    def __init__(self, api_key, endpoint='https://api.uptimerobot.com/v2/', pool_size=32, keepalive_timeout=60.,
+                 connect_timeout=5., read_timeout=30., rate_limiter=None, backoff=None, work_queue=None):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.rate_limiter = rate_limiter or ratelimit.limiter
+        self.backoff = backoff or ratelimit.backoff
+        # the work queue takes a token of the rate limiter for every request it admits
+        self.work_queue = work_queue or (
+            workqueue.queue if self.rate_limiter is ratelimit.limiter else workqueue.WorkQueue(pool_size, rate_limiter=self.rate_limiter))
+        self.stats = {}
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    keepalive_timeout=self.keepalive_timeout
+                ),
+                timeout=self.timeout,
+                headers={'Accept-Encoding': 'gzip'}
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def _request(self, route, **params):
+        with tracing.span(f'UptimeRobot {route}', **{'uptimerobot.endpoint': route}) as span:
+            async with self.work_queue.slot(workqueue.lane_for(route)):
+                resp = await self._send(route, **params)
+            span.set_attribute('uptimerobot.outcome', 'ok' if resp['stat'] == 'ok' else resp.get('error', {}).get('type', 'unknown'))
+            return resp
+
+    async def _send(self, route, **params):
+        payload = {k: str(v) for k, v in params.items()}
+        payload['api_key'] = self.api_key
+        payload['format'] = 'json'
+
+        started = time.monotonic()
+        try:
+            with metrics.API_REQUESTS_IN_FLIGHT.track_inprogress():
+                async with self.session.post(urllib.parse.urljoin(self.endpoint, route), data=payload) as response:
+                    self.rate_limiter.update_from_headers(response.headers)
+                    if response.status >= 400:
+                        resp = {'stat': 'fail', 'error': {
+                            'type': 'http_error', 'status': response.status, 'message': response.reason}}
+                    else:
+                        resp = await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            resp = {'stat': 'fail', 'error': {'type': 'timeout', 'message': f'request to {route} timed out'}}
+        except aiohttp.ClientError as error:
+            resp = {'stat': 'fail', 'error': {'type': 'connection_error', 'message': str(error)}}
+
+        duration = time.monotonic() - started
+        self.stats.setdefault(route, EndpointStats()).record(duration, resp['stat'] != 'ok')
+        metrics.API_REQUEST_DURATION.labels(route, 'ok' if resp['stat'] == 'ok' else resp.get('error', {}).get('type', 'unknown')).observe(duration)
+        if resp['stat'] == 'ok':
+            self.backoff.success()
+
+        return resp
+
+    async def get_account_details(self):
+        return await self._request('getAccountDetails')
+
+    async def get_monitors(self, **kwargs):
+        return await self._request('getMonitors', **kwargs)
+
+    async def get_all_monitors(self, **kwargs):
+        resp = await self.get_monitors(**kwargs)
+        if resp['stat'] != 'ok':
+            return resp
+
+        total = resp['pagination']['total']
+        offset = len(resp['monitors'])
+        while offset < total:
+            page = await self.get_monitors(offset=offset, **kwargs)
+            if page['stat'] != 'ok':
+                return page
+            if not page['monitors']:
+                break
+
+            resp['monitors'] += page['monitors']
+            offset += len(page['monitors'])
+
+        return resp
+
+    async def new_monitor(self, **kwargs):
+        return await self._request('newMonitor', **kwargs)
+
+    async def edit_monitor(self, id, **kwargs):  # pylint: disable=redefined-builtin
+        return await self._request('editMonitor', id=id, **kwargs)
+
+    async def delete_monitor(self, id):  # pylint: disable=redefined-builtin
+        return await self._request('deleteMonitor', id=id)
+
+    async def get_psps(self, **kwargs):
+        return await self._request('getPSPs', **kwargs)
+
+    async def new_psp(self, **kwargs):
+        return await self._request('newPSP', **kwargs)
+
+    async def edit_psp(self, id, **kwargs):  # pylint: disable=redefined-builtin
+        return await self._request('editPSP', id=id, **kwargs)
+
+    async def delete_psp(self, id):  # pylint: disable=redefined-builtin
+        return await self._request('deletePSP', id=id)
+
+    async def get_m_windows(self, **kwargs):
+        return await self._request('getMWindows', **kwargs)
+
+    async def new_m_window(self, **kwargs):
+        return await self._request('newMWindow', **kwargs)
+
+    async def edit_m_window(self, id, **kwargs):  # pylint: disable=redefined-builtin
+        return await self._request('editMWindow', id=id, **kwargs)
+
+    async def delete_m_window(self, id):  # pylint: disable=redefined-builtin
+        return await self._request('deleteMWindow', id=id)
+
+    async def get_alert_contacts(self, **kwargs):
+        return await self._request('getAlertContacts', **kwargs)
+
+    async def new_alert_contact(self, **kwargs):
+        return await self._request('newAlertContact', **kwargs)
+
+    async def edit_alert_contact(self, id, **kwargs):  # pylint: disable=redefined-builtin
+        return await self._request('editAlertContact', id=id, **kwargs)
+
+    async def delete_alert_contact(self, id):  # pylint: disable=redefined-builtin
+        return await self._request('deleteAlertContact', id=id)
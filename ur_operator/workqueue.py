@@ -0,0 +1,331 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import enum
+import functools
+import heapq
+import inspect
+import itertools
+import logging
+import math
+
+from crds.constants import GROUP
+import metrics
+import ratelimit
+
+# annotations on a namespace that change how its operations are scheduled
+WEIGHT_ANNOTATION = f'{GROUP}/scheduling.weight'
+CONCURRENCY_ANNOTATION = f'{GROUP}/scheduling.concurrency'
+RATE_LIMIT_ANNOTATION = f'{GROUP}/scheduling.rate-limit'
+
+
+class Lane(enum.IntEnum):
+    """priority of an operation, lower values are admitted first"""
+    DELETE = 0
+    CREATE = 1
+    UPDATE = 2
+    DRIFT = 3
+
+
+# lane for all operations of the current task, e.g. drift repairs
+lane_override = contextvars.ContextVar('lane_override', default=None)
+# namespace of the object the current task is working on
+current_namespace = contextvars.ContextVar('current_namespace', default='')
+
+
+def lane_for(route: str) -> Lane:
+    if lane_override.get() is not None:
+        return lane_override.get()
+
+    if route.startswith('delete'):
+        return Lane.DELETE
+    if route.startswith('new'):
+        return Lane.CREATE
+    if route.startswith('edit'):
+        return Lane.UPDATE
+    return Lane.DRIFT  # reads are done by the inventory and the reconciliation
+
+
+@contextlib.contextmanager
+def lane(value: Lane):
+    token = lane_override.set(value)
+    try:
+        yield
+    finally:
+        lane_override.reset(token)
+
+
+@contextlib.contextmanager
+def namespace(value: str):
+    token = current_namespace.set(value or '')
+    try:
+        yield
+    finally:
+        current_namespace.reset(token)
+
+
+def namespaced(fn):
+    """schedules the operations of a sync or async handler as operations of the object's namespace"""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with namespace(kwargs.get('namespace')):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with namespace(kwargs.get('namespace')):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class NamespacePolicy:
+    """share of a namespace in the operations of the operator
+
+    The weight sets the share of a namespace compared to other namespaces
+    with waiting operations, concurrency and rate limit optionally cap the
+    operations in flight and the operations per minute of the namespace.
+    """
+
+    def __init__(self, weight: float = 1., concurrency: int = None, rate_limit: int = None):
+        self.weight = weight
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+
+    def __eq__(self, other):
+        return isinstance(other, NamespacePolicy) and \
+            (self.weight, self.concurrency, self.rate_limit) == (other.weight, other.concurrency, other.rate_limit)
+
+    @classmethod
+    def from_annotations(cls, annotations: dict):
+        def value(key, convert):
+            try:
+                return convert(annotations[key]) if key in annotations else None
+            except ValueError:
+                logging.warning(f'ignoring invalid value {annotations[key]} of annotation {key}')
+                return None
+
+        weight = value(WEIGHT_ANNOTATION, float)
+        return cls(
+            weight=weight if weight and weight > 0 else 1.,
+            concurrency=value(CONCURRENCY_ANNOTATION, int),
+            rate_limit=value(RATE_LIMIT_ANNOTATION, int)
+        )
+
+
+# policies of the namespaces that have been annotated, all others get the default
+policies = {}
+DEFAULT_POLICY = NamespacePolicy()
+
+
+class WorkQueue:
+    """admits operations with a bounded concurrency
+
+    When all slots are taken, waiting operations are admitted by lane, so
+    deletions and creates for new objects are not starved by a burst of edits
+    or background drift repairs. Within a lane namespaces are served by
+    weighted fair queuing: every operation gets a virtual finish time that
+    grows by 1/weight with each operation its namespace has waiting, so a
+    namespace with hundreds of queued operations delays the first operation
+    of another namespace by at most one operation.
+
+    Every namespace queues its operations on its own, only the first one of
+    each namespace competes for the slots. A namespace at its concurrency or
+    rate limit is parked until one of its operations finishes or its rate
+    limit allows the next one, so its backlog doesn't slow down dispatching
+    for the others. The state of namespaces without operations is dropped.
+
+    With a rate limiter every admitted operation takes one of its tokens, so
+    when the rate limit is exhausted the tokens are handed out in the same
+    order as the slots.
+    """
+
+    def __init__(self, concurrency: int, name: str = 'uptimerobot', rate_limiter: ratelimit.TokenBucket = None):
+        self.name = name
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.running = 0
+        self.running_per_namespace = collections.Counter()
+        self._queues = {}  # namespace -> heap of (lane, virtual finish time, sequence number, future)
+        self._heads = {}  # namespace -> sequence number of its first operation, which is in _ready
+        self._ready = []  # heap of (lane, virtual finish time, sequence number, namespace)
+        self._parked = {}  # namespace -> loop time until which it is rate limited, inf if at its concurrency
+        self._sequence = itertools.count()
+        self._virtual_time = 0.
+        self._finish_times = {}
+        self._rate_limiters = {}
+        self._evictions = {}
+        self._wakeup = None
+
+    def set_concurrency(self, concurrency: int):
+        self.concurrency = concurrency
+        self._dispatch()
+
+    def _rate_limiter(self, namespace: str, rate_limit: int):
+        limiter = self._rate_limiters.get(namespace)
+        if limiter is None:
+            limiter = self._rate_limiters[namespace] = ratelimit.TokenBucket(rate_limit)
+        elif limiter.limit != rate_limit:
+            limiter.set_limit(rate_limit)
+        return limiter
+
+    def _try_admit(self, namespace: str) -> float:
+        """takes a slot for the namespace and returns 0, otherwise returns the seconds to wait"""
+        policy = policies.get(namespace, DEFAULT_POLICY)
+        if self.running >= self.concurrency:
+            return math.inf
+        if policy.concurrency is not None and self.running_per_namespace[namespace] >= policy.concurrency:
+            return math.inf
+
+        limiters = [] if self.rate_limiter is None else [self.rate_limiter]
+        if policy.rate_limit:
+            limiters.append(self._rate_limiter(namespace, policy.rate_limit))
+        wait = max([limiter.delay() for limiter in limiters], default=0.)
+        if wait:
+            return wait
+        for limiter in limiters:
+            limiter.try_acquire()
+
+        self.running += 1
+        self.running_per_namespace[namespace] += 1
+        return 0.
+
+    async def acquire(self, lane: Lane, namespace: str):
+        # with operations waiting a new one must not overtake them
+        if not self._queues and not self._try_admit(namespace):
+            return
+
+        weight = policies.get(namespace, DEFAULT_POLICY).weight
+        finish_time = max(self._virtual_time, self._finish_times.get(namespace, 0.)) + 1. / weight
+        self._finish_times[namespace] = finish_time
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues.setdefault(namespace, []), (lane, finish_time, next(self._sequence), future))
+        self._update_head(namespace)
+        # admits waiting operations in order and schedules a wakeup for rate limited ones
+        self._dispatch()
+        try:
+            with metrics.WORK_QUEUE_WAITING.labels(self.name, lane.name.lower()).track_inprogress():
+                await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # the slot has already been taken for us
+                self.release(namespace)
+            raise
+
+    def release(self, namespace: str):
+        self.running -= 1
+        self.running_per_namespace[namespace] -= 1
+        if not self.running_per_namespace[namespace]:
+            del self.running_per_namespace[namespace]
+
+        if self._parked.get(namespace) == math.inf:  # a slot of the namespace is free again
+            del self._parked[namespace]
+            self._update_head(namespace)
+        self._evict(namespace)
+        self._dispatch()
+
+    def _update_head(self, namespace: str):
+        """puts the first operation of a namespace into the ready heap, unless the namespace is parked"""
+        queue = self._queues.get(namespace)
+        while queue and queue[0][3].done():  # cancelled while waiting
+            heapq.heappop(queue)
+        if not queue:
+            self._queues.pop(namespace, None)
+            self._heads.pop(namespace, None)
+            self._evict(namespace)
+            return
+
+        if namespace in self._parked:
+            return
+        lane, finish_time, sequence, _ = queue[0]
+        if self._heads.get(namespace) != sequence:  # the previous entry in _ready is skipped as outdated
+            self._heads[namespace] = sequence
+            heapq.heappush(self._ready, (lane, finish_time, sequence, namespace))
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._ready and self.running < self.concurrency:
+            _, finish_time, sequence, namespace = self._ready[0]
+            if self._heads.get(namespace) != sequence:
+                heapq.heappop(self._ready)
+                continue
+
+            future = self._queues[namespace][0][3]
+            if future.done():  # cancelled while waiting
+                heapq.heappop(self._ready)
+                self._update_head(namespace)
+                continue
+
+            wait = self._try_admit(namespace)
+            if math.inf > wait > 0 and self.rate_limiter is not None and self.rate_limiter.delay():
+                self._schedule_wakeup(wait)
+                break  # rate limit of the queue, no operation can be admitted
+
+            heapq.heappop(self._ready)
+            if wait:  # capped namespace, parked until it may run the next operation
+                del self._heads[namespace]
+                self._parked[namespace] = loop.time() + wait
+                if wait < math.inf:
+                    self._schedule_wakeup(wait)
+                continue
+
+            heapq.heappop(self._queues[namespace])
+            self._virtual_time = max(self._virtual_time, finish_time)
+            future.set_result(None)
+            self._update_head(namespace)
+
+    def _evict(self, namespace: str):
+        """drops the state of a namespace without operations, its rate limiter once it has refilled"""
+        if namespace in self._queues or namespace in self.running_per_namespace:
+            return
+
+        self._parked.pop(namespace, None)
+        self._finish_times.pop(namespace, None)
+        limiter = self._rate_limiters.get(namespace)
+        if limiter is None or namespace in self._evictions:
+            return
+
+        refill = (1. - limiter.fill_ratio) * limiter.capacity / limiter.rate
+        if refill > 0:
+            self._evictions[namespace] = asyncio.get_running_loop().call_later(refill, self._evict_limiter, namespace)
+        else:
+            del self._rate_limiters[namespace]
+
+    def _evict_limiter(self, namespace: str):
+        del self._evictions[namespace]
+        self._evict(namespace)
+
+    def _schedule_wakeup(self, wait: float):
+        loop = asyncio.get_running_loop()
+        if self._wakeup is None or self._wakeup.when() > loop.time() + wait:
+            if self._wakeup is not None:
+                self._wakeup.cancel()
+            self._wakeup = loop.call_later(wait, self._wake_up)
+
+    def _wake_up(self):
+        self._wakeup = None
+        now = asyncio.get_running_loop().time()
+        for namespace, until in list(self._parked.items()):
+            if until <= now:
+                del self._parked[namespace]
+                self._update_head(namespace)
+        self._dispatch()
+
+        # namespaces that are rate limited for longer need the next wakeup
+        until = min([until for until in self._parked.values() if until < math.inf], default=math.inf)
+        if until < math.inf:
+            self._schedule_wakeup(max(0., until - now))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, lane: Lane):
+        namespace = current_namespace.get()
+        await self.acquire(lane, namespace)
+        try:
+            yield
+        finally:
+            self.release(namespace)
+
+
+queue = WorkQueue(32, rate_limiter=ratelimit.limiter)